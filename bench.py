@@ -0,0 +1,456 @@
+'''
+Benchmarks for the compression algorithms. Run ``python bench.py`` to run
+every benchmark, or ``python bench.py NAME...`` to run only the named ones.
+'''
+
+import hashlib
+import pickle
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+from bitstring import BitArray
+
+import lib.wah as wah
+import lib.bbc as bbc
+import lib.ewah as ewah
+import lib.sharedmem as sharedmem
+
+from lib.bsi import BitSlicedIndex
+from lib.index import BitmapIndex, orders
+
+
+def timed(func, *args):
+    '''
+    Returns:
+        a tuple ``(seconds, result)`` with the time taken to call ``func``
+        with ``args`` and the value it returned.
+    '''
+
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def rand_runs(length, density, mean_run):
+    '''
+    Generate random alternating runs of clear and set bits.
+
+    Args:
+        length: the total number of bits.
+        density: the expected fraction of set bits.
+        mean_run: the expected length of a run of set bits.
+
+    Returns:
+        a list of ``(bit, length)`` tuples.
+    '''
+
+    runs = []
+    total = 0
+    bit = False
+
+    while total < length:
+        mean = mean_run if bit else mean_run * (1 - density) / density
+        run = min(length - total, 1 + int(random.expovariate(1 / mean)))
+        runs.append((bit, run))
+        total += run
+        bit = not bit
+
+    return runs
+
+
+def build(runs, bitmap):
+    '''
+    Append ``runs`` to ``bitmap`` and return it.
+    '''
+
+    for bit, length in runs:
+        bitmap.append_run(bit, length)
+
+    return bitmap
+
+
+def bench_many(counts=(2, 10, 100, 1000), length=20000, word_size=32):
+    '''
+    Compare ``union_many()``/``intersect_many()`` on N bitmaps against a
+    pairwise fold of the same operation.
+    '''
+
+    print(f'Multi-way merge of {length}-bit bitmaps')
+    print(f'{"codec":>5} {"op":>9} {"N":>5} {"many (s)":>10} '
+          f'{"pairwise (s)":>13} {"speedup":>8}')
+
+    for n in counts:
+        bitmaps = [rand_runs(length, 0.01, 20) for _ in range(n)]
+        wah_bitmaps = [build(runs, wah.Bitmap(word_size)).compressed()
+                       for runs in bitmaps]
+        bbc_bitmaps = [build(runs, bbc.Bitmap()).compressed()
+                       for runs in bitmaps]
+
+        cases = [
+            ('WAH', 'union', wah_bitmaps,
+             lambda bms: wah.union_many(bms, word_size)),
+            ('WAH', 'intersect', wah_bitmaps,
+             lambda bms: wah.intersect_many(bms, word_size)),
+            ('BBC', 'union', bbc_bitmaps, bbc.union_many),
+            ('BBC', 'intersect', bbc_bitmaps, bbc.intersect_many),
+        ]
+
+        for codec, op, compressed, func in cases:
+            many_time, expected = timed(func, compressed)
+            fold_time, result = timed(
+                reduce, lambda a, b: func([a, b]), compressed)
+            assert result == expected
+
+            print(f'{codec:>5} {op:>9} {n:>5} {many_time:>10.4f} '
+                  f'{fold_time:>13.4f} {fold_time / many_time:>7.1f}x')
+
+
+def mixed_runs(length, regions=20, offset=0):
+    '''
+    Generate runs whose density changes every ``length // regions`` bits,
+    cycling through sparse, random and dense regions starting from the
+    ``offset``-th kind.
+    '''
+
+    kinds = [(0.0005, 100), (0.5, 4), (0.05, 4), (0.99, 2000)]
+    runs = []
+
+    for i in range(regions):
+        density, mean_run = kinds[(i + offset) % len(kinds)]
+        runs += rand_runs(length // regions, density, mean_run)
+
+    return runs
+
+
+def bench_ewah(length=200000, word_size=32, pairs=5):
+    '''
+    Compare intersecting pairs of EWAH bitmaps, which skips over literal
+    blocks, against intersecting the same bitmaps with WAH.
+    '''
+
+    print(f'Intersection of {length}-bit bitmaps with mixed density')
+    print(f'{"pair":>4} {"WAH bits":>9} {"EWAH bits":>10} {"WAH (s)":>9} '
+          f'{"EWAH (s)":>9} {"speedup":>8}')
+
+    for n in range(pairs):
+        # offset the regions so that sparse regions of one bitmap line up
+        # with random regions of the other
+        runs = [mixed_runs(length, offset=offset) for offset in (0, 1)]
+        bits = [BitArray(bin=''.join(('1' if bit else '0') * run_length
+                                     for bit, run_length in r))
+                for r in runs]
+        wah_pair = [build(r, wah.Bitmap(word_size)).compressed()
+                    for r in runs]
+        ewah_pair = [ewah.compress(bs, word_size) for bs in bits]
+
+        wah_time, wah_result = timed(wah.intersect_many, wah_pair, word_size)
+        ewah_time, ewah_result = timed(ewah.intersect, *ewah_pair, word_size)
+        assert ewah.decompress(*ewah_result, word_size) == \
+            wah.decompress(*wah_result, word_size)
+
+        wah_size = sum(len(bs) for bs, _ in wah_pair)
+        ewah_size = sum(len(bs) for bs, _ in ewah_pair)
+        print(f'{n:>4} {wah_size:>9} {ewah_size:>10} {wah_time:>9.4f} '
+              f'{ewah_time:>9.4f} {wah_time / ewah_time:>7.1f}x')
+
+
+def bench_native(length=500000, repeats=3):
+    '''
+    Compare the fast path for 32 and 64-bit words against the generic WAH
+    encoder and decoder on bitmaps of each density.
+    '''
+
+    print(f'WAH on {length}-bit bitmaps')
+    print(f'{"size":>4} {"op":>10} {"data":>7} {"generic (s)":>12} '
+          f'{"native (s)":>11} {"speedup":>8}')
+
+    data = {
+        'random': rand_runs(length, 0.5, 4),
+        'sparse': rand_runs(length, 0.001, 100),
+        'mixed': mixed_runs(length),
+    }
+
+    for word_size in sorted(wah.native_typecodes):
+        for name, runs in data.items():
+            bs = BitArray(bin=''.join(('1' if bit else '0') * run_length
+                                      for bit, run_length in runs))
+
+            # the generic encoder is the streaming ``Bitmap``, since
+            # ``compress(native=False)`` is far slower than either
+            def generic_compress():
+                bitmap = wah.Bitmap(word_size)
+                bitmap.extend(bs)
+                return bitmap.compressed()
+
+            generic = min(timed(generic_compress)[0] for _ in range(repeats))
+            native, compressed = min(
+                timed(wah.compress_native, bs, word_size)
+                for _ in range(repeats))
+            assert compressed == generic_compress()
+            print(f'{word_size:>4} {"compress":>10} {name:>7} '
+                  f'{generic:>12.4f} {native:>11.4f} '
+                  f'{generic / native:>7.1f}x')
+
+            generic = min(timed(wah.decompress, *compressed, word_size,
+                                False)[0] for _ in range(repeats))
+            native = min(timed(wah.decompress_native, *compressed,
+                               word_size)[0] for _ in range(repeats))
+            print(f'{word_size:>4} {"decompress":>10} {name:>7} '
+                  f'{generic:>12.4f} {native:>11.4f} '
+                  f'{generic / native:>7.1f}x')
+
+
+def bench_reorder(row_count=100000, cardinalities=(4, 16, 200),
+                  word_size=32, queries=50):
+    '''
+    Compare the size of a bitmap index and the speed of queries on it with
+    the rows in their original order and in each sorted order.
+    '''
+
+    rows = [tuple(random.randrange(n) for n in cardinalities)
+            for _ in range(row_count)]
+    uncompressed = row_count * sum(len({row[c] for row in rows})
+                                   for c in range(len(cardinalities)))
+    conditions = [{c: random.randrange(n)
+                   for c, n in enumerate(cardinalities) if c < 2}
+                  for _ in range(queries)]
+
+    print(f'Index of {row_count} rows with column cardinalities '
+          f'{cardinalities}, {queries} queries')
+    print(f'{"order":>13} {"WAH bits":>9} {"ratio":>7} {"build (s)":>10} '
+          f'{"query (s)":>10} {"speedup":>8}')
+
+    base_time = None
+    expected = None
+
+    for order in [None] + orders:
+        build_time, index = timed(BitmapIndex.build, rows, None, order, 'WAH',
+                                  word_size)
+        query_time, results = timed(
+            lambda: [index.query(c) for c in conditions])
+
+        if order is None:
+            base_time, expected = query_time, results
+
+        assert results == expected
+        size = index.size()
+        print(f'{order or "none":>13} {size:>9} '
+              f'{uncompressed / size:>6.1f}x {build_time:>10.4f} '
+              f'{query_time:>10.4f} {base_time / query_time:>7.1f}x')
+
+
+def _digest_pickled(bs):
+    return hashlib.blake2b(bs.tobytes()).digest()
+
+
+def _digest_shared(descriptor):
+    with sharedmem.view(descriptor) as data:
+        return hashlib.blake2b(data).digest()
+
+
+def bench_shared(length=2 ** 24, bitmaps=32, rounds=4, jobs=4):
+    '''
+    Compare handing uncompressed bitmaps to worker processes by pickling
+    them against publishing them in shared memory. Each bitmap is handed
+    out ``rounds`` times, and each worker hashes the bitmap it is given, so
+    that the time is spent moving and reading bits.
+    '''
+
+    data = [BitArray(uint=random.getrandbits(length), length=length)
+            for _ in range(bitmaps)]
+
+    print(f'Hashing {bitmaps} {length}-bit bitmaps {rounds} times in '
+          f'{jobs} workers')
+    print(f'{"handoff":>8} {"bytes/task":>11} {"publish (s)":>12} '
+          f'{"tasks (s)":>10} {"speedup":>8}')
+
+    # the publisher must exist before the workers are started, so that they
+    # share its resource tracker
+    with sharedmem.Publisher() as publisher, \
+            ProcessPoolExecutor(jobs) as executor:
+        # start the workers before timing
+        list(executor.map(abs, range(jobs)))
+
+        pickled_time, expected = timed(
+            lambda: list(executor.map(_digest_pickled, data * rounds)))
+
+        publish_time, descriptors = timed(publisher.publish_many, data)
+        shared_time, result = timed(
+            lambda: list(executor.map(_digest_shared, descriptors * rounds)))
+        publisher.release(descriptors[0])
+        assert result == expected
+
+        speedup = pickled_time / (publish_time + shared_time)
+        print(f'{"pickle":>8} {len(pickle.dumps(data[0])):>11} '
+              f'{0:>12.4f} {pickled_time:>10.4f} {1:>7.1f}x')
+        print(f'{"shared":>8} {len(pickle.dumps(descriptors[0])):>11} '
+              f'{publish_time:>12.4f} {shared_time:>10.4f} {speedup:>7.1f}x')
+
+
+def bench_bsi(row_count=20000, cardinality=10 ** 5, word_size=32,
+              queries=10):
+    '''
+    Compare a bit-sliced index on a high-cardinality column against a bitmap
+    index with one bitmap per value, for range queries and sums over them.
+    '''
+
+    values = [random.randrange(cardinality) for _ in range(row_count)]
+    ranges = [sorted(random.sample(range(cardinality), 2))
+              for _ in range(queries)]
+
+    print(f'Index of {row_count} rows with {len(set(values))} distinct '
+          f'values, {queries} range queries')
+    print(f'{"index":>6} {"bitmaps":>8} {"WAH bits":>9} {"build (s)":>10} '
+          f'{"query (s)":>10} {"sum (s)":>8}')
+
+    build_time, bsi = timed(BitSlicedIndex.build, values, 'WAH', word_size)
+    query_time, results = timed(
+        lambda: [bsi.between(low, high) for low, high in ranges])
+    sum_time, sums = timed(lambda: [bsi.sum(r) for r in results])
+
+    print(f'{"sliced":>6} {len(bsi.slices) + 1:>8} {bsi.size():>9} '
+          f'{build_time:>10.4f} {query_time:>10.4f} {sum_time:>8.4f}')
+
+    build_time, index = timed(BitmapIndex.build, [(v,) for v in values],
+                              None, None, 'WAH', word_size)
+    bitmaps = index.bitmaps[0]
+
+    def query(low, high):
+        return wah.union_many([bitmaps[v] for v in bitmaps
+                               if low <= v <= high], word_size)
+
+    def total(low, high):
+        return sum(v * wah.count(*bitmaps[v], word_size) for v in bitmaps
+                   if low <= v <= high)
+
+    query_time, expected = timed(
+        lambda: [query(low, high) for low, high in ranges])
+    sum_time, expected_sums = timed(
+        lambda: [total(low, high) for low, high in ranges])
+    assert [bsi.rows(r) for r in results] == \
+        [bsi.rows(r) for r in expected] and sums == expected_sums
+
+    print(f'{"value":>6} {len(bitmaps):>8} {index.size():>9} '
+          f'{build_time:>10.4f} {query_time:>10.4f} {sum_time:>8.4f}')
+
+
+def bench_batch(total_bytes=128 * 1024, sizes=(1024, 8 * 1024, 64 * 1024),
+                word_size=32):
+    '''
+    Compare compressing and decompressing many small bitmaps one call at a
+    time against the batch APIs, and against the batch APIs on one bitmap of
+    the same total size.
+    '''
+
+    print(f'{total_bytes // 1024} KiB of bitmaps of each size')
+    print(f'{"codec":>5} {"op":>10} {"KiB":>4} {"count":>6} '
+          f'{"per call (s)":>13} {"batch (s)":>10} {"one bitmap (s)":>15}')
+
+    for size in sizes:
+        count = total_bytes // size
+        bitmaps = []
+
+        for _ in range(count):
+            runs = mixed_runs(size * 8, regions=4, offset=random.randrange(4))
+            bitmaps.append(BitArray(bin=''.join(
+                ('1' if bit else '0') * run_length
+                for bit, run_length in runs)))
+
+        whole = BitArray().join(bitmaps)
+
+        def report(codec, op, per_call, batch, one):
+            print(f'{codec:>5} {op:>10} {size // 1024:>4} {count:>6} '
+                  f'{per_call:>13.4f} {batch:>10.4f} {one:>15.4f}')
+
+        per_call, results = timed(
+            lambda: [wah.compress(bs, word_size) for bs in bitmaps])
+        batch, packed = timed(wah.compress_many, bitmaps, word_size)
+        one, _ = timed(wah.compress_many, [whole], word_size)
+        assert [(packed[0][start:end], final_length)
+                for start, end, final_length in zip(packed[1], packed[1][1:],
+                                                    packed[2])] == results
+        report('WAH', 'compress', per_call, batch, one)
+
+        per_call, _ = timed(lambda: [wah.decompress(*compressed, word_size)
+                                     for compressed in results])
+        batch, _ = timed(wah.decompress_many, *packed, word_size)
+        one, _ = timed(wah.decompress_many,
+                       *wah.compress_many([whole], word_size), word_size)
+        report('WAH', 'decompress', per_call, batch, one)
+
+        per_call, results = timed(lambda: [bbc.compress(bs)
+                                           for bs in bitmaps])
+        batch, packed = timed(bbc.compress_many, bitmaps)
+        one, _ = timed(bbc.compress_many, [whole])
+        assert [packed[0][start:end] for start, end
+                in zip(packed[1], packed[1][1:])] == results
+        report('BBC', 'compress', per_call, batch, one)
+
+        per_call, _ = timed(lambda: [bbc.decompress(compressed)
+                                     for compressed in results])
+        batch, _ = timed(bbc.decompress_many, *packed)
+        one, _ = timed(bbc.decompress_many, *bbc.compress_many([whole]))
+        report('BBC', 'decompress', per_call, batch, one)
+
+
+def bench_startup(runs=15, size=64 * 1024):
+    '''
+    Measure the cold-start time of ``compress.py`` on a small input, which is
+    dominated by importing modules, against starting Python alone.
+    '''
+
+    data = BitArray(bin=''.join(('1' if bit else '0') * run_length
+                                for bit, run_length in
+                                mixed_runs(size * 8))).bytes
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'compress.py')
+
+    print(f'Median of {runs} runs on a {size // 1024} KiB input')
+    print(f'{"command":>40} {"time (ms)":>10}')
+
+    with tempfile.TemporaryFile() as f:
+        f.write(data)
+
+        for args in (['-c', 'pass'], [script, '--help'],
+                     [script, '--wah'], [script, '--wah', '--word-size', '32'],
+                     [script, '--bbc']):
+            times = []
+
+            for _ in range(runs):
+                f.seek(0)
+                start = time.perf_counter()
+                subprocess.run([sys.executable] + args, stdin=f,
+                               stdout=subprocess.DEVNULL, check=True)
+                times.append(time.perf_counter() - start)
+
+            name = ' '.join(['python'] + [os.path.basename(arg)
+                                          for arg in args])
+            print(f'{name:>40} {statistics.median(times) * 1000:>10.1f}')
+
+
+benchmarks = {
+    'many': bench_many,
+    'ewah': bench_ewah,
+    'native': bench_native,
+    'reorder': bench_reorder,
+    'shared': bench_shared,
+    'bsi': bench_bsi,
+    'batch': bench_batch,
+    'startup': bench_startup,
+}
+
+
+if __name__ == '__main__':
+    random.seed(0)
+
+    for name in sys.argv[1:] or benchmarks:
+        benchmarks[name]()
+        print()
@@ -1,17 +1,34 @@
 '''
 Command-line interface for compression algorithms. Run
 ``python main.py --help`` for program usage.
+
+With no input paths, standard input is compressed to standard output. Given
+input paths or a manifest, the files are compressed (or decompressed) in a
+pool of worker processes, and the outputs are written in the format of
+``lib.fileformat``. With ``--cache-dir``, compressed outputs are cached on
+disk by the contents of their input, so unchanged inputs are not compressed
+again. With ``--check``, compressed files are checked for corruption without
+being decompressed.
+
+The codecs are those of ``lib.core``, which only use the standard library.
+Modules that are only needed by some options, such as ``multiprocessing``
+for batches and ``lib.validate`` (which loads ``bitstring``) for checks, are
+imported when the option is used, to keep start-up fast.
 '''
 
 import logging
 import os
 import sys
+import time
 
 from argparse import ArgumentParser
-from bitstring import BitArray
 
-import lib.wah as wah
-import lib.bbc as bbc
+import lib.core as core
+import lib.fileformat as fileformat
+
+
+suffixes = {'WAH': '.wah', 'BBC': '.bbc'}
+default_cache_size = 1024  # MiB
 
 
 def _process_args():
@@ -28,7 +45,9 @@ def _process_args():
                         help='The word size for compression, if applicable '
                         '(default: 8)')
 
-    algos = parser.add_mutually_exclusive_group(required=True)
+    algos = parser.add_mutually_exclusive_group()
+    batch = parser.add_argument_group(title='batch mode')
+    cache = parser.add_argument_group(title='caching')
     logs = parser.add_argument_group(title='debugging')
 
     algos.add_argument('--wah', dest='algorithm', action='store_const',
@@ -37,13 +56,275 @@ def _process_args():
                        const='BBC', help='Byte-aligned bitmap code '
                        'compression')
 
+    batch.add_argument('paths', nargs='*', metavar='PATH',
+                       help='Files to process instead of standard input')
+    batch.add_argument('--manifest', type=str, dest='manifest',
+                       help='File listing the paths to process, one per line')
+    batch.add_argument('--decompress', action='store_true',
+                       help='Decompress the files instead of compressing them')
+    batch.add_argument('--check', action='store_true',
+                       help='Check the structure of compressed files without '
+                       'decompressing them')
+    batch.add_argument('--output-dir', type=str, dest='output_dir',
+                       help='Directory for output files (default: next to '
+                       'each input)')
+    batch.add_argument('--jobs', type=int, dest='jobs', default=None,
+                       help='Number of worker processes (default: one per '
+                       'core)')
+
+    cache.add_argument('--cache-dir', type=str, dest='cache_dir',
+                       help='Directory to cache compressed outputs in, keyed '
+                       'by the input and options')
+    cache.add_argument('--cache-size', type=int, dest='cache_size',
+                       default=default_cache_size,
+                       help='Size in MiB that the cache is trimmed to after '
+                       f'each run (default: {default_cache_size})')
+
     logs.add_argument('--log-level', type=str, dest='log_level',
                       default='WARNING', help='Log level (default: WARNING; '
                       'see logging.setLevel())')
     logs.add_argument('--log-file', type=str, dest='log_file',
                       help='Output logs to the given file instead of stdout')
 
-    return parser.parse_args()
+    args = parser.parse_args()
+
+    if args.manifest is not None:
+        with open(args.manifest) as manifest:
+            args.paths += [line.strip() for line in manifest if line.strip()]
+
+    if args.algorithm is None and not (args.decompress or args.check):
+        parser.error('one of the arguments --wah --bbc is required')
+    elif args.decompress and not args.paths:
+        parser.error('--decompress requires input paths or a manifest')
+    elif args.check and not args.paths:
+        parser.error('--check requires input paths or a manifest')
+
+    return args
+
+
+def encode(data: bytes, algorithm: str, word_size: int) -> bytes:
+    '''
+    Compress bytes and serialize the result with ``lib.fileformat``.
+    '''
+
+    if algorithm == 'WAH':
+        compressed, length, final_length = core.wah_compress(
+            data, len(data) * 8, word_size)
+        return fileformat.dumps(compressed, algorithm, word_size, final_length,
+                                length)
+    elif algorithm == 'BBC':
+        return fileformat.dumps(core.bbc_compress(data), algorithm)
+    else:
+        raise NotImplementedError(f'Unrecognized algorithm: {algorithm}')
+
+
+def encode_cached(data: bytes, algorithm: str, word_size: int,
+                  cache=None) -> bytes:
+    '''
+    Returns:
+        the result of ``encode()``, looked up in ``cache`` (a ``DiskCache``)
+        if one is given and stored there on a miss.
+    '''
+
+    if cache is None:
+        return encode(data, algorithm, word_size)
+
+    from lib.diskcache import make_key
+
+    word_size = word_size if algorithm == 'WAH' else 0
+    key = make_key(data, algorithm, word_size, fileformat.version)
+    result = cache.get(key)
+
+    if result is None:
+        result = encode(data, algorithm, word_size)
+        cache.put(key, result)
+    else:
+        logging.debug('Cache hit for key %s', key)
+
+    return result
+
+
+def decode(data: bytes) -> bytes:
+    '''
+    Decompress bytes serialized by ``encode()``.
+    '''
+
+    algorithm, compressed, length, word_size, final_length = \
+        fileformat.parse(data)
+
+    if algorithm == 'WAH':
+        bits, length = core.wah_decompress(compressed, length, final_length,
+                                           word_size)
+    else:
+        bits = core.bbc_decompress(compressed)
+        length = len(bits) * 8
+
+    if length % 8 != 0:
+        raise ValueError('Decompressed data is not a whole number of bytes')
+
+    return bits
+
+
+def output_path(path: str, output_dir, algorithm, decompress: bool) -> str:
+    '''
+    Returns:
+        the path to write the result of processing ``path`` to. Compressed
+        files get the algorithm's suffix; decompressed files have it removed
+        or, failing that, get the suffix ``.out``.
+    '''
+
+    if decompress:
+        root, ext = os.path.splitext(path)
+        out = root if ext in suffixes.values() else path + '.out'
+    else:
+        out = path + suffixes[algorithm]
+
+    if output_dir is not None:
+        out = os.path.join(output_dir, os.path.basename(out))
+
+    return out
+
+
+def process_file(task):
+    '''
+    Compress or decompress a single file. This is the unit of work handed to
+    each worker process.
+
+    Args:
+        task: a tuple ``(path, out_path, algorithm, word_size, decompress,
+              cache_dir)``, where ``cache_dir`` may be ``None``.
+
+    Returns:
+        a tuple ``(path, in_bytes, out_bytes, error)``, where ``error`` is
+        ``None`` if the file was processed successfully.
+    '''
+
+    path, out_path, algorithm, word_size, decompress, cache_dir = task
+
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        if decompress:
+            result = decode(data)
+        elif cache_dir is None:
+            result = encode(data, algorithm, word_size)
+        else:
+            from lib.diskcache import DiskCache
+
+            # the size limit only matters when evicting, which the parent
+            # process does once the batch is done
+            cache = DiskCache(cache_dir, 0)
+            result = encode_cached(data, algorithm, word_size, cache)
+
+        with open(out_path, 'wb') as f:
+            f.write(result)
+    except (OSError, ValueError) as e:
+        return path, 0, 0, str(e)
+
+    return path, len(data), len(result), None
+
+
+def run_batch(paths, algorithm, word_size, decompress=False,
+              output_dir=None, jobs=None, cache_dir=None,
+              cache_bytes=default_cache_size * 2**20):
+    '''
+    Process many files in a pool of worker processes, each of which handles
+    many files so that start-up costs are paid once per worker. If
+    ``cache_dir`` is given, compressed outputs are cached there and the
+    cache is trimmed to ``cache_bytes`` afterwards.
+
+    Returns:
+        a tuple ``(in_bytes, out_bytes, seconds, errors)``, where ``errors``
+        is a list of tuples ``(path, message)``.
+    '''
+
+    import multiprocessing as mp
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    tasks = [(path, output_path(path, output_dir, algorithm, decompress),
+              algorithm, word_size, decompress, cache_dir) for path in paths]
+    chunksize = max(1, len(tasks) // (4 * (jobs or os.cpu_count() or 1)))
+    in_bytes, out_bytes, errors = 0, 0, []
+    start = time.perf_counter()
+
+    with mp.Pool(jobs) as pool:
+        for path, size_in, size_out, error in \
+                pool.imap_unordered(process_file, tasks, chunksize):
+            if error is not None:
+                logging.error('Failed to process %s: %s', path, error)
+                errors.append((path, error))
+
+            in_bytes += size_in
+            out_bytes += size_out
+
+    if cache_dir is not None:
+        from lib.diskcache import DiskCache
+
+        removed = DiskCache(cache_dir, cache_bytes).evict()
+        logging.info('Evicted %d values from the cache', removed)
+
+    return in_bytes, out_bytes, time.perf_counter() - start, errors
+
+
+def check_path(path: str):
+    '''
+    Check the structure of a compressed file. This is the unit of work
+    handed to each worker process by ``run_check()``.
+
+    Returns:
+        a tuple ``(path, in_bytes, report, error)``, where ``report`` is the
+        ``validate.Report`` and ``error`` is ``None`` if the file could be
+        read and has a valid header.
+    '''
+
+    from lib.validate import check_file
+
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        report = check_file(data)
+    except (OSError, ValueError) as e:
+        return path, 0, None, str(e)
+
+    return path, len(data), report, None
+
+
+def run_check(paths, jobs=None):
+    '''
+    Check the structure of many compressed files in a pool of worker
+    processes.
+
+    Returns:
+        a tuple ``(in_bytes, seconds, errors)``, where ``errors`` is a list
+        of tuples ``(path, message)`` for the files that are not valid.
+    '''
+
+    import multiprocessing as mp
+
+    chunksize = max(1, len(paths) // (4 * (jobs or os.cpu_count() or 1)))
+    in_bytes, errors = 0, []
+    start = time.perf_counter()
+
+    with mp.Pool(jobs) as pool:
+        for path, size, report, error in \
+                pool.imap_unordered(check_path, paths, chunksize):
+            in_bytes += size
+
+            if error is None and not report.valid:
+                error = f'{report.error} at offset {report.offset}'
+
+            if error is not None:
+                logging.error('Invalid file %s: %s', path, error)
+                errors.append((path, error))
+            else:
+                logging.info('%s: %d bits in %d fills and %d literals', path,
+                             report.length, report.fills, report.literals)
+
+    return in_bytes, time.perf_counter() - start, errors
 
 
 def main():
@@ -57,17 +338,56 @@ def main():
                         filename=args.log_file,
                         filemode='w')
 
-    data = BitArray(bytes=sys.stdin.buffer.read().strip())
+    if args.check:
+        in_bytes, seconds, errors = run_check(args.paths, args.jobs)
+        throughput = in_bytes / seconds / 2**20 if seconds else 0
+
+        print(f'{len(args.paths)} files, {len(errors)} invalid, {in_bytes} '
+              f'bytes checked, {seconds:.2f}s ({throughput:.2f} MiB/s)',
+              file=sys.stderr)
+
+        if errors:
+            sys.exit(1)
+
+        return
+
+    if args.paths:
+        in_bytes, out_bytes, seconds, errors = run_batch(
+            args.paths, args.algorithm, args.word_size, args.decompress,
+            args.output_dir, args.jobs, args.cache_dir,
+            args.cache_size * 2**20)
+
+        ratio = out_bytes / in_bytes if in_bytes else 0
+        throughput = in_bytes / seconds / 2**20 if seconds else 0
+
+        print(f'{len(args.paths) - len(errors)} files, {in_bytes} bytes in, '
+              f'{out_bytes} bytes out (ratio {ratio:.3f}), {seconds:.2f}s '
+              f'({throughput:.2f} MiB/s)', file=sys.stderr)
+
+        if errors:
+            sys.exit(1)
+
+        return
+
+    cache = None
+
+    if args.cache_dir is not None:
+        from lib.diskcache import DiskCache
+
+        cache = DiskCache(args.cache_dir, args.cache_size * 2**20)
+
+    result = encode_cached(sys.stdin.buffer.read().strip(), args.algorithm,
+                           args.word_size, cache)
+
+    if cache is not None:
+        cache.evict()
+
+    _, compressed, _, _, final_length = fileformat.parse(result)
 
     if args.algorithm == 'WAH':
-        compressed, final_length = wah.compress(data, args.word_size)
         logging.info('Bits used in final word: %d', final_length)
-    elif args.algorithm == 'BBC':
-        compressed = bbc.compress(data)
-    else:
-        raise NotImplementedError(f'Unrecognized algorithm: {args.algorithm}')
 
-    sys.stdout.buffer.write(compressed.bytes)
+    sys.stdout.buffer.write(compressed)
 
 
 if __name__ == '__main__':
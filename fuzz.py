@@ -1,49 +1,464 @@
+'''
+Differential fuzzer for the compression algorithms. Random bitmaps are
+round-tripped through each codec for every word size, and every
+alternate engine (``Bitmap``, ``slice()``, ``concat()``, ...) is checked
+against the reference ``compress()``. Cases are spread over all cores, and
+failing inputs are minimized before being reported. Run
+``python fuzz.py --help`` for program usage.
+'''
+
+import multiprocessing as mp
 import random
+import time
 
+from argparse import ArgumentParser
 from bitstring import BitArray
 
+import lib.core as core
 import lib.wah as wah
 import lib.bbc as bbc
+import lib.plwah as plwah
+import lib.ewah as ewah
+import lib.validate as validate
+
+
+bits_per_byte = 8
+word_sizes = range(2, 65)
+
 
+##############
+# generators #
+##############
 
-def rand_char():
-    return random.choice([chr(n) for n in range(128)])
+def rand_char(rng):
+    return rng.choice([chr(n) for n in range(128)])
 
 
-def rand_ascii(length):
-    s = ''.join(rand_char() for _ in range(length))
+def rand_ascii(rng, length):
+    s = ''.join(rand_char(rng) for _ in range(length))
     return s.encode(encoding='ASCII')
 
 
-def fuzz_compressor(ntimes, compress, decompress, str_len):
-    for _ in range(ntimes):
-        bs = BitArray(bytes=rand_ascii(str_len))
-        print(f'Testing {bs.bin}')
-        assert decompress(compress(bs)) == bs
+def gen_ascii(rng, size, word_size):
+    '''
+    Random 7-bit ASCII text, as generated by the original fuzzer.
+    '''
 
+    return BitArray(bytes=rand_ascii(rng, size))
 
-def fuzz_wah(ntimes, str_len):
-    for word_size in range(2, 65):
-        print(f'Fuzzing WAH {word_size}')
-        fuzz_compressor(ntimes, \
-                        lambda bs: wah.compress(bs, word_size), \
-                        lambda res: wah.decompress(*res, word_size), \
-                        str_len)
 
+def gen_runs(rng, size, word_size):
+    '''
+    Long runs of both bits, split by the occasional random byte.
+    '''
 
-def fuzz_bbc(ntimes, str_len):
-    fuzz_compressor(ntimes, bbc.compress, bbc.decompress, str_len)
+    bs = BitArray()
 
+    while len(bs) < size * bits_per_byte:
+        if rng.random() < 0.2:
+            bs += BitArray(uint=rng.getrandbits(bits_per_byte),
+                           length=bits_per_byte)
+        else:
+            length = rng.randint(1, 4 * word_size * bits_per_byte)
+            bs += BitArray(length) if rng.random() < 0.5 else ~BitArray(length)
+
+    return bs[:size * bits_per_byte]
+
+
+def gen_sparse(rng, size, word_size):
+    '''
+    Mostly clear bits with a few set bits at random positions.
+    '''
+
+    length = size * bits_per_byte
+    bs = BitArray(length)
+
+    for _ in range(rng.randint(0, max(1, length // 200))):
+        bs.set(True, rng.randrange(length))
+
+    return bs
+
+
+def gen_offsets(rng, size, word_size):
+    '''
+    Bytes that are either clear or have a single set bit, which exercises
+    BBC offset bytes and literal groups.
+    '''
+
+    data = bytes(0 if rng.random() < 0.5 else 1 << rng.randrange(8)
+                 for _ in range(size))
+    return BitArray(bytes=data)
+
+
+def gen_caps(rng, size, word_size):
+    '''
+    Runs whose lengths sit on the limits of the encodings: WAH runs of one
+    section below, at or above the longest run a word can hold, and BBC
+    gaps around the lengths where the gap count moves to extra bytes.
+    '''
+
+    section_size = word_size - 1
+    max_run_bits = section_size * (2**(word_size - 2) - 1)
+    gap_lengths = [6, 7, 8, 127, 128, 129, 2**15 - 1, 2**15]
+
+    if max_run_bits <= 2**18:
+        run_lengths = [max_run_bits + d * section_size for d in (-1, 0, 1)]
+    else:
+        run_lengths = [section_size * k for k in (1, 2, 3)]
+
+    bs = BitArray()
+
+    for _ in range(rng.randint(1, 3)):
+        if rng.random() < 0.5:
+            length = max(1, rng.choice(run_lengths) + rng.choice([-1, 0, 1]))
+        else:
+            length = rng.choice(gap_lengths) * bits_per_byte
+
+        bs += BitArray(length) if rng.random() < 0.7 else ~BitArray(length)
+        bs += BitArray(uint=rng.getrandbits(bits_per_byte),
+                       length=bits_per_byte)
+
+    # keep the result a whole number of bytes so that BBC can use it
+    return bs[:len(bs) - len(bs) % bits_per_byte]
+
+
+generators = [gen_ascii, gen_runs, gen_sparse, gen_offsets, gen_caps]
+
+
+##########
+# checks #
+##########
+
+def _thirds(bs, unit):
+    '''
+    Split ``bs`` into three non-empty parts at multiples of ``unit`` bits,
+    or return ``None`` if it is too short.
+    '''
+
+    units = len(bs) // unit
+
+    if units < 3:
+        return None
+
+    a, b = units // 3 * unit, 2 * units // 3 * unit
+    return [bs[:a], bs[a:b], bs[b:]]
+
+
+def wah_roundtrip(bs, word_size):
+    return wah.decompress(*wah.compress(bs, word_size), word_size) == bs
+
+
+def wah_bitmap(bs, word_size):
+    bitmap = wah.Bitmap(word_size)
+    bitmap.extend(bs)
+    return bitmap.compressed() == wah.compress(bs, word_size)
+
+
+def wah_slice(bs, word_size):
+    start, stop = len(bs) // 3, max(len(bs) // 3 + 1, 2 * len(bs) // 3)
+    compressed, final_length = wah.compress(bs, word_size)
+    result = wah.slice(compressed, final_length, word_size, start, stop)
+    return result == wah.compress(bs[start:stop], word_size)
+
+
+def wah_concat(bs, word_size):
+    parts = _thirds(bs, 1)
+
+    if parts is None:
+        return True
+
+    compressed = [wah.compress(part, word_size) for part in parts]
+    return wah.concat(compressed, word_size) == wah.compress(bs, word_size)
+
+
+def wah_merge(bs, word_size):
+    compressed = wah.compress(bs, word_size)
+    ones = wah.compress(~BitArray(len(bs)), word_size)
+
+    return wah.union_many([compressed, compressed], word_size) == compressed \
+        and wah.intersect_many([compressed, ones], word_size) == compressed
+
+
+def wah_native(bs, word_size):
+    # the fast path only handles these word sizes
+    word_size = 32 if word_size <= 32 else 64
+    bitmap = wah.Bitmap(word_size)
+    bitmap.extend(bs)
+    compressed, final_length = wah.compress_native(bs, word_size)
+
+    return (compressed, final_length) == bitmap.compressed() \
+        and wah.decompress_native(compressed, final_length, word_size) == bs
+
+
+def wah_core(bs, word_size):
+    compressed, length, final_length = core.wah_compress(bs.tobytes(),
+                                                         len(bs), word_size)
+    bits, bit_length = core.wah_decompress(compressed, length, final_length,
+                                           word_size)
+
+    return (BitArray(bytes=compressed, length=length), final_length) == \
+        wah.compress(bs, word_size, native=False) \
+        and BitArray(bytes=bits, length=bit_length) == bs
+
+
+def wah_valid(bs, word_size):
+    report = validate.check_wah(*wah.compress(bs, word_size), word_size)
+    return report.valid and report.length == len(bs)
+
+
+def bbc_roundtrip(bs, word_size):
+    return bbc.decompress(bbc.compress(bs)) == bs
+
+
+def bbc_bitmap(bs, word_size):
+    bitmap = bbc.Bitmap()
+    bitmap.extend(bs)
+    return bitmap.compressed() == bbc.compress(bs)
+
+
+def bbc_slice(bs, word_size):
+    byte_count = len(bs) // bits_per_byte
+    start = byte_count // 3 * bits_per_byte
+    stop = max(start + bits_per_byte, 2 * byte_count // 3 * bits_per_byte)
+    result = bbc.slice(bbc.compress(bs), start, stop)
+    return result == bbc.compress(bs[start:stop])
+
+
+def bbc_concat(bs, word_size):
+    parts = _thirds(bs, bits_per_byte)
+
+    if parts is None:
+        return True
+
+    compressed = [bbc.compress(part) for part in parts]
+    return bbc.concat(compressed) == bbc.compress(bs)
 
-if __name__ == '__main__':
-    print('Fuzzing WAH with small inputs...')
-    fuzz_wah(1000, 64)
 
-    print('Fuzzing BBC with small inputs...')
-    fuzz_bbc(1000, 64)
+def bbc_merge(bs, word_size):
+    compressed = bbc.compress(bs)
+    ones = bbc.compress(~BitArray(len(bs)))
+
+    return bbc.union_many([compressed, compressed]) == compressed \
+        and bbc.intersect_many([compressed, ones]) == compressed
+
+
+def bbc_core(bs, word_size):
+    compressed = core.bbc_compress(bs.bytes)
+
+    return compressed == bbc.compress(bs, native=False).bytes \
+        and core.bbc_decompress(compressed) == bs.bytes
+
+
+def bbc_valid(bs, word_size):
+    report = validate.check_bbc(bbc.compress(bs))
+    return report.valid and report.length == len(bs)
+
+
+def plwah_roundtrip(bs, word_size):
+    # PLWAH needs room for a position in its fill words
+    word_size = max(6, word_size)
+    compressed, final_length = plwah.compress(bs, word_size)
+
+    return plwah.decompress(compressed, final_length, word_size) == bs \
+        and plwah.count(compressed, final_length, word_size) == bs.count(1)
+
+
+def ewah_roundtrip(bs, word_size):
+    word_size = max(3, word_size)
+    compressed, final_length = ewah.compress(bs, word_size)
+
+    return ewah.decompress(compressed, final_length, word_size) == bs \
+        and ewah.count(compressed, final_length, word_size) == bs.count(1)
+
+
+def ewah_intersect(bs, word_size):
+    word_size = max(3, word_size)
+    other = bs[len(bs) // 2:] + bs[:len(bs) // 2]
+    result = ewah.intersect(ewah.compress(bs, word_size),
+                            ewah.compress(other, word_size), word_size)
+
+    return result == ewah.compress(bs & other, word_size)
+
+
+# checks for each codec; each returns ``True`` if the engine agrees with the
+# reference implementation on the given bits
+checks = {
+    'WAH': [wah_roundtrip, wah_bitmap, wah_slice, wah_concat, wah_merge,
+            wah_native, wah_core, wah_valid],
+    'BBC': [bbc_roundtrip, bbc_bitmap, bbc_slice, bbc_concat, bbc_merge,
+            bbc_core, bbc_valid],
+    'PLWAH': [plwah_roundtrip],
+    'EWAH': [ewah_roundtrip, ewah_intersect],
+}
+
+
+##########
+# runner #
+##########
+
+def fails(check, bs, word_size):
+    '''
+    Returns:
+        ``True`` if ``check`` rejects or raises an exception on ``bs``.
+    '''
+
+    try:
+        return not check(bs, word_size)
+    except Exception:
+        return True
+
+
+def minimize(check, bs, word_size, unit):
+    '''
+    Shrink a failing input by repeatedly removing chunks of it, halving the
+    chunk size whenever no chunk can be removed.
+
+    Args:
+        check: the check that fails on ``bs``.
+        bs: the failing input.
+        word_size: the word size the check failed with.
+        unit: the granularity, in bits, of the chunks to remove.
+
+    Returns:
+        the smallest failing input found.
+    '''
+
+    chunk = max(unit, len(bs) // 2 // unit * unit)
+
+    while chunk >= unit:
+        i = 0
+
+        while i < len(bs):
+            candidate = bs[:i] + bs[i + chunk:]
+
+            if len(candidate) > 0 and fails(check, candidate, word_size):
+                bs = candidate
+            else:
+                i += chunk
+
+        chunk //= 2
+        chunk -= chunk % unit
+
+    return bs
+
+
+def run_batch(job):
+    '''
+    Run a batch of fuzz cases. This is the unit of work handed to each
+    worker process.
+
+    Args:
+        job: a tuple ``(seed, codec, count, size)``, where ``count`` is the
+             number of cases to run and ``size`` is the maximum input size
+             in bytes.
+
+    Returns:
+        a tuple ``(count, failures)``, where ``failures`` is a list of
+        tuples ``(check name, word size, minimized input as a string)``.
+    '''
+
+    seed, codec, count, size = job
+    rng = random.Random(seed)
+    failures = []
+
+    for i in range(count):
+        word_size = word_sizes[(seed + i) % len(word_sizes)]
+        generator = rng.choice(generators)
+        bs = generator(rng, rng.randint(1, size), word_size)
+
+        if codec != 'BBC' and len(bs) > 1:
+            bs = bs[:rng.randint(1, len(bs))]
+
+        if len(bs) == 0:
+            bs = BitArray(bits_per_byte)
+
+        unit = bits_per_byte if codec == 'BBC' else 1
+
+        for check in checks[codec]:
+            if fails(check, bs, word_size):
+                small = minimize(check, bs, word_size, unit)
+                failures.append((check.__name__, word_size, small.bin))
+
+    return count, failures
+
+
+def fuzz(codec, cases, size, jobs=None, batch=50, seed=None):
+    '''
+    Fuzz a codec over a pool of worker processes, printing throughput and
+    any failures found.
+
+    Args:
+        codec: a key of ``checks``, such as ``'WAH'``.
+        cases: the total number of cases to run.
+        size: the maximum input size in bytes.
+        jobs: the number of worker processes (default: one per core).
+        batch: the number of cases per unit of work.
+        seed: the seed for the first batch (default: random).
+
+    Returns:
+        the list of failures found.
+    '''
+
+    seed = random.randrange(2**32) if seed is None else seed
+    batches = [(seed + n, codec, min(batch, cases - n), size)
+               for n in range(0, cases, batch)]
+    failures = []
+    done = 0
+    start = time.perf_counter()
+
+    with mp.Pool(jobs) as pool:
+        for count, found in pool.imap_unordered(run_batch, batches):
+            done += count
+            failures += found
+
+            for name, word_size, bits in found:
+                print(f'FAIL {name} (word size {word_size}): {bits}')
+
+    elapsed = time.perf_counter() - start
+    print(f'{codec}: {done} cases in {elapsed:.1f}s '
+          f'({done / elapsed:.0f} cases/s, seed {seed}), '
+          f'{len(failures)} failures')
+
+    return failures
+
+
+def _process_args():
+    '''
+    Process the command line arguments using the ``argparse`` library.
+
+    Returns:
+        The environment given by ``ArgumentParser.parse_args()``.
+    '''
+
+    parser = ArgumentParser(description='Fuzz the compression algorithms.')
+
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Number of worker processes (default: one per '
+                        'core)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for the random inputs (default: random)')
+    parser.add_argument('--small-cases', type=int, default=6300,
+                        dest='small_cases',
+                        help='Number of small inputs per codec '
+                        '(default: 6300)')
+    parser.add_argument('--large-cases', type=int, default=63,
+                        dest='large_cases',
+                        help='Number of large inputs per codec '
+                        '(default: 63)')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _process_args()
+    phases = [('small', args.small_cases, 64, 50),
+              ('large', args.large_cases, 10000, 1)]
+    failures = []
 
-    print('Fuzzing WAH with large inputs...')
-    fuzz_wah(5, 10000)
+    for phase, cases, size, batch in phases:
+        for codec in checks:
+            print(f'Fuzzing {codec} with {phase} inputs...')
+            failures += fuzz(codec, cases, size, args.jobs, batch, args.seed)
 
-    print('Fuzzing BBC with large inputs...')
-    fuzz_bbc(5, 10000)
+    if failures:
+        raise SystemExit(1)
@@ -20,17 +20,17 @@ description:
 
 import logging
 
-from bitstring import BitArray
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import heappop, heappush
 
-from lib.util import all_bits
+from bitstring import BitArray, Bits
 
+import lib.core as core
 
-# BBC compression constants
-bits_per_byte = 8
-
-header_gap_bits = 3  # number of bits in header gap size
-header_gap_max = all_bits(header_gap_bits)  # max gap size in header
-max_gap_bits = 2 * bits_per_byte - 1        # max bits used for gap size
+from lib.core import bits_per_byte, encode_atoms, header_gap_bits, \
+    header_gap_max, iter_atoms, max_gap_bits, read_atom
+from lib.util import all_bits, to_bytes
 
 
 def get_gaps(bs: BitArray):
@@ -174,12 +174,15 @@ def create_atom(gaps: int,
     return result
 
 
-def compress(bs):
+def compress(bs, native=True):
     '''
     Compress the given bits using the BBC algorithm.
 
     Args:
-        bs: the bits to compress.
+        bs: the bits to compress, a multiple of 8 in length.
+        native: whether to use the byte-level encoder of ``lib.core``, which
+                gives the same result much faster. Otherwise, the bits are
+                encoded an atom at a time with ``create_atom()``.
 
     Returns:
         the compressed ``bs``.
@@ -187,6 +190,10 @@ def compress(bs):
 
     if len(bs) == 0:
         raise ValueError('bs must have a length greater than 0')
+    elif len(bs) % bits_per_byte != 0:
+        raise ValueError('bs must have a length that is a multiple of 8')
+    elif native:
+        return BitArray(bytes=core.bbc_compress(bs.tobytes()))
 
     logging.info('Compressing %d bits with BBC', len(bs))
     logging.debug('Bits: %s', bs.bin)
@@ -245,43 +252,762 @@ def decompress(bs):
 
     if len(bs) == 0:
         raise ValueError('bs must have a length greater than 0')
+    elif len(bs) % bits_per_byte != 0:
+        raise ValueError('Invalid data format')
 
     logging.info('Decompressing %d bits with BBC', len(bs))
-    logging.debug('Bits: %s', bs.bin)
+    return BitArray(bytes=core.bbc_decompress(bs.bytes))
 
-    result = BitArray()
 
-    while len(bs) > 0:
-        if len(bs) < bits_per_byte:
-            raise ValueError('Invalid data format')
+def count(bs) -> int:
+    '''
+    Count the set bits in BBC-compressed data without decompressing it.
+
+    Args:
+        bs: the compressed bits, as a ``BitArray`` or a bytes-like object
+            such as a ``memoryview``.
+
+    Returns:
+        the number of set bits.
+    '''
+
+    data = bs.bytes if isinstance(bs, Bits) else bs
+
+    return sum(bin(int.from_bytes(body, 'big')).count('1')
+               for _, body in iter_atoms(data))
+
+
+def slice(bs, start, stop):
+    '''
+    Extract the bits in the range ``[start, stop)`` from BBC-compressed data
+    without decompressing it. Atoms before ``start`` are skipped and gaps
+    overlapping the range are cut without being expanded.
+
+    Args:
+        bs: the compressed bits.
+        start: the index of the first bit to extract.
+        stop: the index after the last bit to extract.
+
+    Returns:
+        the compressed bits in the range.
+
+    Raises:
+        ValueError: if the range is empty, out of bounds or not a whole
+                    number of bytes long.
+    '''
+
+    if not 0 <= start < stop:
+        raise ValueError('start must be non-negative and less than stop')
+
+    result = Bitmap()
+    pos = 0
+
+    for gaps, body in iter_atoms(bs.bytes):
+        gap_end = pos + gaps * bits_per_byte
+        end = gap_end + len(body) * bits_per_byte
+
+        if start < gap_end:
+            result.append_run(False, min(stop, gap_end) - max(start, pos))
+
+        if start < end and gap_end < stop:
+            lo, hi = max(start, gap_end), min(stop, end)
+            result.extend(BitArray(bytes=body)[lo - gap_end:hi - gap_end])
+
+        pos = end
+
+        if pos >= stop:
+            return result.compressed()
 
-        header_byte = bs[:bits_per_byte]
-        bs = bs[bits_per_byte:]
+    raise ValueError('stop must not exceed the length of the bitmap')
 
-        gaps = header_byte[:3].uint
-        is_dirty = header_byte[3]
-        special = header_byte[4:].uint
 
+def concat(bitmaps):
+    '''
+    Concatenate BBC-compressed bitmaps without decompressing them. Only the
+    atoms around each seam are re-encoded, so that gaps and literals on
+    either side are merged as ``compress()`` would; the remaining atoms are
+    copied as they are.
+
+    Args:
+        bitmaps: an iterable of compressed bitmaps.
+
+    Returns:
+        the compressed concatenation of the bitmaps.
+
+    Raises:
+        ValueError: if ``bitmaps`` is empty.
+    '''
+
+    result = bytearray()
+    last_start = 0      # offset of the last atom in ``result``
+
+    for bs in bitmaps:
+        data = bs.bytes
+        offsets = []    # offset of each atom in ``data``
+        starts = []     # index of the first byte in each atom
+        pos, byte_count = 0, 0
+
+        while pos < len(data):
+            offsets.append(pos)
+            starts.append(byte_count)
+            gaps, body, pos = read_atom(data, pos)
+            byte_count += gaps + len(body)
+
+        if not result:
+            result += data
+            last_start = offsets[-1] if offsets else 0
+            continue
+
+        # re-encode the last atom of ``result`` followed by the atoms of
+        # ``data`` until an atom of ``data`` starts a new atom
+        tail = Bitmap()
+        gaps, body, _ = read_atom(result, last_start)
+        tail._push_atom(gaps, body)
+        shift = gaps + len(body)
+
+        del result[last_start:]
+
+        for i, offset in enumerate(offsets):
+            tail._push_atom(*read_atom(data, offset)[:2])
+
+            start = starts[i] + shift
+            n = bisect_left(tail._starts, start)
+            starts_atom = n < len(tail._starts) and tail._starts[n] == start
+
+            if starts_atom or start == tail._closed_bytes:
+                result += b''.join(tail._atoms[:n])
+                last_start = len(result) + offsets[-1] - offset
+                result += data[offset:]
+                break
+        else:
+            seam = tail.compressed().bytes
+            last_atom = tail._open_atom() if tail._gaps or tail._pending \
+                else tail._atoms[-1]
+
+            result += seam
+            last_start = len(result) - len(last_atom)
+
+    if not result:
+        raise ValueError('bitmaps must contain at least one bitmap')
+
+    return BitArray(bytes=result)
+
+
+def _iter_runs(data):
+    '''
+    Returns:
+        a generator of tuples ``(body, length)`` splitting each atom of
+        ``data`` into its gap bytes, for which ``body`` is ``None``, and the
+        bytes following them. ``length`` is the number of bytes covered.
+    '''
+
+    for gaps, body in iter_atoms(data):
         if gaps > 0:
-            logging.info('Adding gap of size %d', gaps)
-            result += BitArray(uint=0, length=gaps * bits_per_byte)
+            yield None, gaps
 
-        if is_dirty:
-            logging.info('Adding offset byte with bit @ %d', special)
-            end_bits = bits_per_byte - special - 1
+        if body:
+            yield body, len(body)
+
+
+def _merge(bitmaps, is_union):
+    '''
+    Combine BBC-compressed bitmaps with a bitwise OR or AND by walking all
+    of them at once. A heap holds the index of the byte where each bitmap's
+    current gap or group of non-gap bytes ends, so the bytes up to the
+    nearest end are handled in one step.
+
+    Args:
+        bitmaps: an iterable of compressed bitmaps.
+        is_union: ``True`` to OR the bitmaps, ``False`` to AND them.
+
+    Returns:
+        the combined bitmap, compressed.
+
+    Raises:
+        ValueError: if ``bitmaps`` is empty or the bitmaps have different
+                    lengths.
+    '''
 
-            result += BitArray(uint=1, length=bits_per_byte - end_bits)
+    streams = [_iter_runs(bs.bytes) for bs in bitmaps]
 
-            if end_bits > 0:
-                result += BitArray(uint=0, length=end_bits)
+    if not streams:
+        raise ValueError('bitmaps must contain at least one bitmap')
+
+    result = Bitmap()
+    gap_count = 0       # number of bitmaps in a gap
+    literals = {}       # current bytes of each bitmap that is not in a gap
+    current = [None] * len(streams)
+    heap = []
+    pos = 0
+
+    def advance(i):
+        nonlocal gap_count
+        run = next(streams[i], None)
+        current[i] = run
+
+        if run is None:
+            return
+
+        body, length = run
+
+        if body is None:
+            gap_count += 1
         else:
-            logging.info('Adding %d literal bytes', special)
-            lit_bits = special * bits_per_byte
+            literals[i] = (body, pos)
 
-            if len(bs) < lit_bits:
-                raise ValueError('Invalid data format')
+        heappush(heap, (pos + length, i))
 
-            result += bs[:lit_bits]
-            bs = bs[lit_bits:]
+    for i in range(len(streams)):
+        advance(i)
 
-    return result
+    while heap:
+        end = heap[0][0]
+        length = end - pos
+
+        if literals and (is_union or gap_count == 0):
+            value = 0 if is_union else all_bits(length * bits_per_byte)
+
+            for body, start in literals.values():
+                part = int.from_bytes(body[pos - start:end - start], 'big')
+                value = value | part if is_union else value & part
+
+            for byte in value.to_bytes(length, 'big'):
+                result._push_byte(byte)
+        else:
+            result._push_gaps(length)
+
+        pos = end
+        finished = False
+
+        while heap and heap[0][0] == end:
+            _, i = heappop(heap)
+
+            if current[i][0] is None:
+                gap_count -= 1
+            else:
+                del literals[i]
+
+            advance(i)
+            finished = finished or current[i] is None
+
+        if finished and heap:
+            raise ValueError('bitmaps must have the same length')
+
+    return result.compressed()
+
+
+def union_many(bitmaps):
+    '''
+    Compute the bitwise OR of any number of BBC-compressed bitmaps without
+    decompressing them.
+
+    Args:
+        bitmaps: an iterable of compressed bitmaps.
+
+    Returns:
+        the OR of the bitmaps, compressed.
+
+    Raises:
+        ValueError: if ``bitmaps`` is empty or the bitmaps have different
+                    lengths.
+    '''
+
+    return _merge(bitmaps, True)
+
+
+def intersect_many(bitmaps):
+    '''
+    Compute the bitwise AND of any number of BBC-compressed bitmaps without
+    decompressing them.
+
+    Args:
+        bitmaps: an iterable of compressed bitmaps.
+
+    Returns:
+        the AND of the bitmaps, compressed.
+
+    Raises:
+        ValueError: if ``bitmaps`` is empty or the bitmaps have different
+                    lengths.
+    '''
+
+    return _merge(bitmaps, False)
+
+
+def invert(bs):
+    '''
+    Compute the bitwise NOT of a BBC-compressed bitmap without decompressing
+    it. Gaps become runs of set bytes, which BBC stores as literals, so the
+    result of inverting a sparse bitmap is large.
+
+    Args:
+        bs: the compressed bits.
+
+    Returns:
+        the NOT of the bitmap, compressed.
+    '''
+
+    if len(bs) == 0:
+        raise ValueError('bs must have a length greater than 0')
+
+    result = Bitmap()
+
+    for gaps, body in iter_atoms(bs.bytes):
+        result.append_run(True, gaps * bits_per_byte)
+
+        for byte in body:
+            result._push_byte(byte ^ all_bits(bits_per_byte))
+
+    return result.compressed()
+
+
+def from_positions(positions, length):
+    '''
+    Compress the bitmap with only the given positions set, without building
+    its uncompressed bits. The bytes between positions are encoded as gaps
+    arithmetically, so the time and memory used depend on the number of
+    positions rather than on ``length``.
+
+    Args:
+        positions: the sorted positions of the set bits, as any iterable of
+                   integers, such as a list, an ``array`` or a NumPy array.
+        length: the number of bits in the bitmap, a multiple of 8.
+
+    Returns:
+        the compressed bitmap, identical to the result of ``compress()`` on
+        the uncompressed bitmap.
+
+    Raises:
+        ValueError: if ``length`` is not a positive multiple of 8, or the
+                    positions are not sorted or fall outside the bitmap.
+    '''
+
+    if length <= 0 or length % bits_per_byte != 0:
+        raise ValueError('length must be a positive multiple of 8')
+
+    bitmap = Bitmap()
+    current = 0     # index of the byte holding ``byte``
+    byte = 0        # bits of the current byte
+    last = -1
+
+    for position in positions:
+        position = int(position)
+
+        if position < last or position >= length:
+            raise ValueError('positions must be sorted and less than length')
+
+        last = position
+        index, offset = divmod(position, bits_per_byte)
+
+        if index != current:
+            bitmap._push_byte(byte)
+            bitmap._push_gaps(index - current - 1)
+            current, byte = index, 0
+
+        byte |= 1 << (bits_per_byte - 1 - offset)
+
+    bitmap._push_byte(byte)
+    bitmap._push_gaps(length // bits_per_byte - current - 1)
+
+    return bitmap.compressed()
+
+
+def compress_many(bitmaps):
+    '''
+    Compress many bitmaps in one pass, packing the results back to back.
+    Each bitmap is split into atoms by ``core.encode_atoms()``, and every
+    atom is written into one shared buffer, without the per-call
+    checks, logging and ``BitArray`` concatenation of calling
+    ``compress()`` on each one.
+
+    Args:
+        bitmaps: an iterable of bitmaps of any lengths that are multiples of
+                 8, in any form taken by ``util.to_bytes()``, such as the
+                 rows of a 2-D NumPy array of bits.
+
+    Returns:
+        a tuple ``(compressed, offsets)``. ``offsets`` is an ``array`` of
+        one more offset than there are bitmaps, and
+        ``compressed[offsets[i]:offsets[i + 1]]`` is the result of
+        ``compress()`` on bitmap ``i``.
+
+    Raises:
+        ValueError: if ``bitmaps`` or any bitmap is empty, or a bitmap is
+                    not a whole number of bytes.
+    '''
+
+    out = bytearray()
+    offsets = array('Q', [0])
+
+    for bs in bitmaps:
+        data, length = to_bytes(bs)
+
+        if length == 0:
+            raise ValueError('bs must have a length greater than 0')
+        elif length % bits_per_byte != 0:
+            raise ValueError('bitmap length must be a multiple of 8 bits')
+
+        encode_atoms(data, out)
+
+        offsets.append(len(out) * bits_per_byte)
+
+    if len(offsets) == 1:
+        raise ValueError('bitmaps must not be empty')
+
+    return BitArray(bytes=bytes(out)), offsets
+
+
+def decompress_many(bs, offsets):
+    '''
+    Decompress bitmaps packed by ``compress_many()`` into one shared buffer
+    in one pass.
+
+    Args:
+        bs: the packed compressed bits.
+        offsets: the offset of each bitmap in ``bs``, followed by the end of
+                 the last one.
+
+    Returns:
+        a tuple ``(bits, offsets)`` of the decompressed bitmaps back to back
+        and their offsets in ``bits``, in the same form as ``offsets``.
+
+    Raises:
+        ValueError: if there are no bitmaps, or a bitmap is not validly
+                    encoded.
+    '''
+
+    if len(offsets) < 2:
+        raise ValueError('offsets must hold at least one bitmap')
+    elif offsets[0] != 0 or offsets[-1] != len(bs) or any(
+            end <= start or end % bits_per_byte != 0
+            for start, end in zip(offsets, offsets[1:])):
+        raise ValueError('Invalid data format')
+
+    data = memoryview(bs.tobytes())
+    out = bytearray()
+    bit_offsets = array('Q', [0])
+
+    for start, end in zip(offsets, offsets[1:]):
+        for gaps, body in iter_atoms(data[start // bits_per_byte:
+                                          end // bits_per_byte]):
+            out += bytes(gaps)
+            out += body
+
+        bit_offsets.append(len(out) * bits_per_byte)
+
+    return BitArray(bytes=bytes(out)), bit_offsets
+
+
+class Bitmap:
+    '''
+    A BBC bitmap that supports appending bits and updating single bits in
+    place. Appended bytes are encoded as soon as the
+    atom containing them can no longer change, so only the open atom (its
+    gap count and up to 14 non-gap bytes) and a partial trailing byte are
+    kept unencoded. The result of ``Bitmap.compressed()`` is identical to
+    calling ``compress()`` on every bit appended so far.
+    '''
+
+    def __init__(self):
+        self._atoms = []          # encoded atoms, as bytes
+        self._starts = []         # index of the first byte in each atom
+        self._closed_bytes = 0    # number of bytes encoded by ``_atoms``
+        self._gaps = 0            # gap bytes in the open atom
+        self._pending = bytearray()  # non-gap bytes in the open atom
+        self._byte = 0            # bits of the trailing partial byte
+        self._byte_len = 0        # number of bits in ``_byte``
+        self.version = 0          # incremented whenever the bits change
+
+    def __len__(self):
+        open_bytes = self._gaps + len(self._pending)
+        return (self._closed_bytes + open_bytes) * bits_per_byte \
+            + self._byte_len
+
+    def _open_atom(self) -> bytes:
+        '''
+        Returns:
+            the encoding of the open atom, as if no more bytes follow it.
+        '''
+
+        pending = self._pending
+
+        if len(pending) == 1 and bin(pending[0]).count('1') == 1:
+            dirty_bit = bits_per_byte - pending[0].bit_length()
+            atom = create_atom(self._gaps, True, dirty_bit, BitArray())
+        else:
+            literals = BitArray(bytes=bytes(pending))
+            atom = create_atom(self._gaps, False, len(pending), literals)
+
+        return atom.bytes
+
+    def _close_atom(self):
+        '''
+        Encode the open atom and start a new one.
+        '''
+
+        self._atoms.append(self._open_atom())
+        self._starts.append(self._closed_bytes)
+        self._closed_bytes += self._gaps + len(self._pending)
+        self._gaps = 0
+        self._pending = bytearray()
+
+    def _push_byte(self, byte: int):
+        '''
+        Encode a full byte, given as an integer.
+        '''
+
+        literal_max = 0b1111
+        gap_max = all_bits(max_gap_bits)
+
+        if byte == 0:
+            if self._pending or self._gaps == gap_max:
+                self._close_atom()
+
+            self._gaps += 1
+        else:
+            self._pending.append(byte)
+
+            if len(self._pending) == literal_max:
+                self._close_atom()
+
+    def _push_gaps(self, gaps: int):
+        '''
+        Encode ``gaps`` zero bytes without visiting them one at a time.
+        '''
+
+        gap_max = all_bits(max_gap_bits)
+
+        if gaps > 0 and self._pending:
+            self._close_atom()
+
+        while gaps > 0:
+            if self._gaps == gap_max:
+                self._close_atom()
+
+            extra = min(gaps, gap_max - self._gaps)
+            self._gaps += extra
+            gaps -= extra
+
+    def _append_bits(self, value: int, length: int):
+        '''
+        Append the ``length`` lowest bits of ``value``, most significant
+        bit first.
+        '''
+
+        while length > 0:
+            take = min(length, bits_per_byte - self._byte_len)
+            length -= take
+
+            self._byte = (self._byte << take) | (value >> length)
+            self._byte_len += take
+            value &= all_bits(length)
+
+            if self._byte_len == bits_per_byte:
+                byte = self._byte
+                self._byte, self._byte_len = 0, 0
+                self._push_byte(byte)
+
+    def append(self, bit):
+        '''
+        Append a single bit to the bitmap.
+        '''
+
+        self.version += 1
+        self._append_bits(int(bool(bit)), 1)
+
+    def extend(self, bits):
+        '''
+        Append a sequence of bits to the bitmap.
+
+        Args:
+            bits: a ``BitArray`` or any value accepted by its constructor.
+        '''
+
+        if not isinstance(bits, BitArray):
+            bits = BitArray(bits)
+
+        self.version += 1
+
+        # complete the partial byte before encoding whole bytes
+        head = min(len(bits), (bits_per_byte - self._byte_len) % bits_per_byte)
+
+        if head > 0:
+            self._append_bits(bits[:head].uint, head)
+
+        tail_len = (len(bits) - head) % bits_per_byte
+
+        for byte in bits[head:len(bits) - tail_len].bytes:
+            self._push_byte(byte)
+
+        if tail_len > 0:
+            self._append_bits(bits[len(bits) - tail_len:].uint, tail_len)
+
+    def append_run(self, bit, length: int):
+        '''
+        Append ``length`` copies of ``bit``. Whole gap bytes of the run are
+        encoded arithmetically rather than byte by byte.
+        '''
+
+        self.version += 1
+        bit = bool(bit)
+        head = min(length, (bits_per_byte - self._byte_len) % bits_per_byte)
+
+        if head > 0:
+            self._append_bits(all_bits(head) if bit else 0, head)
+            length -= head
+
+        if bit:
+            for _ in range(length // bits_per_byte):
+                self._push_byte(all_bits(bits_per_byte))
+        else:
+            self._push_gaps(length // bits_per_byte)
+
+        length %= bits_per_byte
+
+        if length > 0:
+            self._append_bits(all_bits(length) if bit else 0, length)
+
+    def __getitem__(self, i: int) -> bool:
+        if not 0 <= i < len(self):
+            raise IndexError('bit index out of range')
+
+        byte_idx, bit_idx = divmod(i, bits_per_byte)
+        open_bytes = self._gaps + len(self._pending)
+
+        if byte_idx >= self._closed_bytes + open_bytes:
+            shift = self._byte_len - 1 - bit_idx
+            return bool(self._byte >> shift & 1)
+
+        if byte_idx >= self._closed_bytes:
+            gaps, body = self._gaps, self._pending
+            offset = byte_idx - self._closed_bytes
+        else:
+            j = bisect_right(self._starts, byte_idx) - 1
+            gaps, body = next(iter_atoms(self._atoms[j]))
+            offset = byte_idx - self._starts[j]
+
+        byte = body[offset - gaps] if offset >= gaps else 0
+        return bool(byte >> (bits_per_byte - 1 - bit_idx) & 1)
+
+    def _push_atom(self, gaps: int, body, flip: int = -1):
+        '''
+        Encode the bytes of an existing atom, optionally flipping one of its
+        bits.
+
+        Args:
+            gaps: the number of gap bytes in the atom.
+            body: the bytes following the gap bytes.
+            flip: the index of the bit to flip within the bits encoded by
+                  the atom, or -1 to leave the bits unchanged.
+        '''
+
+        byte_idx, bit_idx = divmod(flip, bits_per_byte)
+        mask = 1 << (bits_per_byte - 1 - bit_idx)
+
+        if 0 <= byte_idx < gaps:
+            self._push_gaps(byte_idx)
+            self._push_byte(mask)
+            self._push_gaps(gaps - byte_idx - 1)
+        else:
+            self._push_gaps(gaps)
+
+        for offset, byte in enumerate(body, gaps):
+            self._push_byte(byte ^ mask if offset == byte_idx else byte)
+
+    def _update(self, i: int, bit: bool):
+        '''
+        Change the bit at index ``i`` to ``bit``. Only the atoms from the one
+        before the changed bit up to the point where the new encoding lines
+        up with the old one again are re-encoded.
+        '''
+
+        if self[i] == bit:
+            return
+
+        self.version += 1
+
+        byte_idx = i // bits_per_byte
+        open_bytes = self._gaps + len(self._pending)
+
+        if byte_idx >= self._closed_bytes + open_bytes:
+            shift = self._byte_len - 1 - i % bits_per_byte
+            self._byte ^= 1 << shift
+            return
+
+        # the atom before the changed one may depend on the changed byte to
+        # decide whether its offset byte is dirty, so re-encoding starts there
+        j = bisect_right(self._starts, byte_idx) - 1
+        lo = max(j - 1, 0)
+        start = self._starts[lo] if self._atoms else 0
+        scratch = Bitmap()
+
+        for k in range(lo, len(self._atoms)):
+            flip = i - self._starts[k] * bits_per_byte if k == j else -1
+            scratch._push_atom(*next(iter_atoms(self._atoms[k])), flip)
+
+            if k <= j:
+                continue
+
+            # encoding is the same as before once a new atom starts where
+            # an old one did
+            offset = self._starts[k] - start
+            n = bisect_left(scratch._starts, offset)
+
+            starts_atom = n < len(scratch._starts) and \
+                scratch._starts[n] == offset
+
+            if starts_atom or offset == scratch._closed_bytes:
+                self._atoms[lo:k] = scratch._atoms[:n]
+                self._starts[lo:k] = [start + s for s in scratch._starts[:n]]
+                return
+
+        flip = i - self._closed_bytes * bits_per_byte
+        scratch._push_atom(self._gaps, self._pending, flip)
+
+        self._atoms[lo:] = scratch._atoms
+        self._starts[lo:] = [start + s for s in scratch._starts]
+        self._closed_bytes = start + scratch._closed_bytes
+        self._gaps = scratch._gaps
+        self._pending = scratch._pending
+
+    def set_bit(self, i: int):
+        '''
+        Set the bit at index ``i``.
+
+        Raises:
+            IndexError: if ``i`` is out of range.
+        '''
+
+        self._update(i, True)
+
+    def clear_bit(self, i: int):
+        '''
+        Clear the bit at index ``i``.
+
+        Raises:
+            IndexError: if ``i`` is out of range.
+        '''
+
+        self._update(i, False)
+
+    def compressed(self) -> BitArray:
+        '''
+        Returns:
+            the bitmap compressed in the same format as ``compress()``.
+
+        Raises:
+            ValueError: if the bitmap is empty or does not hold a whole
+                        number of bytes.
+        '''
+
+        if len(self) == 0:
+            raise ValueError('bitmap must have a length greater than 0')
+        elif self._byte_len > 0:
+            raise ValueError('bitmap length must be a multiple of 8 bits')
+
+        data = b''.join(self._atoms)
+
+        if self._gaps > 0 or self._pending:
+            data += self._open_atom()
+
+        return BitArray(bytes=data)
@@ -0,0 +1,281 @@
+'''
+Contains a bit-sliced index over a numeric column. Instead of one bitmap per
+distinct value, value ``v`` of row ``r`` is stored across one bitmap per bit:
+slice ``i`` has bit ``r`` set if bit ``i`` of ``v`` is set. The index then
+holds about ``log2(cardinality)`` bitmaps however many distinct values there
+are, along with an existence bitmap of the rows that are not null.
+
+Comparisons follow O'Neil and Quass's range evaluation: the constant is
+compared with the slices from the most significant bit down, keeping a
+bitmap of the rows already known to be less than it and of those equal to it
+so far. Each step is a fixed number of compressed ANDs, ORs and NOTs, so a
+comparison costs ``O(bits)`` bitmap operations. Sums and counts are
+computed from the popcounts of the slices.
+
+Results are compressed bitmaps in the same format as the slices, which can
+be combined with ``union_many()`` and ``intersect_many()`` or passed back in
+as ``where`` to aggregate over them.
+'''
+
+import lib.wah as wah
+import lib.bbc as bbc
+
+from lib.index import encode_positions
+
+
+bits_per_byte = 8
+
+
+class BitSlicedIndex:
+    '''
+    A bit-sliced index over a column of integers.
+    '''
+
+    def __init__(self, slices, existence, length, offset=0, algorithm='WAH',
+                 word_size=32):
+        '''
+        Use ``build()`` to create an index.
+
+        Args:
+            slices: the compressed bitmap of each bit, least significant
+                    first, of each value minus ``offset``.
+            existence: the compressed bitmap of the rows that are not null.
+            length: the number of rows. BBC bitmaps may be longer, since
+                    they are padded with null rows to whole bytes.
+            offset: the value subtracted from each value before slicing.
+            algorithm: ``'WAH'`` or ``'BBC'``.
+            word_size: the word size used, if the algorithm is WAH.
+        '''
+
+        self.slices = slices
+        self.existence = existence
+        self.length = length
+        self.offset = offset
+        self.algorithm = algorithm
+        self.word_size = word_size
+
+    @classmethod
+    def build(cls, values, algorithm='WAH', word_size=32):
+        '''
+        Build an index over a column.
+
+        Args:
+            values: the value of each row, as an integer or ``None`` for a
+                    null. Values may be negative.
+            algorithm: ``'WAH'`` or ``'BBC'``.
+            word_size: the word size used, if the algorithm is WAH.
+
+        Raises:
+            ValueError: if ``values`` is empty or ``algorithm`` is not
+                        recognized.
+        '''
+
+        if len(values) == 0:
+            raise ValueError('values must not be empty')
+        elif algorithm not in ('WAH', 'BBC'):
+            raise ValueError(f'Unrecognized algorithm: {algorithm}')
+
+        present = [v for v in values if v is not None]
+        offset = min(present, default=0)
+        bit_count = (max(present, default=0) - offset).bit_length()
+
+        # BBC bitmaps are whole bytes, so pad them with null rows
+        length = len(values)
+
+        if algorithm == 'BBC':
+            length += -length % bits_per_byte
+
+        positions = [[] for _ in range(bit_count)]
+        existence = []
+
+        for row, value in enumerate(values):
+            if value is None:
+                continue
+
+            existence.append(row)
+            value -= offset
+
+            for i in range(value.bit_length()):
+                if value >> i & 1:
+                    positions[i].append(row)
+
+        slices = [encode_positions(p, length, algorithm, word_size)
+                  for p in positions]
+        existence = encode_positions(existence, length, algorithm, word_size)
+
+        return cls(slices, existence, len(values), offset, algorithm,
+                   word_size)
+
+    def __len__(self):
+        return self.length
+
+    def size(self) -> int:
+        '''
+        Returns:
+            the total number of bits in the compressed bitmaps.
+        '''
+
+        bitmaps = self.slices + [self.existence]
+
+        if self.algorithm == 'WAH':
+            return sum(len(bs) for bs, _ in bitmaps)
+        else:
+            return sum(len(bs) for bs in bitmaps)
+
+    ##############
+    # bitmap ops #
+    ##############
+
+    def _and(self, *bitmaps):
+        if self.algorithm == 'WAH':
+            return wah.intersect_many(bitmaps, self.word_size)
+        else:
+            return bbc.intersect_many(bitmaps)
+
+    def _or(self, *bitmaps):
+        if self.algorithm == 'WAH':
+            return wah.union_many(bitmaps, self.word_size)
+        else:
+            return bbc.union_many(bitmaps)
+
+    def _not(self, bitmap):
+        if self.algorithm == 'WAH':
+            return wah.invert(*bitmap, self.word_size)
+        else:
+            return bbc.invert(bitmap)
+
+    def _count(self, bitmap) -> int:
+        if self.algorithm == 'WAH':
+            return wah.count(*bitmap, self.word_size)
+        else:
+            return bbc.count(bitmap)
+
+    def _empty(self):
+        return self._and(self.existence, self._not(self.existence))
+
+    ###############
+    # comparisons #
+    ###############
+
+    def _compare(self, value):
+        '''
+        Returns:
+            a tuple ``(less, equal)`` of the bitmaps of the rows whose values
+            are less than and equal to ``value``.
+        '''
+
+        value -= self.offset
+
+        if value < 0:
+            return self._empty(), self._empty()
+        elif value.bit_length() > len(self.slices):
+            return self.existence, self._empty()
+
+        less = None
+        equal = self.existence
+
+        for i in reversed(range(len(self.slices))):
+            if value >> i & 1:
+                # rows without this bit are less, whatever their lower bits
+                below = self._and(equal, self._not(self.slices[i]))
+                less = below if less is None else self._or(less, below)
+                equal = self._and(equal, self.slices[i])
+            else:
+                equal = self._and(equal, self._not(self.slices[i]))
+
+        return (self._empty() if less is None else less), equal
+
+    def equal(self, value):
+        '''
+        Returns:
+            the bitmap of the rows whose values equal ``value``.
+        '''
+
+        return self._compare(value)[1]
+
+    def less(self, value):
+        '''
+        Returns:
+            the bitmap of the rows whose values are less than ``value``.
+        '''
+
+        return self._compare(value)[0]
+
+    def less_equal(self, value):
+        '''
+        Returns:
+            the bitmap of the rows whose values are at most ``value``.
+        '''
+
+        return self._or(*self._compare(value))
+
+    def greater(self, value):
+        '''
+        Returns:
+            the bitmap of the rows whose values are greater than ``value``.
+        '''
+
+        return self._and(self.existence, self._not(self.less_equal(value)))
+
+    def greater_equal(self, value):
+        '''
+        Returns:
+            the bitmap of the rows whose values are at least ``value``.
+        '''
+
+        return self._and(self.existence, self._not(self.less(value)))
+
+    def between(self, low, high):
+        '''
+        Returns:
+            the bitmap of the rows whose values are between ``low`` and
+            ``high``, inclusive.
+        '''
+
+        return self._and(self.greater_equal(low), self.less_equal(high))
+
+    ###############
+    # aggregation #
+    ###############
+
+    def count(self, where=None) -> int:
+        '''
+        Returns:
+            the number of rows that are not null and, if ``where`` is given,
+            are set in the bitmap ``where``.
+        '''
+
+        if where is None:
+            return self._count(self.existence)
+
+        return self._count(self._and(self.existence, where))
+
+    def sum(self, where=None) -> int:
+        '''
+        Returns:
+            the sum of the values of the rows that are not null and, if
+            ``where`` is given, are set in the bitmap ``where``.
+        '''
+
+        total = self.offset * self.count(where)
+
+        for i, bitmap in enumerate(self.slices):
+            if where is not None:
+                bitmap = self._and(bitmap, where)
+
+            total += self._count(bitmap) << i
+
+        return total
+
+    def rows(self, bitmap):
+        '''
+        Returns:
+            a list of the rows set in a bitmap returned by the index.
+        '''
+
+        if self.algorithm == 'WAH':
+            bits = wah.decompress(*bitmap, self.word_size)
+        else:
+            bits = bbc.decompress(bitmap)
+
+        return [row for row in bits.findall([1]) if row < self.length]
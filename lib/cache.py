@@ -0,0 +1,337 @@
+'''
+Contains a cache for decompressed bitmaps and the results of boolean
+operations, so that repeated queries on the same bitmaps are only computed
+once.
+
+Compressed data is identified by a hash of its contents, and ``Bitmap``
+objects by their identity and ``version``, so a cached value is never
+returned after the bitmap it came from has changed. Entries are evicted in
+least-recently-used order once their total size exceeds a byte budget.
+Cached values are shared between callers, so they are returned as immutable
+``Bits``.
+'''
+
+import hashlib
+import itertools
+import threading
+import weakref
+
+from collections import OrderedDict, namedtuple
+from functools import partial
+
+from bitstring import Bits
+
+import lib.wah as wah
+import lib.bbc as bbc
+
+
+# counters returned by ``Cache.stats()``
+CacheStats = namedtuple('CacheStats', ['hits', 'misses', 'evictions',
+                                       'entries', 'size'])
+
+
+def _size_of(value) -> int:
+    '''
+    Returns:
+        the approximate number of bytes held by a cached value.
+    '''
+
+    if isinstance(value, tuple):
+        return sum(_size_of(item) for item in value)
+    elif isinstance(value, Bits):
+        return -(-len(value) // 8)
+    else:
+        return 0
+
+
+def _freeze(value):
+    '''
+    Returns:
+        ``value`` with any ``BitArray``s replaced by ``Bits``.
+    '''
+
+    if isinstance(value, tuple):
+        return tuple(_freeze(item) for item in value)
+    elif isinstance(value, Bits):
+        return Bits(value)
+    else:
+        return value
+
+
+def _tokens_in(key):
+    '''
+    Returns:
+        the set of tokens of the bitmaps whose keys, as returned by
+        ``Cache.bitmap_key()``, are contained in ``key``.
+    '''
+
+    if not isinstance(key, tuple):
+        return set()
+    elif len(key) == 3 and key[0] == 'bitmap':
+        return {key[1]}
+    else:
+        return set().union(*(_tokens_in(item) for item in key))
+
+
+def _forget(cache_ref, token):
+    '''
+    Remove the values cached for a bitmap that has been freed, unless the
+    cache has been freed first.
+    '''
+
+    cache = cache_ref()
+
+    if cache is not None:
+        cache._forget(token)
+
+
+class Cache:
+    '''
+    A thread-safe LRU cache bounded by the total size of its values.
+    '''
+
+    def __init__(self, max_bytes: int):
+        '''
+        Args:
+            max_bytes: the largest total size, in bytes, of the cached values.
+                       Values larger than this are returned but not cached.
+        '''
+
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()   # key -> (value, size)
+        self._size = 0
+        # reentrant, since a bitmap can be freed (and forgotten) while the
+        # lock is held
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        # ``Bitmap`` objects are given tokens that are never reused, since
+        # ``id()``s are reused once an object is freed
+        self._tokens = weakref.WeakKeyDictionary()
+        self._versions = {}             # token -> last version seen
+        self._keys = {}                 # token -> keys that contain it
+        self._next_token = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> CacheStats:
+        '''
+        Returns:
+            the hit, miss and eviction counters, along with the number and
+            total size of the cached values.
+        '''
+
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions,
+                              len(self._entries), self._size)
+
+    def clear(self):
+        '''
+        Remove every cached value. The counters are kept.
+        '''
+
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        _, size = self._entries.pop(key)
+        self._size -= size
+
+        for token in _tokens_in(key):
+            keys = self._keys.get(token)
+
+            if keys is not None:
+                keys.discard(key)
+
+                if not keys:
+                    del self._keys[token]
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self._evictions += 1
+
+    def _discard(self, token):
+        '''
+        Remove the values whose keys contain the bitmap with the given token.
+        '''
+
+        for key in self._keys.pop(token, ()):
+            if key in self._entries:
+                self._remove(key)
+
+    def get(self, key, default=None):
+        '''
+        Returns:
+            the value cached under ``key``, or ``default`` if there is none.
+        '''
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key][0]
+
+            self._misses += 1
+            return default
+
+    def put(self, key, value, size=None):
+        '''
+        Cache ``value`` under ``key``, evicting the least recently used values
+        until the cache fits in its budget.
+
+        Args:
+            key: a hashable key.
+            value: the value to cache.
+            size: the size of ``value`` in bytes (default: the size of any
+                  ``Bits`` it holds).
+        '''
+
+        size = _size_of(value) if size is None else size
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = (value, size)
+            self._size += size
+
+            for token in _tokens_in(key):
+                self._keys.setdefault(token, set()).add(key)
+
+            self._evict()
+
+    def get_or_compute(self, key, compute):
+        '''
+        Returns:
+            the value cached under ``key``, or the result of calling
+            ``compute`` with no arguments, which is then cached.
+        '''
+
+        missing = object()
+        value = self.get(key, missing)
+
+        if value is missing:
+            value = _freeze(compute())
+            self.put(key, value)
+
+        return value
+
+    def data_key(self, compressed, algorithm, word_size=0, final_length=0):
+        '''
+        Returns:
+            a key identifying compressed data by a hash of its contents and
+            its format. The arguments are the same as those of
+            ``fileformat.dumps()``.
+        '''
+
+        digest = hashlib.blake2b(compressed.tobytes(), digest_size=16) \
+            .digest()
+        return ('data', algorithm, word_size, final_length, len(compressed),
+                digest)
+
+    def bitmap_key(self, bitmap):
+        '''
+        Returns:
+            a key identifying the current contents of a ``wah.Bitmap`` or
+            ``bbc.Bitmap``. Values cached under earlier versions of the
+            bitmap are removed.
+        '''
+
+        with self._lock:
+            token = self._tokens.get(bitmap)
+
+            if token is None:
+                token = next(self._next_token)
+                self._tokens[bitmap] = token
+                weakref.finalize(bitmap, _forget, weakref.ref(self), token)
+            elif self._versions[token] != bitmap.version:
+                self._discard(token)
+
+            self._versions[token] = bitmap.version
+
+        return ('bitmap', token, bitmap.version)
+
+    def _forget(self, token):
+        with self._lock:
+            self._versions.pop(token, None)
+            self._discard(token)
+
+    def decompress(self, compressed, algorithm, word_size=0, final_length=0):
+        '''
+        Decompress compressed data, or return the cached result. The arguments
+        are the same as those of ``fileformat.dumps()``.
+        '''
+
+        key = ('decompress',
+               self.data_key(compressed, algorithm, word_size, final_length))
+
+        if algorithm == 'WAH':
+            compute = partial(wah.decompress, compressed, final_length,
+                              word_size)
+        else:
+            compute = partial(bbc.decompress, compressed)
+
+        return self.get_or_compute(key, compute)
+
+    def decompress_bitmap(self, bitmap):
+        '''
+        Decompress a ``wah.Bitmap`` or ``bbc.Bitmap``, or return the cached
+        result if the bitmap has not changed since it was cached.
+        '''
+
+        key = ('decompress', self.bitmap_key(bitmap))
+
+        # the bitmap is only compressed on a miss
+        def compute():
+            if isinstance(bitmap, wah.Bitmap):
+                return wah.decompress(*bitmap.compressed(), bitmap.word_size)
+            else:
+                return bbc.decompress(bitmap.compressed())
+
+        return self.get_or_compute(key, compute)
+
+    def _merge(self, op, bitmaps, algorithm, word_size):
+        bitmaps = list(bitmaps)
+
+        if algorithm == 'WAH':
+            merge = wah.union_many if op == 'union' else wah.intersect_many
+            keys = tuple(self.data_key(bs, algorithm, word_size, length)
+                         for bs, length in bitmaps)
+            compute = partial(merge, bitmaps, word_size)
+        else:
+            merge = bbc.union_many if op == 'union' else bbc.intersect_many
+            keys = tuple(self.data_key(bs, algorithm) for bs in bitmaps)
+            compute = partial(merge, bitmaps)
+
+        return self.get_or_compute((op,) + keys, compute)
+
+    def union_many(self, bitmaps, algorithm, word_size=0):
+        '''
+        OR compressed bitmaps, or return the cached result.
+
+        Args:
+            bitmaps: the bitmaps, in the format taken by ``wah.union_many()``
+                     or ``bbc.union_many()``.
+            algorithm: ``'WAH'`` or ``'BBC'``.
+            word_size: the word size used, if the algorithm is WAH.
+        '''
+
+        return self._merge('union', bitmaps, algorithm, word_size)
+
+    def intersect_many(self, bitmaps, algorithm, word_size=0):
+        '''
+        AND compressed bitmaps, or return the cached result. The arguments
+        are the same as those of ``union_many()``.
+        '''
+
+        return self._merge('intersect', bitmaps, algorithm, word_size)
@@ -0,0 +1,117 @@
+'''
+Contains a client for the compression service in ``lib.service``.
+'''
+
+import socket
+import struct
+
+import lib.service as service
+
+
+class Client:
+    '''
+    A blocking connection to the compression service. Compressed values are
+    exchanged in the format of ``lib.fileformat``.
+    '''
+
+    def __init__(self, path: str):
+        '''
+        Args:
+            path: the path of the service's Unix socket.
+        '''
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._sock.close()
+
+    def _recv_exactly(self, size: int) -> bytes:
+        chunks = []
+
+        while size > 0:
+            chunk = self._sock.recv(size)
+
+            if not chunk:
+                raise ConnectionError('Connection closed by the service')
+
+            chunks.append(chunk)
+            size -= len(chunk)
+
+        return b''.join(chunks)
+
+    def request(self, op: str, operands, **params):
+        '''
+        Send a request and wait for its response.
+
+        Args:
+            op: the operation to request.
+            operands: a list of operands, as bytes.
+            params: additional header fields.
+
+        Returns:
+            a tuple ``(header, body)`` holding the response.
+
+        Raises:
+            ValueError: if the service could not handle the request.
+        '''
+
+        header = dict(params, op=op, sizes=[len(o) for o in operands])
+        self._sock.sendall(service.pack_message(header, b''.join(operands)))
+
+        size, = struct.unpack(service.length_format,
+                              self._recv_exactly(service.length_size))
+        header, body = service.unpack_message(self._recv_exactly(size))
+
+        if not header.get('ok'):
+            raise ValueError(header.get('error', 'Request failed'))
+
+        return header, body
+
+    def compress(self, data: bytes, algorithm: str,
+                 word_size: int = 8) -> bytes:
+        '''
+        Returns:
+            ``data`` compressed with ``algorithm``.
+        '''
+
+        return self.request('compress', [data], algorithm=algorithm,
+                            word_size=word_size)[1]
+
+    def decompress(self, data: bytes) -> bytes:
+        '''
+        Returns:
+            the decompressed bits of ``data``, padded to whole bytes.
+        '''
+
+        return self.request('decompress', [data])[1]
+
+    def count(self, data: bytes) -> int:
+        '''
+        Returns:
+            the number of set bits in compressed ``data``.
+        '''
+
+        return self.request('count', [data])[0]['count']
+
+    def union(self, operands) -> bytes:
+        '''
+        Returns:
+            the OR of the compressed operands.
+        '''
+
+        return self.request('union', list(operands))[1]
+
+    def intersect(self, operands) -> bytes:
+        '''
+        Returns:
+            the AND of the compressed operands.
+        '''
+
+        return self.request('intersect', list(operands))[1]
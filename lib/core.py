@@ -0,0 +1,472 @@
+'''
+Contains the WAH and BBC codecs on plain bytes, using only the standard
+library. Uncompressed bits are given as bytes and a length in bits, most
+significant bit first, as returned by ``BitArray.tobytes()``, and the
+compressed outputs are identical to those of ``wah.compress()`` and
+``bbc.compress()``.
+
+Importing ``bitstring`` is a large part of the start-up time of short-lived
+processes, so the command-line interface uses this module directly. The
+``BitArray`` interfaces of ``lib.wah`` and ``lib.bbc`` are built on it, and
+are only imported by callers that work with ``BitArray``s.
+'''
+
+import re
+import sys
+
+from array import array
+
+from lib.util import all_bits
+
+
+bits_per_byte = 8
+
+# array type codes for the word sizes that are a whole number of bytes
+typecodes = {8: 'B', 16: 'H', 32: 'I', 64: 'Q'}
+
+# BBC constants
+header_gap_bits = 3  # number of bits in header gap size
+header_gap_max = all_bits(header_gap_bits)  # max gap size in header
+max_gap_bits = 2 * bits_per_byte - 1        # max bits used for gap size
+literal_max = 0b1111                        # max literals in an atom
+
+# the gap and literal bytes of each atom that ``bbc.compress()`` would make
+_atom_pattern = re.compile(
+    rb'(\x00{0,%d})([^\x00]{0,%d})' % (all_bits(max_gap_bits), literal_max))
+
+
+#######
+# WAH #
+#######
+
+def words_to_bytes(words, word_size: int) -> bytes:
+    '''
+    Returns:
+        the integer words concatenated most significant bit first, padded
+        with zeroes to a whole number of bytes.
+    '''
+
+    if word_size in typecodes:
+        packed = array(typecodes[word_size], words)
+
+        if sys.byteorder == 'little':
+            packed.byteswap()
+
+        return packed.tobytes()
+
+    bits = ''.join(format(word, f'0{word_size}b') for word in words)
+    bits += '0' * (-len(bits) % bits_per_byte)
+
+    return int(bits or '0', 2).to_bytes(len(bits) // bits_per_byte, 'big')
+
+
+def bytes_to_words(data, count: int, word_size: int):
+    '''
+    Returns:
+        a sequence of the first ``count`` words of ``word_size`` bits in
+        ``data``. This is the inverse of ``words_to_bytes()``.
+    '''
+
+    if word_size in typecodes:
+        words = array(typecodes[word_size])
+        words.frombytes(data[:count * word_size // bits_per_byte])
+
+        if sys.byteorder == 'little':
+            words.byteswap()
+
+        return words
+
+    length = count * word_size
+    value = int.from_bytes(data, 'big') >> (len(data) * bits_per_byte
+                                            - length)
+    bits = format(value, f'0{length}b')
+
+    return [int(bits[i:i + word_size], 2)
+            for i in range(0, length, word_size)]
+
+
+def _sections(data, length: int, section_size: int):
+    '''
+    Split the first ``length`` bits of ``data`` into whole sections.
+
+    Returns:
+        a generator of tuples ``(section, count)`` for ``count`` repeats of
+        the integer ``section``. A trailing partial section is left out.
+    '''
+
+    # ``section_size`` bytes hold exactly 8 sections
+    block_bits = section_size * bits_per_byte
+    blocks = length // block_bits
+    mask = all_bits(section_size)
+    ones = all_bits(block_bits)
+
+    for offset in range(0, blocks * section_size, section_size):
+        block = int.from_bytes(data[offset:offset + section_size], 'big')
+
+        if block == 0 or block == ones:
+            yield block & mask, bits_per_byte
+            continue
+
+        for shift in range(block_bits - section_size, -1, -section_size):
+            yield block >> shift & mask, 1
+
+    rest_bits = length - blocks * block_bits
+    rest = data[blocks * section_size:]
+    value = int.from_bytes(rest, 'big') >> (len(rest) * bits_per_byte
+                                            - rest_bits)
+    tail_len = rest_bits % section_size
+
+    for shift in range(rest_bits - section_size, tail_len - 1,
+                       -section_size):
+        yield value >> shift & mask, 1
+
+
+def encode_words(bitmaps, word_size: int):
+    '''
+    WAH-compress bitmaps back to back into one list of words. The bits are
+    read a block of 8 sections at a time with ``int.from_bytes()``.
+
+    Args:
+        bitmaps: an iterable of tuples ``(data, length)`` of the bytes of
+                 each bitmap and its length in bits.
+        word_size: the word size used in the algorithm.
+
+    Returns:
+        a tuple ``(words, offsets, final_lengths)``, where bitmap ``i`` is
+        encoded by ``words[offsets[i]:offsets[i + 1]]``.
+
+    Raises:
+        ValueError: if a bitmap is empty.
+    '''
+
+    section_size = word_size - 1
+    mask = all_bits(section_size)
+    max_run = all_bits(word_size - 2)
+    fill_headers = [0b10 << (word_size - 2), 0b11 << (word_size - 2)]
+    words = []
+    offsets = array('Q', [0])
+    final_lengths = array('B')
+
+    for data, length in bitmaps:
+        if length == 0:
+            raise ValueError('bs must have a length greater than 0')
+
+        start = len(words)
+
+        for section, count in _sections(data, length, section_size):
+            if section != 0 and section != mask:
+                words.append(section)
+                continue
+            elif max_run == 0:
+                # the word size is too small to encode runs
+                words += [section] * count
+                continue
+
+            header = fill_headers[section != 0]
+
+            # extend the last fill, unless it belongs to the previous bitmap
+            if len(words) > start and words[-1] & ~max_run == header:
+                extra = min(count, max_run - (words[-1] & max_run))
+                words[-1] += extra
+                count -= extra
+
+            while count > 0:
+                runs = min(count, max_run)
+                words.append(header | runs)
+                count -= runs
+
+        tail_len = length % section_size
+
+        if tail_len > 0:
+            last = -(-length // bits_per_byte)
+            tail = int.from_bytes(data[(length - tail_len) // bits_per_byte:
+                                       last], 'big')
+            tail >>= last * bits_per_byte - length
+            words.append((tail & all_bits(tail_len))
+                         << (section_size - tail_len))
+            final_lengths.append(tail_len + 1)
+        else:
+            final_lengths.append(word_size)
+
+        offsets.append(len(words))
+
+    return words, offsets, final_lengths
+
+
+def decode_words(words, offsets, final_lengths, word_size: int):
+    '''
+    Decompress WAH-compressed bitmaps held back to back in a sequence of
+    words. Runs are written as whole bytes, and the bits of each bitmap
+    follow those of the previous one without padding.
+
+    Returns:
+        a tuple ``(data, offsets)``, where bitmap ``i`` is held by bits
+        ``offsets[i]`` to ``offsets[i + 1]`` of the bytes ``data``.
+    '''
+
+    section_size = word_size - 1
+    max_run = all_bits(word_size - 2)
+    out = bytearray()
+    acc, acc_len = 0, 0     # bits not yet written to ``out``
+    total = 0
+    bit_offsets = array('Q', [0])
+
+    for b, final_length in enumerate(final_lengths):
+        stop = offsets[b + 1]
+
+        for i in range(offsets[b], stop):
+            word = words[i]
+
+            if word >> section_size:
+                length = (word & max_run) * section_size
+                bit = word >> (word_size - 2) & 1
+
+                # fill the partial byte, then write the rest as whole bytes
+                head = min(length, -acc_len % bits_per_byte)
+                acc = acc << head | (all_bits(head) if bit else 0)
+                acc_len += head
+
+                if acc_len == bits_per_byte:
+                    out.append(acc)
+                    acc, acc_len = 0, 0
+
+                body, tail = divmod(length - head, bits_per_byte)
+                out += (b'\xff' if bit else b'\x00') * body
+                acc = acc << tail | (all_bits(tail) if bit else 0)
+                acc_len += tail
+            else:
+                length = section_size
+
+                if i == stop - 1:
+                    length = final_length - 1
+                    word >>= word_size - final_length
+
+                acc = acc << length | word
+                acc_len += length
+
+            total += length
+
+            if acc_len >= bits_per_byte:
+                whole = acc_len // bits_per_byte * bits_per_byte
+                out += (acc >> (acc_len - whole)).to_bytes(
+                    whole // bits_per_byte, 'big')
+                acc &= all_bits(acc_len - whole)
+                acc_len -= whole
+
+        bit_offsets.append(total)
+
+    if acc_len > 0:
+        out.append(acc << (bits_per_byte - acc_len))
+
+    return bytes(out), bit_offsets
+
+
+def wah_compress(data, length: int, word_size: int):
+    '''
+    Compress bits with WAH compression.
+
+    Args:
+        data: the bits to compress, as a bytes-like object.
+        length: the number of bits in ``data`` to compress.
+        word_size: the word size used in the algorithm.
+
+    Returns:
+        a tuple ``(compressed, compressed_length, final_length)`` of the
+        compressed bytes, the number of compressed bits in them, and the
+        number of bits used in the final word.
+
+    Raises:
+        ValueError: if ``length`` is 0 or ``word_size`` is less than 2.
+    '''
+
+    if word_size <= 1:
+        raise ValueError('word_size must be at least 2')
+
+    words, _, final_lengths = encode_words([(data, length)], word_size)
+
+    return (words_to_bytes(words, word_size), len(words) * word_size,
+            final_lengths[0])
+
+
+def wah_decompress(data, length: int, final_length: int, word_size: int):
+    '''
+    Decompress WAH-compressed bits. This is the inverse of
+    ``wah_compress()``.
+
+    Args:
+        data: the compressed bits, as a bytes-like object.
+        length: the number of compressed bits in ``data``.
+        final_length: the number of bits used in the final word.
+        word_size: the word size used.
+
+    Returns:
+        a tuple ``(bits, bit_length)`` of the decompressed bytes and the
+        number of bits in them.
+
+    Raises:
+        ValueError: if the arguments do not describe valid WAH data.
+    '''
+
+    if word_size <= 1:
+        raise ValueError('word_size must be at least 2')
+    elif length == 0 or length % word_size != 0 \
+            or length > len(data) * bits_per_byte:
+        raise ValueError('Invalid data format')
+    elif not 1 <= final_length <= word_size:
+        raise ValueError('final_length must be between 1 and word_size, '
+                         'inclusive')
+
+    words = bytes_to_words(data, length // word_size, word_size)
+    bits, offsets = decode_words(words, [0, len(words)], [final_length],
+                                 word_size)
+
+    return bits, offsets[-1]
+
+
+#######
+# BBC #
+#######
+
+def encode_atoms(data, out: bytearray):
+    '''
+    BBC-compress bytes, appending the atoms to ``out``. Each atom is found
+    by a regular expression over ``data`` rather than byte by byte.
+    '''
+
+    for match in _atom_pattern.finditer(data):
+        gaps, body = match.group(1, 2)
+
+        # the pattern also matches nothing at the end of the bytes
+        if not gaps and not body:
+            continue
+
+        gaps = len(gaps)
+        header = min(gaps, header_gap_max) << (bits_per_byte
+                                               - header_gap_bits)
+
+        if len(body) == 1 and body[0] & (body[0] - 1) == 0:
+            # a single set bit is stored as an offset in the header
+            out.append(header | 1 << 4 | bits_per_byte - body[0].bit_length())
+            body = b''
+        else:
+            out.append(header | len(body))
+
+        if gaps >= header_gap_max:
+            if gaps <= all_bits(bits_per_byte - 1):
+                out.append(gaps)
+            else:
+                out += (gaps | 1 << max_gap_bits).to_bytes(2, 'big')
+
+        out += body
+
+
+def read_atom(data, pos: int):
+    '''
+    Read the atom starting at byte ``pos`` of ``data``.
+
+    Returns:
+        a tuple ``(gaps, body, end)``, where ``end`` is the index of the
+        byte after the atom. See ``iter_atoms()`` for the other values.
+
+    Raises:
+        ValueError: if the atom is not validly encoded.
+    '''
+
+    header = data[pos]
+    pos += 1
+
+    gaps = header >> (bits_per_byte - header_gap_bits)
+    is_dirty = header >> 4 & 1
+    special = header & 0b1111
+
+    if gaps == header_gap_max:
+        # the gap length is stored in the bytes after the header
+        if pos >= len(data):
+            raise ValueError('Invalid data format')
+
+        gaps = data[pos]
+        pos += 1
+
+        if gaps >> (bits_per_byte - 1):
+            if pos >= len(data):
+                raise ValueError('Invalid data format')
+
+            upper = gaps & all_bits(bits_per_byte - 1)
+            gaps = (upper << bits_per_byte) | data[pos]
+            pos += 1
+
+    if is_dirty:
+        if special >= bits_per_byte:
+            raise ValueError('Invalid data format')
+
+        body = bytes([1 << (bits_per_byte - 1 - special)])
+    else:
+        if pos + special > len(data):
+            raise ValueError('Invalid data format')
+
+        body = bytes(data[pos:pos + special])
+        pos += special
+
+    return gaps, body, pos
+
+
+def iter_atoms(data):
+    '''
+    Iterate over the atoms of BBC-compressed data without expanding them.
+
+    Args:
+        data: the compressed bytes, as any bytes-like object. A ``memoryview``
+              is read in place without being copied.
+
+    Returns:
+        a generator of tuples ``(gaps, body)``, where ``gaps`` is the number
+        of gap bytes in the atom and ``body`` is the bytes that follow the
+        gap bytes. Offset bytes are expanded to a full byte in ``body``.
+
+    Raises:
+        ValueError: if ``data`` is not validly encoded.
+    '''
+
+    pos = 0
+
+    while pos < len(data):
+        gaps, body, pos = read_atom(data, pos)
+        yield gaps, body
+
+
+def bbc_compress(data) -> bytes:
+    '''
+    Compress bytes with BBC compression.
+
+    Raises:
+        ValueError: if ``data`` is empty.
+    '''
+
+    if len(data) == 0:
+        raise ValueError('bs must have a length greater than 0')
+
+    out = bytearray()
+    encode_atoms(data, out)
+
+    return bytes(out)
+
+
+def bbc_decompress(data) -> bytes:
+    '''
+    Decompress BBC-compressed bytes. This is the inverse of
+    ``bbc_compress()``.
+
+    Raises:
+        ValueError: if ``data`` is empty or not validly encoded.
+    '''
+
+    if len(data) == 0:
+        raise ValueError('bs must have a length greater than 0')
+
+    out = bytearray()
+
+    for gaps, body in iter_atoms(data):
+        out += bytes(gaps)
+        out += body
+
+    return bytes(out)
@@ -0,0 +1,226 @@
+'''
+Contains a content-addressed cache of files on disk. Values are stored in
+files named by a hash of everything they were computed from, so unchanged
+inputs can be looked up without recomputing them.
+
+Values are written to a temporary file and renamed into place, so many
+processes can share a cache directory without reading partial values. Hits
+update a value's modification time, and ``DiskCache.evict()`` removes the
+least recently used values once the cache grows past its size limit.
+
+Walking the cache to find its size is slow once it holds many values, so
+the cache keeps a size record: each ``put()`` appends the size of its value
+to it, and each full walk in ``evict()`` replaces the sizes in it with the
+total it found. The record only overcounts (values that are overwritten or
+evicted by another process are still counted), so ``evict()`` can skip the
+walk while the recorded total is within the size limit.
+'''
+
+import hashlib
+import os
+import tempfile
+import time
+
+
+# the name of the size record in the cache directory
+record_name = '.size'
+
+# the age in seconds after which a temporary file left behind by a process
+# that died during ``put()`` is removed by ``evict()``
+tmp_max_age = 3600
+
+
+def make_key(data: bytes, *params) -> str:
+    '''
+    Returns:
+        a hex digest identifying ``data`` and the parameters it is processed
+        with.
+    '''
+
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr(params).encode())
+    h.update(b'\0')
+    h.update(data)
+
+    return h.hexdigest()
+
+
+class DiskCache:
+    '''
+    A directory of cached values, keyed by ``make_key()``.
+    '''
+
+    def __init__(self, path: str, max_bytes: int):
+        '''
+        Args:
+            path: the cache directory, which is created if needed.
+            max_bytes: the size that ``evict()`` shrinks the cache to.
+        '''
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self._record = os.path.join(path, record_name)
+
+        os.makedirs(path, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        # spread the values over subdirectories to keep each one small
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key: str):
+        '''
+        Returns:
+            the value stored under ``key``, or ``None`` if there is none.
+        '''
+
+        path = self._path(key)
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            os.utime(path)
+        except FileNotFoundError:
+            # missing, or evicted by another process
+            return None
+
+        return data
+
+    def put(self, key: str, data: bytes):
+        '''
+        Store ``data`` under ``key``. If another process stores the same key
+        at the same time, one of the values wins whole.
+        '''
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                        prefix='.tmp-')
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self._add_to_record(len(data))
+
+    def _add_to_record(self, size: int):
+        # appends this short are atomic, so concurrent writers do not
+        # interleave
+        with open(self._record, 'a') as f:
+            f.write(f'{size}\n')
+
+    def recorded_size(self):
+        '''
+        Returns:
+            the total size in bytes of the stored values according to the
+            size record, which is at least their actual size, or ``None`` if
+            there is no record.
+        '''
+
+        try:
+            with open(self._record) as f:
+                return sum(int(line) for line in f if line.strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _entries(self):
+        '''
+        Returns:
+            a list of tuples ``(mtime, size, path)`` for each stored value.
+        '''
+
+        entries = []
+        stale = time.time() - tmp_max_age
+
+        for root, _, names in os.walk(self.path):
+            for name in names:
+                path = os.path.join(root, name)
+
+                if name.startswith(('.tmp-', record_name + '-')):
+                    self._remove_stale(path, stale)
+                    continue
+                elif name.startswith('.'):
+                    continue
+
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        return entries
+
+    def _remove_stale(self, path: str, stale: float):
+        '''
+        Remove a temporary file from ``put()`` or ``evict()`` if it was last
+        written before ``stale``, which means that its writer died.
+        '''
+
+        try:
+            if os.stat(path).st_mtime < stale:
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def size(self) -> int:
+        '''
+        Returns:
+            the total size in bytes of the stored values.
+        '''
+
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> int:
+        '''
+        Remove the least recently used values until the cache is no larger
+        than ``max_bytes``, and remove stale temporary files. The cache is
+        only walked if the size record does not show it to be within
+        ``max_bytes``.
+
+        Returns:
+            the number of values removed.
+        '''
+
+        recorded = self.recorded_size()
+
+        if recorded is not None and recorded <= self.max_bytes:
+            return 0
+
+        # move the record aside before walking, so that values stored during
+        # the walk are counted either by the walk or in a new record
+        old_record = f'{self._record}-{os.getpid()}-{os.urandom(4).hex()}'
+
+        try:
+            os.replace(self._record, old_record)
+        except FileNotFoundError:
+            old_record = None
+
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.unlink(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+            total -= size
+
+        self._add_to_record(total)
+
+        if old_record is not None:
+            os.unlink(old_record)
+
+        return removed
@@ -0,0 +1,388 @@
+'''
+Contains an implementation of enhanced word-aligned hybrid (EWAH)
+compression.
+
+EWAH splits the bits into chunks of a whole word each, and encodes them as
+marker words followed by literal words. A marker word describes a run of
+chunks that are all clear or all set, followed by a block of literal words
+that are stored as they are. Since a marker gives the number of literal
+words after it, a reader can jump over a whole block without reading it.
+
+Marker word layout, most significant bit first:
+
+1. The bit that is repeated in the run.
+2. The number of chunks in the run, in ``run_bits(word_size)`` bits.
+3. The number of literal words after the marker, in the remaining
+   ``literal_bits(word_size)`` bits.
+
+If the number of bits is not a multiple of the word size, the final chunk is
+padded with zeroes to the right, and the number of bits it holds is returned
+as the final length, as with WAH.
+'''
+
+from bitstring import BitArray
+
+from lib.util import all_bits, pack_words
+
+
+def literal_bits(word_size: int) -> int:
+    '''
+    Returns:
+        the number of bits in the literal count of a marker word.
+    '''
+
+    return (word_size - 1) // 2
+
+
+def run_bits(word_size: int) -> int:
+    '''
+    Returns:
+        the number of bits in the run length of a marker word.
+    '''
+
+    return word_size - 1 - literal_bits(word_size)
+
+
+def _check_word_size(word_size: int):
+    if word_size < 3:
+        raise ValueError('word_size must be at least 3')
+
+
+class _Encoder:
+    '''
+    Builds EWAH words from a sequence of runs and literal words, merging
+    runs and folding clear or set literals into runs so that the result is
+    canonical.
+    '''
+
+    def __init__(self, word_size: int):
+        self.word_size = word_size
+        self.words = []
+
+        self._ones = all_bits(word_size)
+        self._literal_bits = literal_bits(word_size)
+        self._max_run = all_bits(run_bits(word_size))
+        self._max_literals = all_bits(self._literal_bits)
+        self._marker = None     # index of the current marker in ``words``
+        self._bit = False       # bit of the current marker's run
+        self._run = 0           # length of the current marker's run
+        self._literals = 0      # literal words after the current marker
+
+    def _write_marker(self):
+        self.words[self._marker] = \
+            int(self._bit) << (self.word_size - 1) \
+            | self._run << self._literal_bits | self._literals
+
+    def _new_marker(self, bit: bool):
+        self._marker = len(self.words)
+        self._bit, self._run, self._literals = bit, 0, 0
+        self.words.append(0)
+
+    def add_run(self, bit: bool, chunks: int):
+        '''
+        Append ``chunks`` whole words of ``bit``.
+        '''
+
+        while chunks > 0:
+            if self._marker is None or self._literals > 0 \
+                    or (self._run > 0 and self._bit != bit) \
+                    or self._run == self._max_run:
+                self._new_marker(bit)
+
+            self._bit = bit
+            take = min(chunks, self._max_run - self._run)
+            self._run += take
+            chunks -= take
+            self._write_marker()
+
+    def add_literal(self, word: int):
+        '''
+        Append a chunk of bits.
+        '''
+
+        if word == 0 or word == self._ones:
+            self.add_run(word != 0, 1)
+            return
+
+        if self._marker is None or self._literals == self._max_literals:
+            self._new_marker(False)
+
+        self._literals += 1
+        self._write_marker()
+        self.words.append(word)
+
+
+def compress(bs, word_size):
+    '''
+    Compress the given bits with EWAH compression using the specified word
+    size.
+
+    Args:
+        bs: the bits to compress.
+        word_size: the word size used in the algorithm.
+
+    Returns:
+        a tuple ``(compressed, length)``, where ``length`` is the number of
+        bits in the final chunk of ``bs``.
+
+    Raises:
+        ValueError: if ``bs`` is empty or ``word_size`` is less than 3.
+    '''
+
+    if len(bs) == 0:
+        raise ValueError('bs must have a length greater than 0')
+
+    _check_word_size(word_size)
+
+    encoder = _Encoder(word_size)
+    final_length = len(bs) % word_size or word_size
+    padded = bs + BitArray(word_size - final_length)
+
+    for chunk in padded.cut(word_size):
+        encoder.add_literal(chunk.uint)
+
+    return pack_words(encoder.words, word_size), final_length
+
+
+def iter_markers(bs, word_size):
+    '''
+    Iterate over the marker words of EWAH-compressed bits, skipping over the
+    literal words between them.
+
+    Args:
+        bs: the compressed bits.
+        word_size: the word size used.
+
+    Returns:
+        a generator of tuples ``(bit, run, start, literals)``, where ``run``
+        is the number of chunks of ``bit`` in the run, and ``literals`` is
+        the number of literal words starting at word ``start``.
+
+    Raises:
+        ValueError: if ``bs`` is not validly encoded.
+    '''
+
+    _check_word_size(word_size)
+
+    if len(bs) % word_size != 0:
+        raise ValueError('Invalid data format')
+
+    word_count = len(bs) // word_size
+    lit_bits = literal_bits(word_size)
+    i = 0
+
+    while i < word_count:
+        marker = bs[i * word_size:(i + 1) * word_size].uint
+        literals = marker & all_bits(lit_bits)
+        run = marker >> lit_bits & all_bits(run_bits(word_size))
+
+        if i + 1 + literals > word_count:
+            raise ValueError('Invalid data format')
+
+        yield bool(marker >> (word_size - 1)), run, i + 1, literals
+        i += 1 + literals
+
+
+def _word(bs, i: int, word_size: int) -> int:
+    return bs[i * word_size:(i + 1) * word_size].uint
+
+
+def iter_words(bs, final_length, word_size):
+    '''
+    Iterate over the chunks of EWAH-compressed bits without expanding runs.
+
+    Args:
+        bs: the compressed bits.
+        final_length: the number of bits in the final chunk.
+        word_size: the word size used.
+
+    Returns:
+        a generator of tuples ``(is_run, value, length)`` in the same format
+        as ``wah.iter_words()``, with the padding of the final chunk removed.
+    '''
+
+    markers = list(iter_markers(bs, word_size))
+    padding = word_size - final_length
+
+    for n, (bit, run, start, literals) in enumerate(markers):
+        last = n == len(markers) - 1
+
+        if run > 0:
+            length = run * word_size
+
+            if last and literals == 0:
+                # the padded final chunk is in this run, which must be clear
+                length -= padding
+
+            yield True, bit, length
+
+        for i in range(start, start + literals):
+            if last and i == start + literals - 1:
+                yield False, _word(bs, i, word_size) >> padding, \
+                    final_length
+            else:
+                yield False, _word(bs, i, word_size), word_size
+
+
+def decompress(bs, final_length, word_size):
+    '''
+    Decompress the given EWAH-compressed bits with the specified word size.
+    This is the inverse of ``compress()``.
+
+    Args:
+        bs: the bits to decompress.
+        final_length: the number of bits in the final chunk.
+        word_size: the word size used.
+
+    Raises:
+        ValueError: if ``bs`` is empty or not validly encoded.
+    '''
+
+    if len(bs) == 0:
+        raise ValueError('bs must have a length greater than 0')
+    elif not 1 <= final_length <= word_size:
+        raise ValueError('final_length must be between 1 and word_size, '
+                         'inclusive')
+
+    parts = []
+
+    for is_run, value, length in iter_words(bs, final_length, word_size):
+        if is_run:
+            parts.append('1' * length if value else '0' * length)
+        else:
+            parts.append(format(value, f'0{length}b'))
+
+    return BitArray(bin=''.join(parts))
+
+
+def count(bs, final_length, word_size) -> int:
+    '''
+    Count the set bits in EWAH-compressed bits without decompressing them.
+
+    Args:
+        bs: the compressed bits.
+        final_length: the number of bits in the final chunk.
+        word_size: the word size used.
+
+    Returns:
+        the number of set bits.
+    '''
+
+    total = 0
+
+    for bit, run, start, literals in iter_markers(bs, word_size):
+        total += run * word_size if bit else 0
+
+        for i in range(start, start + literals):
+            total += bin(_word(bs, i, word_size)).count('1')
+
+    return total
+
+
+class _Cursor:
+    '''
+    A position in EWAH-compressed bits, counted in chunks, that can move
+    over runs and literal blocks without reading each word.
+    '''
+
+    def __init__(self, bs, word_size: int):
+        self._bs = bs
+        self._word_size = word_size
+        self._markers = iter_markers(bs, word_size)
+        self.bit = False        # bit of the current run
+        self.run = 0            # chunks left in the current run
+        self.start = 0          # index of the next literal word
+        self.literals = 0       # literal words left in the current block
+        self._next_marker()
+
+    def _next_marker(self):
+        while self.run == 0 and self.literals == 0:
+            marker = next(self._markers, None)
+
+            if marker is None:
+                return
+
+            self.bit, self.run, self.start, self.literals = marker
+
+    def done(self) -> bool:
+        return self.run == 0 and self.literals == 0
+
+    def skip(self, chunks: int):
+        '''
+        Move forward by ``chunks``, which must not be more than the chunks
+        left in the current run or literal block.
+        '''
+
+        if self.run > 0:
+            self.run -= chunks
+        else:
+            self.start += chunks
+            self.literals -= chunks
+
+        self._next_marker()
+
+    def literal(self) -> int:
+        return _word(self._bs, self.start, self._word_size)
+
+    def available(self) -> int:
+        '''
+        Returns:
+            the chunks left in the current run or literal block.
+        '''
+
+        return self.run if self.run > 0 else self.literals
+
+
+def intersect(a, b, word_size):
+    '''
+    AND two EWAH-compressed bitmaps of the same length without decompressing
+    them. Wherever one bitmap has a clear run, the other's words are skipped
+    without being read, including whole blocks of literal words.
+
+    Args:
+        a: a tuple ``(compressed, length)`` as returned by ``compress()``.
+        b: a tuple ``(compressed, length)`` as returned by ``compress()``.
+        word_size: the word size used.
+
+    Returns:
+        a tuple ``(compressed, length)`` holding the AND of the bitmaps.
+
+    Raises:
+        ValueError: if the bitmaps have different lengths.
+    '''
+
+    if a[1] != b[1]:
+        raise ValueError('bitmaps must have the same length')
+
+    x, y = _Cursor(a[0], word_size), _Cursor(b[0], word_size)
+    encoder = _Encoder(word_size)
+
+    while not x.done() and not y.done():
+        n = min(x.available(), y.available())
+
+        if x.run > 0 and y.run > 0:
+            encoder.add_run(x.bit and y.bit, n)
+            x.skip(n)
+            y.skip(n)
+        elif (x.run > 0 and not x.bit) or (y.run > 0 and not y.bit):
+            encoder.add_run(False, n)
+            x.skip(n)
+            y.skip(n)
+        elif x.run > 0 or y.run > 0:
+            # one side is a set run, so the other side's literals are kept
+            run, source = (x, y) if x.run > 0 else (y, x)
+
+            for _ in range(n):
+                encoder.add_literal(source.literal())
+                source.skip(1)
+
+            run.skip(n)
+        else:
+            encoder.add_literal(x.literal() & y.literal())
+            x.skip(1)
+            y.skip(1)
+
+    if not x.done() or not y.done():
+        raise ValueError('bitmaps must have the same length')
+
+    return pack_words(encoder.words, word_size), a[1]
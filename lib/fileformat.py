@@ -0,0 +1,125 @@
+'''
+Contains a self-describing file format for compressed bitmaps. A file holds a
+fixed-size header followed by the compressed bits, padded with zeroes to a
+whole number of bytes. The header records everything needed to decompress
+the bits, such as the WAH word size and final word length.
+
+Header layout (8 bytes):
+
+1. Magic bytes ``b'WBC'``.
+2. Format version.
+3. Algorithm: ``b'W'`` for WAH or ``b'B'`` for BBC.
+4. WAH word size (0 for BBC).
+5. WAH final word length (0 for BBC).
+6. Number of padding bits after the compressed bits.
+
+This module does not import ``bitstring`` unless ``loads()`` is called, so
+that ``lib.core`` callers can read and write the format without it.
+'''
+
+
+magic = b'WBC'
+version = 1
+header_size = 8
+
+algorithm_codes = {'WAH': b'W', 'BBC': b'B'}
+
+
+def dumps(compressed,
+          algorithm: str,
+          word_size: int = 0,
+          final_length: int = 0,
+          length: int = None) \
+        -> bytes:
+    '''
+    Serialize compressed bits.
+
+    Args:
+        compressed: the compressed bits, as a ``BitArray`` or a bytes-like
+                    object.
+        algorithm: ``'WAH'`` or ``'BBC'``.
+        word_size: the word size used, if the algorithm is WAH.
+        final_length: the number of bits used in the final word of
+                      ``compressed``, if the algorithm is WAH.
+        length: the number of compressed bits in ``compressed``, if it is
+                bytes-like and its last byte is padded.
+
+    Returns:
+        the header followed by ``compressed``.
+
+    Raises:
+        ValueError: if ``algorithm`` is not recognized.
+    '''
+
+    if algorithm not in algorithm_codes:
+        raise ValueError(f'Unrecognized algorithm: {algorithm}')
+
+    if isinstance(compressed, (bytes, bytearray, memoryview)):
+        data = bytes(compressed)
+        padding = 0 if length is None else len(data) * 8 - length
+    else:
+        # ``tobytes()`` pads with zeroes to a whole byte
+        data = compressed.tobytes()
+        padding = -len(compressed) % 8
+
+    header = magic + bytes([version]) + algorithm_codes[algorithm] \
+        + bytes([word_size, final_length, padding])
+
+    return header + data
+
+
+def parse(data: bytes):
+    '''
+    Deserialize compressed bits as bytes, without copying them.
+
+    Args:
+        data: the serialized bits.
+
+    Returns:
+        a tuple ``(algorithm, compressed, length, word_size, final_length)``,
+        where ``compressed`` is a ``memoryview`` of the bytes holding the
+        compressed bits and ``length`` is the number of bits in them.
+
+    Raises:
+        ValueError: if ``data`` is not in this format or has an unsupported
+                    version.
+    '''
+
+    if len(data) < header_size or data[:len(magic)] != magic:
+        raise ValueError('Invalid data format')
+    elif data[3] != version:
+        raise ValueError(f'Unsupported format version: {data[3]}')
+
+    codes = {code: name for name, code in algorithm_codes.items()}
+    algorithm = codes.get(bytes(data[4:5]))
+    word_size, final_length, padding = data[5], data[6], data[7]
+    compressed = memoryview(data)[header_size:]
+    length = len(compressed) * 8 - padding
+
+    if algorithm is None or length < 0:
+        raise ValueError('Invalid data format')
+
+    return algorithm, compressed, length, word_size, final_length
+
+
+def loads(data: bytes):
+    '''
+    Deserialize compressed bits. This is the inverse of ``dumps()``.
+
+    Args:
+        data: the serialized bits.
+
+    Returns:
+        a tuple ``(algorithm, compressed, word_size, final_length)``.
+
+    Raises:
+        ValueError: if ``data`` is not in this format or has an unsupported
+                    version.
+    '''
+
+    from bitstring import BitArray
+
+    algorithm, compressed, length, word_size, final_length = parse(data)
+    compressed = BitArray(bytes=bytes(compressed), length=length)
+
+    return algorithm, compressed, word_size, final_length
@@ -0,0 +1,352 @@
+'''
+Contains a bitmap index over the rows of a table, with one compressed bitmap
+for each value of each column.
+
+Fills and gaps only save space where equal bits are next to each other, and
+rows in their original order rarely give long runs. ``BitmapIndex.build()``
+can first sort the rows so that rows with equal values end up together:
+
+* ``'lexicographic'`` sorts the rows by their values, the first column
+  first. Putting the columns with the fewest values first gives the longest
+  runs.
+* ``'gray'`` sorts the rows by the reflected Gray code rank of their bits
+  across every bitmap of the index, so that neighbouring rows differ in as
+  few bitmaps as possible. Unlike a lexicographic sort, this also lengthens
+  runs in the bitmaps of the later columns.
+
+The permutation is kept with the index, and query results are mapped back to
+the original row ids.
+'''
+
+import json
+import sys
+
+from array import array
+from bisect import bisect_left
+
+import lib.wah as wah
+import lib.bbc as bbc
+
+from lib.store import Store, StoreWriter
+
+
+bits_per_byte = 8
+
+orders = ['lexicographic', 'gray']
+
+
+def _ranks(rows, column_count):
+    '''
+    Returns:
+        a tuple ``(values, ranks)``, where ``values`` lists the sorted
+        distinct values of each column, and ``ranks`` gives the position in
+        ``values`` of each value of each row.
+    '''
+
+    values = [sorted({row[c] for row in rows}) for c in range(column_count)]
+    ranks = [tuple(bisect_left(values[c], row[c])
+                   for c in range(column_count)) for row in rows]
+
+    return values, ranks
+
+
+def _gray_rank(code: int) -> int:
+    '''
+    Returns:
+        the position of ``code`` in the reflected Gray code sequence.
+    '''
+
+    shift = 1
+
+    while code >> shift:
+        code ^= code >> shift
+        shift <<= 1
+
+    return code
+
+
+def lexicographic_order(rows):
+    '''
+    Returns:
+        a list of the indices of ``rows`` in lexicographic order of their
+        values.
+    '''
+
+    if not rows:
+        return []
+
+    _, ranks = _ranks(rows, len(rows[0]))
+    return sorted(range(len(rows)), key=ranks.__getitem__)
+
+
+def gray_order(rows):
+    '''
+    Returns:
+        a list of the indices of ``rows`` in reflected Gray code order of
+        their bits across the bitmaps of an index over them. The bitmaps are
+        ordered by column, then by value.
+    '''
+
+    if not rows:
+        return []
+
+    values, ranks = _ranks(rows, len(rows[0]))
+    offsets = []
+    total = 0
+
+    for column_values in values:
+        offsets.append(total)
+        total += len(column_values)
+
+    def key(i):
+        code = 0
+
+        for offset, rank in zip(offsets, ranks[i]):
+            code |= 1 << (total - 1 - offset - rank)
+
+        return _gray_rank(code)
+
+    return sorted(range(len(rows)), key=key)
+
+
+order_functions = {
+    'lexicographic': lexicographic_order,
+    'gray': gray_order,
+}
+
+
+def encode_positions(positions, length, algorithm, word_size):
+    '''
+    Returns:
+        the compressed bitmap of ``length`` bits with the given sorted
+        positions set, in the format taken by ``wah.intersect_many()`` or
+        ``bbc.intersect_many()``.
+    '''
+
+    if algorithm == 'WAH':
+        return wah.from_positions(positions, length, word_size)
+    else:
+        return bbc.from_positions(positions, length)
+
+
+class BitmapIndex:
+    '''
+    A compressed bitmap index over the rows of a table.
+    '''
+
+    def __init__(self, columns, bitmaps, permutation, algorithm='WAH',
+                 word_size=32):
+        '''
+        Use ``build()`` or ``load()`` to create an index.
+
+        Args:
+            columns: the names of the columns.
+            bitmaps: a dict mapping each column name to a dict from each
+                     value to its compressed bitmap.
+            permutation: the original id of each row, in the order that the
+                         bitmaps are compressed in.
+            algorithm: ``'WAH'`` or ``'BBC'``.
+            word_size: the word size used, if the algorithm is WAH.
+        '''
+
+        self.columns = list(columns)
+        self.bitmaps = bitmaps
+        self.permutation = permutation
+        self.algorithm = algorithm
+        self.word_size = word_size
+
+    @classmethod
+    def build(cls, rows, columns=None, order=None, algorithm='WAH',
+              word_size=32):
+        '''
+        Build an index over a table.
+
+        Args:
+            rows: the rows of the table, as sequences with one value per
+                  column. The values of each column must be sortable.
+            columns: the names of the columns (default: their indices).
+            order: ``None`` to keep the rows in order, or one of ``orders``
+                   to sort them before compressing.
+            algorithm: ``'WAH'`` or ``'BBC'``.
+            word_size: the word size used, if the algorithm is WAH.
+
+        Raises:
+            ValueError: if ``rows`` is empty, ``order`` or ``algorithm`` is
+                        not recognized, or a row has the wrong length.
+        '''
+
+        if len(rows) == 0:
+            raise ValueError('rows must not be empty')
+        elif order is not None and order not in order_functions:
+            raise ValueError(f'Unrecognized order: {order}')
+        elif algorithm not in ('WAH', 'BBC'):
+            raise ValueError(f'Unrecognized algorithm: {algorithm}')
+
+        columns = list(range(len(rows[0])) if columns is None else columns)
+
+        if any(len(row) != len(columns) for row in rows):
+            raise ValueError('every row must have one value per column')
+
+        if order is None:
+            permutation = array('Q', range(len(rows)))
+        else:
+            permutation = array('Q', order_functions[order](rows))
+
+        # BBC bitmaps are whole bytes, so pad them with unset rows
+        length = len(rows)
+
+        if algorithm == 'BBC':
+            length += -length % bits_per_byte
+
+        bitmaps = {}
+
+        for c, column in enumerate(columns):
+            positions = {}
+
+            for position, row_id in enumerate(permutation):
+                positions.setdefault(rows[row_id][c], []).append(position)
+
+            bitmaps[column] = {
+                value: encode_positions(positions[value], length, algorithm,
+                                        word_size)
+                for value in sorted(positions)}
+
+        return cls(columns, bitmaps, permutation, algorithm, word_size)
+
+    def __len__(self):
+        return len(self.permutation)
+
+    def size(self) -> int:
+        '''
+        Returns:
+            the total number of bits in the compressed bitmaps.
+        '''
+
+        total = 0
+
+        for column_bitmaps in self.bitmaps.values():
+            for bitmap in column_bitmaps.values():
+                total += len(bitmap[0] if self.algorithm == 'WAH' else bitmap)
+
+        return total
+
+    def _matches(self, column, values):
+        bitmaps = [self.bitmaps[column][value] for value in values
+                   if value in self.bitmaps[column]]
+
+        if not bitmaps:
+            return None
+        elif self.algorithm == 'WAH':
+            return wah.union_many(bitmaps, self.word_size)
+        else:
+            return bbc.union_many(bitmaps)
+
+    def query(self, conditions):
+        '''
+        Find the rows that match every condition.
+
+        Args:
+            conditions: a dict mapping column names to a value, or to a list,
+                        set or tuple of values that the column may take.
+
+        Returns:
+            a sorted list of the original ids of the matching rows.
+
+        Raises:
+            KeyError: if a column is not in the index.
+        '''
+
+        bitmaps = []
+
+        for column, values in conditions.items():
+            if not isinstance(values, (list, set, frozenset, tuple)):
+                values = [values]
+
+            bitmap = self._matches(column, values)
+
+            if bitmap is None:
+                return []
+
+            bitmaps.append(bitmap)
+
+        if not bitmaps:
+            return sorted(self.permutation)
+        elif self.algorithm == 'WAH':
+            bits = wah.decompress(*wah.intersect_many(bitmaps,
+                                                      self.word_size),
+                                  self.word_size)
+        else:
+            bits = bbc.decompress(bbc.intersect_many(bitmaps))
+
+        return sorted(self.permutation[i] for i in bits.findall([1])
+                      if i < len(self.permutation))
+
+    def save(self, path: str):
+        '''
+        Write the bitmaps to a store at ``path`` (see ``lib.store``), and
+        the permutation next to it at ``path + '.perm'``. Column names and
+        values must be representable in JSON.
+        '''
+
+        with StoreWriter(path) as writer:
+            for column, column_bitmaps in self.bitmaps.items():
+                for value, bitmap in column_bitmaps.items():
+                    key = json.dumps([column, value])
+
+                    if self.algorithm == 'WAH':
+                        writer.add(key, bitmap[0], 'WAH', self.word_size,
+                                   bitmap[1])
+                    else:
+                        writer.add(key, bitmap, 'BBC')
+
+        permutation = array('Q', self.permutation)
+
+        # store big-endian, like the bitmaps
+        if sys.byteorder == 'little':
+            permutation.byteswap()
+
+        with open(f'{path}.perm', 'wb') as f:
+            permutation.tofile(f)
+
+    @classmethod
+    def load(cls, path: str):
+        '''
+        Read an index written by ``save()``.
+
+        Raises:
+            ValueError: if the files are not a valid index.
+        '''
+
+        with open(f'{path}.perm', 'rb') as f:
+            data = f.read()
+
+        permutation = array('Q')
+
+        if len(data) % permutation.itemsize != 0:
+            raise ValueError('Invalid permutation format')
+
+        permutation.frombytes(data)
+
+        if sys.byteorder == 'little':
+            permutation.byteswap()
+
+        columns = []
+        bitmaps = {}
+        algorithm, word_size = 'WAH', 32
+
+        with Store(path) as store:
+            for key in store:
+                column, value = json.loads(key)
+                algorithm, compressed, word_size, final_length = \
+                    store.load(key)
+
+                if column not in bitmaps:
+                    columns.append(column)
+                    bitmaps[column] = {}
+
+                if algorithm == 'WAH':
+                    bitmaps[column][value] = (compressed, final_length)
+                else:
+                    bitmaps[column][value] = compressed
+
+        return cls(columns, bitmaps, permutation, algorithm, word_size)
@@ -0,0 +1,216 @@
+'''
+Contains an implementation of position list word-aligned hybrid (PLWAH)
+compression, a variant of WAH for sparse bitmaps.
+
+PLWAH words are laid out like WAH words (see ``lib.wah``), except that fill
+words give up some of their run length bits to hold a position. A literal
+that follows a fill and differs from the fill's bit in exactly one place is
+folded into the fill: the position field holds the index, counting from 1 at
+the most significant bit, of the bit that differs. A position of 0 means
+that no literal was folded in. A sparse bitmap then costs one word per set
+bit instead of two.
+
+Fill word layout, most significant bit first:
+
+1. A 1 bit, marking the word as a fill.
+2. The bit that is repeated.
+3. The position of the folded literal's differing bit, in
+   ``position_bits(word_size)`` bits.
+4. The number of sections in the run, in the remaining bits.
+
+As in WAH, a trailing partial literal is stored in the most significant bits
+of the final word, and is never folded into a fill.
+'''
+
+from bitstring import BitArray
+
+import lib.wah as wah
+
+from lib.util import all_bits, pack_words
+
+
+def position_bits(word_size: int) -> int:
+    '''
+    Returns:
+        the number of bits in the position field of a fill word.
+    '''
+
+    return (word_size - 1).bit_length()
+
+
+def _check_word_size(word_size: int):
+    if word_size - 2 - position_bits(word_size) < 1:
+        raise ValueError('word_size must be at least 6')
+
+
+def compress(bs, word_size):
+    '''
+    Compress the given bits with PLWAH compression using the specified word
+    size.
+
+    Args:
+        bs: the bits to compress.
+        word_size: the word size used in the algorithm.
+
+    Returns:
+        a tuple ``(compressed, length)`` in the same format as the result of
+        ``wah.compress()``.
+
+    Raises:
+        ValueError: if ``bs`` is empty or ``word_size`` is less than 6.
+    '''
+
+    if len(bs) == 0:
+        raise ValueError('bs must have a length greater than 0')
+
+    _check_word_size(word_size)
+
+    section_size = word_size - 1
+    count_bits = word_size - 2 - position_bits(word_size)
+    max_count = all_bits(count_bits)
+
+    # the WAH encoding has the same runs and literals, with longer runs
+    bitmap = wah.Bitmap(word_size)
+    bitmap.extend(bs)
+    compressed, final_length = bitmap.compressed()
+    tokens = list(wah.iter_words(compressed, final_length, word_size))
+
+    words = []
+    i = 0
+
+    while i < len(tokens):
+        is_run, value, length = tokens[i]
+        i += 1
+
+        if not is_run:
+            # pad a trailing partial literal to the right
+            words.append(value << (section_size - length))
+            continue
+
+        sections = length // section_size
+        fill = 1 << section_size | int(value) << (word_size - 2)
+
+        while sections > max_count:
+            words.append(fill | max_count)
+            sections -= max_count
+
+        position = 0
+
+        if i < len(tokens) and not tokens[i][0] \
+                and tokens[i][2] == section_size:
+            dirty = tokens[i][1] ^ (all_bits(section_size) if value else 0)
+
+            if dirty and dirty & (dirty - 1) == 0:
+                position = section_size - (dirty.bit_length() - 1)
+                i += 1
+
+        words.append(fill | position << count_bits | sections)
+
+    return pack_words(words, word_size), final_length
+
+
+def iter_words(bs, final_length, word_size):
+    '''
+    Iterate over the words of PLWAH-compressed bits without expanding runs.
+
+    Args:
+        bs: the compressed bits.
+        final_length: the number of bits used in the final word of ``bs``.
+        word_size: the word size used.
+
+    Returns:
+        a generator of tuples ``(is_run, value, length)`` in the same format
+        as ``wah.iter_words()``. A fill with a folded literal yields a run
+        followed by the literal.
+
+    Raises:
+        ValueError: if ``bs`` is not a whole number of words or ``word_size``
+                    is less than 6.
+    '''
+
+    _check_word_size(word_size)
+
+    if len(bs) % word_size != 0:
+        raise ValueError('Invalid data format')
+
+    section_size = word_size - 1
+    count_bits = word_size - 2 - position_bits(word_size)
+    word_count = len(bs) // word_size
+
+    for i, word in enumerate(bs.cut(word_size)):
+        word = word.uint
+
+        if word >> section_size:
+            bit = bool(word >> (word_size - 2) & 1)
+            position = word >> count_bits & all_bits(position_bits(word_size))
+            sections = word & all_bits(count_bits)
+
+            if sections > 0:
+                yield True, bit, sections * section_size
+
+            if position > section_size:
+                raise ValueError('Invalid data format')
+            elif position > 0:
+                literal = all_bits(section_size) if bit else 0
+                yield False, literal ^ 1 << (section_size - position), \
+                    section_size
+        elif i == word_count - 1:
+            yield False, word >> (word_size - final_length) \
+                & all_bits(final_length - 1), final_length - 1
+        else:
+            yield False, word, section_size
+
+
+def decompress(bs, final_length, word_size):
+    '''
+    Decompress the given PLWAH-compressed bits with the specified word size.
+    This is the inverse of ``compress()``.
+
+    Args:
+        bs: the bits to decompress.
+        final_length: the number of bits used in the final word of ``bs``.
+        word_size: the word size used.
+
+    Raises:
+        ValueError: if ``bs`` is empty or not validly encoded.
+    '''
+
+    if len(bs) == 0:
+        raise ValueError('bs must have a length greater than 0')
+    elif not 1 <= final_length <= word_size:
+        raise ValueError('final_length must be between 1 and word_size, '
+                         'inclusive')
+
+    parts = []
+
+    for is_run, value, length in iter_words(bs, final_length, word_size):
+        if is_run:
+            parts.append('1' * length if value else '0' * length)
+        elif length > 0:
+            parts.append(format(value, f'0{length}b'))
+
+    return BitArray(bin=''.join(parts))
+
+
+def count(bs, final_length, word_size) -> int:
+    '''
+    Count the set bits in PLWAH-compressed bits without decompressing them.
+
+    Args:
+        bs: the compressed bits.
+        final_length: the number of bits used in the final word of ``bs``.
+        word_size: the word size used.
+
+    Returns:
+        the number of set bits.
+    '''
+
+    total = 0
+
+    for is_run, value, length in iter_words(bs, final_length, word_size):
+        if is_run:
+            total += length if value else 0
+        else:
+            total += bin(value).count('1')
+
+    return total
@@ -0,0 +1,439 @@
+'''
+Contains an asyncio compression service that serves requests over a Unix
+socket, along with the protocol shared with ``lib.client``.
+
+Every message is a frame: a 4-byte big-endian length followed by that many
+bytes of payload. A payload is a 4-byte big-endian header length, a JSON
+header, and a binary body holding the operands back to back.
+
+Request headers have the fields:
+
+* ``op``: one of ``compress``, ``decompress``, ``count``, ``union`` or
+  ``intersect``.
+* ``sizes``: the size in bytes of each operand in the body.
+* ``algorithm`` and ``word_size``: the codec to compress with (``compress``
+  only).
+
+Operands of ``compress`` are raw bytes; every other operand is compressed
+data in the format of ``lib.fileformat``. Responses have ``ok`` set to
+``true`` and carry the result in the body (or ``count`` in the header), or
+have ``ok`` set to ``false`` and an ``error`` message.
+
+Requests are queued and handed to a process pool in batches, so that many
+small requests share the cost of crossing the process boundary. When the
+queue is full, connections stop being read until it drains. A frame larger
+than the server's ``max_message_size`` gets an error response, and its
+connection is closed. Requests to decompress more than ``max_response_size``
+bytes fail without being decompressed. If a worker process dies, its batch
+fails and the process pool is replaced.
+'''
+
+import asyncio
+import json
+import logging
+import os
+import struct
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from bitstring import BitArray
+
+import lib.fileformat as fileformat
+import lib.wah as wah
+import lib.bbc as bbc
+
+from lib.core import bits_per_byte, iter_atoms
+
+
+length_format = '>I'
+length_size = struct.calcsize(length_format)
+
+
+def pack_message(header: dict, body: bytes = b'') -> bytes:
+    '''
+    Returns:
+        a frame holding ``header`` and ``body``.
+    '''
+
+    header_bytes = json.dumps(header).encode()
+    payload = struct.pack(length_format, len(header_bytes)) \
+        + header_bytes + body
+
+    return struct.pack(length_format, len(payload)) + payload
+
+
+def unpack_message(payload: bytes):
+    '''
+    Split the payload of a frame into its header and body.
+
+    Returns:
+        a tuple ``(header, body)``.
+
+    Raises:
+        ValueError: if ``payload`` is malformed.
+    '''
+
+    if len(payload) < length_size:
+        raise ValueError('Invalid message format')
+
+    header_size, = struct.unpack_from(length_format, payload)
+    header_end = length_size + header_size
+
+    if header_end > len(payload):
+        raise ValueError('Invalid message format')
+
+    header = json.loads(payload[length_size:header_end])
+    return header, payload[header_end:]
+
+
+def split_operands(header: dict, body: bytes):
+    '''
+    Returns:
+        the list of operands in ``body``, split by ``header['sizes']``.
+
+    Raises:
+        ValueError: if the sizes are not a list of non-negative integers
+                    that add up to the length of ``body``.
+    '''
+
+    sizes = header.get('sizes', [len(body)])
+
+    if not isinstance(sizes, list) or \
+            not all(isinstance(size, int) and size >= 0 for size in sizes):
+        raise ValueError('Operand sizes must be a list of non-negative '
+                         'integers')
+
+    if sum(sizes) != len(body):
+        raise ValueError('Operand sizes do not match the message body')
+
+    operands, pos = [], 0
+
+    for size in sizes:
+        operands.append(body[pos:pos + size])
+        pos += size
+
+    return operands
+
+
+def _merge(operands, is_union):
+    '''
+    OR or AND compressed operands, which must use the same codec.
+    '''
+
+    loaded = [fileformat.loads(operand) for operand in operands]
+
+    if not loaded:
+        raise ValueError('At least one operand is required')
+
+    algorithm, _, word_size, _ = loaded[0]
+
+    if any((a, ws) != (algorithm, word_size) for a, _, ws, _ in loaded):
+        raise ValueError('Operands must use the same algorithm and word size')
+
+    if algorithm == 'WAH':
+        merge = wah.union_many if is_union else wah.intersect_many
+        bitmaps = [(bs, final_length) for _, bs, _, final_length in loaded]
+        compressed, final_length = merge(bitmaps, word_size)
+        return fileformat.dumps(compressed, algorithm, word_size, final_length)
+    else:
+        merge = bbc.union_many if is_union else bbc.intersect_many
+        compressed = merge([bs for _, bs, _, _ in loaded])
+        return fileformat.dumps(compressed, algorithm)
+
+
+def _decompressed_size(algorithm, bs, word_size, final_length) -> int:
+    '''
+    Returns:
+        the number of bits in a compressed bitmap, found without
+        decompressing it.
+    '''
+
+    if algorithm == 'WAH':
+        return sum(size for _, _, size in wah.iter_words(bs, final_length,
+                                                         word_size))
+    else:
+        return sum(gaps + len(body) for gaps, body in iter_atoms(bs.bytes)) \
+            * bits_per_byte
+
+
+def handle(header: dict, body: bytes, max_response_size=None):
+    '''
+    Handle a single request. Errors are reported in the response, so that
+    one bad request does not fail the others in its batch.
+
+    Args:
+        header: the request header.
+        body: the request body.
+        max_response_size: the largest number of bytes a request may
+                           decompress to (default: no limit).
+
+    Returns:
+        a tuple ``(header, body)`` holding the response.
+    '''
+
+    try:
+        if not isinstance(header, dict):
+            raise ValueError('The message header must be an object')
+
+        op = header.get('op')
+        operands = split_operands(header, body)
+
+        if op == 'compress':
+            algorithm = header.get('algorithm')
+            word_size = header.get('word_size', 8)
+
+            if not isinstance(word_size, int):
+                raise ValueError(f'Invalid word size: {word_size!r}')
+
+            bs = BitArray(bytes=operands[0])
+
+            if algorithm == 'WAH':
+                compressed, final_length = wah.compress(bs, word_size)
+                result = fileformat.dumps(compressed, algorithm, word_size,
+                                          final_length)
+            elif algorithm == 'BBC':
+                result = fileformat.dumps(bbc.compress(bs), algorithm)
+            else:
+                raise ValueError(f'Unrecognized algorithm: {algorithm}')
+
+            return {'ok': True}, result
+        elif op in ('decompress', 'count'):
+            algorithm, bs, word_size, final_length = \
+                fileformat.loads(operands[0])
+
+            if op == 'count' and algorithm == 'WAH':
+                return {'ok': True,
+                        'count': wah.count(bs, final_length, word_size)}, b''
+            elif op == 'count':
+                return {'ok': True, 'count': bbc.count(bs)}, b''
+
+            if max_response_size is not None:
+                size = -(-_decompressed_size(algorithm, bs, word_size,
+                                             final_length) // bits_per_byte)
+
+                if size > max_response_size:
+                    raise ValueError(f'Decompressed size of {size} bytes '
+                                     'exceeds the limit of '
+                                     f'{max_response_size} bytes')
+
+            if algorithm == 'WAH':
+                bits = wah.decompress(bs, final_length, word_size)
+            else:
+                bits = bbc.decompress(bs)
+
+            padding = -len(bits) % 8
+            return {'ok': True, 'bits': len(bits)}, \
+                (bits + BitArray(padding)).bytes
+        elif op in ('union', 'intersect'):
+            return {'ok': True}, _merge(operands, op == 'union')
+        else:
+            raise ValueError(f'Unrecognized operation: {op}')
+    except (ValueError, IndexError) as e:
+        return {'ok': False, 'error': str(e)}, b''
+    except Exception as e:
+        logging.exception('Request failed')
+        return {'ok': False, 'error': f'{type(e).__name__}: {e}'}, b''
+
+
+def handle_batch(requests, max_response_size=None):
+    '''
+    Handle a batch of requests. This is the unit of work handed to each
+    worker process.
+
+    Args:
+        requests: a list of tuples ``(header, body)``.
+        max_response_size: as for ``handle()``.
+
+    Returns:
+        the list of responses, in the same order.
+    '''
+
+    return [handle(header, body, max_response_size)
+            for header, body in requests]
+
+
+class Server:
+    '''
+    An asyncio server that answers compression requests on a Unix socket.
+    '''
+
+    def __init__(self, path: str, jobs=None, queue_size: int = 1024,
+                 batch_size: int = 64, max_message_size: int = 1 << 26,
+                 max_response_size: int = 1 << 26):
+        '''
+        Args:
+            path: the path of the Unix socket to listen on.
+            jobs: the number of worker processes (default: one per core).
+            queue_size: the number of requests that may wait for a worker
+                        before connections stop being read.
+            batch_size: the largest number of requests sent to a worker at
+                        once.
+            max_message_size: the size in bytes of the largest frame
+                              payload that is accepted (default: 64 MiB).
+            max_response_size: the largest number of bytes that a request
+                               may decompress to (default: 64 MiB).
+        '''
+
+        self.path = path
+        self.jobs = jobs or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_message_size = max_message_size
+        self.max_response_size = max_response_size
+
+        self._queue = None
+        self._executor = None
+        self._server = None
+        self._dispatcher = None
+        self._connections = set()
+        self._batches = set()
+
+    async def _handle_connection(self, reader, writer):
+        '''
+        Read requests from a connection and write their responses in order.
+        '''
+
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        self._connections.add(task)
+
+        try:
+            while True:
+                try:
+                    prefix = await reader.readexactly(length_size)
+                except asyncio.IncompleteReadError:
+                    break
+
+                size, = struct.unpack(length_format, prefix)
+
+                if size > self.max_message_size:
+                    writer.write(pack_message({
+                        'ok': False,
+                        'error': f'Message of {size} bytes exceeds the limit '
+                                 f'of {self.max_message_size} bytes'}))
+                    await writer.drain()
+                    break
+
+                payload = await reader.readexactly(size)
+
+                try:
+                    request = unpack_message(payload)
+                except ValueError as e:
+                    writer.write(pack_message({'ok': False,
+                                               'error': str(e)}))
+                    break
+
+                # waits while the queue is full, which stops this connection
+                # from being read
+                future = loop.create_future()
+                await self._queue.put((request, future))
+
+                header, body = await future
+                writer.write(pack_message(header, body))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logging.info('Connection closed: %s', e)
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _run_batch(self, batch, slots):
+        '''
+        Handle a batch of queued requests in the process pool.
+        '''
+
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+
+        try:
+            requests = [request for request, _ in batch]
+            responses = await loop.run_in_executor(
+                executor, handle_batch, requests, self.max_response_size)
+        except BrokenProcessPool as e:
+            # a worker died, which leaves the pool unusable; batches that
+            # were in flight in it fail, and later ones go to a new pool
+            logging.error('Worker process died: %s', e)
+            responses = [({'ok': False, 'error': 'Worker process died'},
+                          b'')] * len(batch)
+
+            if executor is self._executor:
+                self._executor = ProcessPoolExecutor(self.jobs)
+                executor.shutdown(wait=False)
+        except Exception as e:
+            logging.exception('Batch failed')
+            responses = [({'ok': False, 'error': str(e)}, b'')] * len(batch)
+        finally:
+            slots.release()
+
+        for (_, future), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
+
+    async def _dispatch(self):
+        '''
+        Take batches of requests off the queue and hand them to the process
+        pool, keeping at most one batch in flight per worker.
+        '''
+
+        slots = asyncio.Semaphore(self.jobs)
+
+        while True:
+            batch = [await self._queue.get()]
+
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            await slots.acquire()
+            task = asyncio.ensure_future(self._run_batch(batch, slots))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def start(self):
+        '''
+        Start listening on the socket.
+        '''
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self._queue = asyncio.Queue(self.queue_size)
+        self._executor = ProcessPoolExecutor(self.jobs)
+        self._dispatcher = asyncio.ensure_future(self._dispatch())
+        self._server = await asyncio.start_unix_server(
+            self._handle_connection, path=self.path)
+
+        logging.info('Listening on %s with %d workers', self.path, self.jobs)
+
+    async def close(self):
+        '''
+        Stop listening and shut down the process pool.
+        '''
+
+        self._server.close()
+        self._dispatcher.cancel()
+
+        for task in list(self._connections):
+            task.cancel()
+
+        await asyncio.gather(self._dispatcher, *self._connections,
+                             return_exceptions=True)
+        await asyncio.gather(*self._batches, return_exceptions=True)
+        await self._server.wait_closed()
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._executor.shutdown)
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def serve_forever(self):
+        '''
+        Start the server and run until cancelled.
+        '''
+
+        await self.start()
+
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
@@ -0,0 +1,316 @@
+'''
+Contains helpers for handing bitmaps to other processes through shared
+memory instead of pickling them.
+
+The owning process publishes bitmaps with ``Publisher``, which copies them
+into ``multiprocessing.shared_memory`` segments and returns a small
+``Descriptor`` for each. Descriptors pickle cheaply, so they can be sent to
+workers in place of the bitmaps. Workers read the bits in place with
+``view()``, ``count()``, ``iter_words()`` and ``decompress_bytes()``, or
+copy them out with ``load()``.
+
+Create the ``Publisher`` before starting the worker processes, so that they
+share its resource tracker; otherwise each worker's tracker would report the
+segments it attached to as leaked when it exits.
+
+Segments are reference counted by the publisher: each published segment
+starts with one reference, ``Publisher.acquire()`` adds one (typically for
+each task that is handed a descriptor) and ``Publisher.release()`` drops
+one. A segment is unlinked once its last reference is released, so workers
+must be done with a descriptor before the reference it was handed out with
+is released.
+'''
+
+import threading
+
+from collections import namedtuple
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+from bitstring import BitArray
+
+import lib.core as core
+import lib.wah as wah
+import lib.bbc as bbc
+
+
+# where a bitmap is in shared memory: ``name`` is the segment's name,
+# ``offset`` is the position of the bitmap in the segment in bytes, and
+# ``length`` is its length in bits before padding. The rest are as in
+# ``lib.fileformat``, with an ``algorithm`` of ``None`` for uncompressed bits.
+Descriptor = namedtuple('Descriptor', ['name', 'offset', 'length',
+                                       'algorithm', 'word_size',
+                                       'final_length'])
+
+
+def _split(bitmap, algorithm):
+    '''
+    Returns:
+        a tuple ``(bits, final_length)`` for a bitmap in the format taken by
+        ``wah.union_many()``, ``bbc.union_many()`` or, for an ``algorithm``
+        of ``None``, uncompressed bits.
+    '''
+
+    if algorithm == 'WAH':
+        return bitmap
+    elif algorithm in ('BBC', None):
+        return bitmap, 0
+    else:
+        raise ValueError(f'Unrecognized algorithm: {algorithm}')
+
+
+class Publisher:
+    '''
+    Publishes bitmaps into shared memory segments and unlinks each segment
+    once its reference count drops to zero. Thread-safe.
+    '''
+
+    def __init__(self):
+        # workers forked after this share the tracker, which then sees each
+        # segment registered once and unlinked once
+        resource_tracker.ensure_running()
+
+        self._segments = {}     # name -> [SharedMemory, references]
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._segments)
+
+    def publish(self, bitmap, algorithm=None, word_size=0):
+        '''
+        Copy one bitmap into a new segment.
+
+        Args:
+            bitmap: the bitmap, in the format taken by ``wah.union_many()``
+                    if ``algorithm`` is ``'WAH'``, or bits otherwise.
+            algorithm: ``'WAH'``, ``'BBC'``, or ``None`` for uncompressed
+                       bits.
+            word_size: the word size used, if the algorithm is WAH.
+
+        Returns:
+            the bitmap's ``Descriptor``.
+        '''
+
+        return self.publish_many([bitmap], algorithm, word_size)[0]
+
+    def publish_many(self, bitmaps, algorithm=None, word_size=0):
+        '''
+        Copy bitmaps back to back into a single new segment, which is then
+        released as a whole. The arguments are the same as those of
+        ``publish()``.
+
+        Returns:
+            a list with the ``Descriptor`` of each bitmap.
+
+        Raises:
+            ValueError: if ``bitmaps`` is empty or ``algorithm`` is not
+                        recognized.
+        '''
+
+        parts = [_split(bitmap, algorithm) for bitmap in bitmaps]
+
+        if not parts:
+            raise ValueError('bitmaps must not be empty')
+
+        sizes = [-(-len(bits) // 8) for bits, _ in parts]
+        # segments can't be empty
+        segment = shared_memory.SharedMemory(create=True,
+                                             size=max(1, sum(sizes)))
+        descriptors = []
+        offset = 0
+
+        for (bits, final_length), size in zip(parts, sizes):
+            # ``tobytes()`` pads with zeroes to a whole byte
+            segment.buf[offset:offset + size] = bits.tobytes()
+            descriptors.append(Descriptor(segment.name, offset, len(bits),
+                                          algorithm, word_size,
+                                          final_length))
+            offset += size
+
+        with self._lock:
+            self._segments[segment.name] = [segment, 1]
+
+        return descriptors
+
+    def acquire(self, descriptor: Descriptor):
+        '''
+        Add a reference to the segment holding ``descriptor``.
+
+        Raises:
+            KeyError: if the segment has already been unlinked.
+        '''
+
+        with self._lock:
+            self._segments[descriptor.name][1] += 1
+
+    def release(self, descriptor: Descriptor):
+        '''
+        Drop a reference to the segment holding ``descriptor``, unlinking it
+        if it was the last one.
+
+        Raises:
+            KeyError: if the segment has already been unlinked.
+        '''
+
+        with self._lock:
+            entry = self._segments[descriptor.name]
+            entry[1] -= 1
+
+            if entry[1] > 0:
+                return
+
+            del self._segments[descriptor.name]
+
+        entry[0].close()
+        entry[0].unlink()
+
+    def references(self, descriptor: Descriptor) -> int:
+        '''
+        Returns:
+            the number of references to the segment holding ``descriptor``,
+            or 0 if it has been unlinked.
+        '''
+
+        with self._lock:
+            entry = self._segments.get(descriptor.name)
+            return 0 if entry is None else entry[1]
+
+    def close(self):
+        '''
+        Unlink every segment, whatever its reference count.
+        '''
+
+        with self._lock:
+            segments = [segment for segment, _ in self._segments.values()]
+            self._segments.clear()
+
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+
+
+# segments attached by this process: name -> [SharedMemory, open views]
+_attached = {}
+_attached_lock = threading.Lock()
+
+
+@contextmanager
+def view(descriptor: Descriptor):
+    '''
+    Attach to the segment holding a bitmap, without copying it.
+
+    Yields:
+        a ``memoryview`` of the bitmap's bits, padded to whole bytes. It must
+        not be used after the ``with`` block.
+    '''
+
+    with _attached_lock:
+        entry = _attached.get(descriptor.name)
+
+        if entry is None:
+            # this registers the segment again with the publisher's resource
+            # tracker, which ignores it
+            segment = shared_memory.SharedMemory(name=descriptor.name)
+            entry = _attached[descriptor.name] = [segment, 0]
+
+        entry[1] += 1
+
+    start = descriptor.offset
+    data = entry[0].buf[start:start + -(-descriptor.length // 8)]
+
+    try:
+        yield data
+    finally:
+        data.release()
+
+        with _attached_lock:
+            entry[1] -= 1
+
+            if entry[1] == 0:
+                del _attached[descriptor.name]
+                entry[0].close()
+
+
+def load(descriptor: Descriptor):
+    '''
+    Copy a bitmap out of shared memory.
+
+    Returns:
+        the bitmap in the format it was published in: a tuple
+        ``(compressed, final_length)`` for WAH, or the bits otherwise.
+    '''
+
+    with view(descriptor) as data:
+        bits = BitArray(bytes=data, length=descriptor.length)
+
+    if descriptor.algorithm == 'WAH':
+        return bits, descriptor.final_length
+    else:
+        return bits
+
+
+def decompress_bytes(descriptor: Descriptor):
+    '''
+    Decompress a bitmap straight out of shared memory, without copying the
+    compressed bits first.
+
+    Returns:
+        a tuple ``(data, length)`` of the uncompressed bits, padded to whole
+        bytes, and their number.
+    '''
+
+    with view(descriptor) as data:
+        if descriptor.algorithm == 'WAH':
+            return core.wah_decompress(data, descriptor.length,
+                                       descriptor.final_length,
+                                       descriptor.word_size)
+        elif descriptor.algorithm == 'BBC':
+            bits = core.bbc_decompress(data)
+            return bits, len(bits) * core.bits_per_byte
+        else:
+            return bytes(data), descriptor.length
+
+
+def decompress(descriptor: Descriptor):
+    '''
+    Returns:
+        the uncompressed bits of a bitmap in shared memory. See
+        ``decompress_bytes()``.
+    '''
+
+    data, length = decompress_bytes(descriptor)
+    return BitArray(bytes=data, length=length)
+
+
+def count(descriptor: Descriptor) -> int:
+    '''
+    Returns:
+        the number of set bits in a bitmap in shared memory, counted in
+        place without copying it.
+    '''
+
+    with view(descriptor) as data:
+        if descriptor.algorithm == 'WAH':
+            return wah.count(data, descriptor.final_length,
+                             descriptor.word_size, descriptor.length)
+        elif descriptor.algorithm == 'BBC':
+            return bbc.count(data)
+        else:
+            return bin(int.from_bytes(data, 'big')).count('1')
+
+
+def iter_words(descriptor: Descriptor):
+    '''
+    Iterate over the words of a WAH bitmap in shared memory in place. See
+    ``wah.iter_words()``.
+    '''
+
+    with view(descriptor) as data:
+        yield from wah.iter_words(data, descriptor.final_length,
+                                  descriptor.word_size, descriptor.length)
@@ -0,0 +1,293 @@
+'''
+Contains an on-disk store for many compressed bitmaps. A store is a single
+file that is opened with ``mmap``, so opening it only reads its directory,
+and processes that open the same store share its pages through the page
+cache instead of holding private copies.
+
+File layout:
+
+1. A 16-byte header: magic bytes ``b'WBS'``, the format version, the offset
+   of the directory (8 bytes) and the number of entries (4 bytes), both
+   big-endian.
+2. The compressed bitmaps, each padded with zeroes to a whole number of
+   bytes.
+3. The directory, with one entry per bitmap: the length of the key in bytes
+   (2 bytes), the UTF-8 encoded key, and the fields of ``Entry``.
+
+Bitmaps are read with ``Store.view()``, which returns a ``memoryview`` of the
+mapped file that ``wah.iter_words()``, ``wah.count()``, ``bbc.iter_atoms()``
+and ``bbc.count()`` read in place.
+'''
+
+import mmap
+import os
+import struct
+
+from collections import namedtuple
+
+from bitstring import BitArray
+
+import lib.fileformat as fileformat
+import lib.wah as wah
+import lib.bbc as bbc
+
+
+magic = b'WBS'
+version = 1
+
+header_format = '>3sBQI'
+header_size = struct.calcsize(header_format)
+key_format = '>H'
+entry_format = '>QQcBB'
+
+# the largest values that fit in the directory: the size of a key in bytes,
+# and a ``word_size`` or ``final_length``
+max_key_size = 2**16 - 1
+max_field = 2**8 - 1
+
+# a directory entry: ``offset`` is the position in bytes of the bitmap in the
+# file, ``length`` is its length in bits before padding, and the rest are as
+# in ``lib.fileformat``
+Entry = namedtuple('Entry', ['offset', 'length', 'algorithm', 'word_size',
+                             'final_length'])
+
+
+class StoreWriter:
+    '''
+    Writes a store file. The file is written under a temporary name and
+    moved into place when the writer is closed, so readers never see a
+    partial store.
+    '''
+
+    def __init__(self, path: str):
+        '''
+        Args:
+            path: the path of the store file to write.
+        '''
+
+        self.path = path
+        self._tmp_path = f'{path}.{os.getpid()}.tmp'
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(bytes(header_size))
+        self._entries = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.unlink(self._tmp_path)
+
+    def add(self,
+            key: str,
+            compressed: BitArray,
+            algorithm: str,
+            word_size: int = 0,
+            final_length: int = 0):
+        '''
+        Add a compressed bitmap to the store. The arguments after ``key`` are
+        the same as those of ``fileformat.dumps()``.
+
+        Raises:
+            ValueError: if ``key`` is already in the store, ``algorithm``
+                        is not recognized, or a field does not fit in the
+                        directory.
+        '''
+
+        if key in self._entries:
+            raise ValueError(f'Duplicate key: {key}')
+        elif algorithm not in fileformat.algorithm_codes:
+            raise ValueError(f'Unrecognized algorithm: {algorithm}')
+        elif len(key.encode()) > max_key_size:
+            raise ValueError(f'Keys must be at most {max_key_size} bytes '
+                             'when encoded')
+        elif not 0 <= word_size <= max_field or \
+                not 0 <= final_length <= max_field:
+            raise ValueError('word_size and final_length must be between 0 '
+                             f'and {max_field}, inclusive')
+
+        padding = -len(compressed) % 8
+        self._entries[key] = Entry(self._file.tell(), len(compressed),
+                                   algorithm, word_size, final_length)
+        self._file.write((compressed + BitArray(padding)).bytes)
+
+    def close(self):
+        '''
+        Write the directory and move the store into place. If this fails,
+        the temporary file is removed.
+        '''
+
+        try:
+            directory_offset = self._file.tell()
+
+            for key, entry in self._entries.items():
+                key_bytes = key.encode()
+                code = fileformat.algorithm_codes[entry.algorithm]
+
+                self._file.write(struct.pack(key_format, len(key_bytes)))
+                self._file.write(key_bytes)
+                self._file.write(struct.pack(entry_format, entry.offset,
+                                             entry.length, code,
+                                             entry.word_size,
+                                             entry.final_length))
+
+            self._file.seek(0)
+            self._file.write(struct.pack(header_format, magic, version,
+                                         directory_offset,
+                                         len(self._entries)))
+            self._file.close()
+            os.replace(self._tmp_path, self.path)
+        except BaseException:
+            self._file.close()
+            os.unlink(self._tmp_path)
+            raise
+
+
+class Store:
+    '''
+    A read-only view of a store file.
+    '''
+
+    def __init__(self, path: str):
+        '''
+        Open a store, reading only its directory.
+
+        Args:
+            path: the path of the store file.
+
+        Raises:
+            ValueError: if the file is not a store or has an unsupported
+                        version.
+        '''
+
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._view = memoryview(self._mmap)
+
+        try:
+            self.entries = self._read_directory()
+        except (ValueError, struct.error, UnicodeDecodeError):
+            self.close()
+            raise ValueError('Invalid store format')
+
+    def _read_directory(self):
+        if len(self._view) < header_size:
+            raise ValueError('Invalid store format')
+
+        file_magic, file_version, pos, entry_count = \
+            struct.unpack_from(header_format, self._view)
+
+        if file_magic != magic:
+            raise ValueError('Invalid store format')
+        elif file_version != version:
+            raise ValueError(f'Unsupported store version: {file_version}')
+
+        codes = {code: name for name, code in
+                 fileformat.algorithm_codes.items()}
+        entry_size = struct.calcsize(entry_format)
+        key_size = struct.calcsize(key_format)
+        entries = {}
+
+        for _ in range(entry_count):
+            key_length, = struct.unpack_from(key_format, self._view, pos)
+            pos += key_size
+            key = bytes(self._view[pos:pos + key_length]).decode()
+            pos += key_length
+
+            offset, length, code, word_size, final_length = \
+                struct.unpack_from(entry_format, self._view, pos)
+            pos += entry_size
+
+            end = offset + -(-length // 8)
+
+            if code not in codes or end > len(self._view):
+                raise ValueError('Invalid store format')
+
+            entries[key] = Entry(offset, length, codes[code], word_size,
+                                 final_length)
+
+        return entries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def close(self):
+        '''
+        Unmap the store.
+
+        Raises:
+            BufferError: if views returned by ``view()`` are still in use.
+        '''
+
+        self._view.release()
+        self._mmap.close()
+
+    def view(self, key: str) -> memoryview:
+        '''
+        Returns:
+            a ``memoryview`` of the padded compressed bits stored under
+            ``key``, without copying them. The entry for ``key`` in
+            ``entries`` gives the length in bits and the codec to read them
+            with.
+
+        Raises:
+            KeyError: if ``key`` is not in the store.
+        '''
+
+        entry = self.entries[key]
+        return self._view[entry.offset:entry.offset + -(-entry.length // 8)]
+
+    def load(self, key: str):
+        '''
+        Copy a bitmap out of the store.
+
+        Returns:
+            a tuple ``(algorithm, compressed, word_size, final_length)`` in
+            the same format as the result of ``fileformat.loads()``.
+
+        Raises:
+            KeyError: if ``key`` is not in the store.
+        '''
+
+        entry = self.entries[key]
+
+        with self.view(key) as view:
+            compressed = BitArray(bytes=view, length=entry.length)
+
+        return entry.algorithm, compressed, entry.word_size, \
+            entry.final_length
+
+    def count(self, key: str) -> int:
+        '''
+        Returns:
+            the number of set bits in the bitmap stored under ``key``,
+            counted in place without copying or decompressing it.
+
+        Raises:
+            KeyError: if ``key`` is not in the store.
+        '''
+
+        entry = self.entries[key]
+
+        with self.view(key) as view:
+            if entry.algorithm == 'WAH':
+                return wah.count(view, entry.final_length, entry.word_size,
+                                 entry.length)
+            else:
+                return bbc.count(view)
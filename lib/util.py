@@ -2,6 +2,7 @@
 Utility functions used across multiple modules.
 '''
 
+
 def all_bits(bit_count: int) -> int:
     '''
     Get an integer with the specified number of set bits.
@@ -14,3 +15,53 @@ def all_bits(bit_count: int) -> int:
     '''
 
     return 2**bit_count - 1
+
+
+def pack_words(words, word_size: int):
+    '''
+    Concatenate integer words into a ``BitArray``.
+
+    Args:
+        words: the words, each of which must fit in ``word_size`` bits.
+        word_size: the number of bits in each word.
+
+    Returns:
+        the words, most significant bit first.
+    '''
+
+    # imported here so that ``lib.core`` can use this module without
+    # loading ``bitstring``
+    from bitstring import BitArray
+
+    word_fmt = f'0{word_size}b'
+    return BitArray(bin=''.join(format(word, word_fmt) for word in words))
+
+
+def to_bytes(bitmap):
+    '''
+    Get the bits of a bitmap as bytes.
+
+    Args:
+        bitmap: a ``Bits``, any value accepted by its constructor, or a 1-D
+                NumPy array of bits such as a row of a 2-D bit matrix.
+                Arrays are packed with ``numpy.packbits()`` rather than
+                converted a bit at a time.
+
+    Returns:
+        a tuple ``(data, length)`` of the bits, padded with zeroes to whole
+        bytes, and their number.
+    '''
+
+    # NumPy is found by duck typing so that it is not imported here; any
+    # array passed in means that it is already loaded
+    if getattr(bitmap, 'ndim', 0) == 1 and hasattr(bitmap, 'tobytes'):
+        import numpy as np
+
+        return np.packbits(bitmap).tobytes(), len(bitmap)
+
+    from bitstring import Bits
+
+    if not isinstance(bitmap, Bits):
+        bitmap = Bits(bitmap)
+
+    return bitmap.tobytes(), len(bitmap)
@@ -0,0 +1,247 @@
+'''
+Contains checks of the structure of compressed data that read each word or
+atom once without expanding runs, gaps or literals. They find corrupt data
+much faster than decompressing it, and say where the corruption starts.
+
+Each check returns a ``Report`` giving the first bad offset, if any, along
+with the uncompressed length and the makeup of the data up to that offset.
+Only the structure is checked: flipped bits inside a literal give another
+valid bitmap, and can only be caught by a checksum.
+'''
+
+from collections import namedtuple
+
+from bitstring import Bits
+
+import lib.fileformat as fileformat
+import lib.wah as wah
+import lib.bbc as bbc
+
+from lib.util import all_bits
+
+
+bits_per_byte = 8
+
+
+class Report(namedtuple('Report', ['error', 'offset', 'length', 'words',
+                                   'fills', 'literals', 'fill_bits',
+                                   'literal_bits'])):
+    '''
+    The result of a check.
+
+    Attributes:
+        error: a description of the first problem found, or ``None`` if the
+               data is valid.
+        offset: the offset of the word (in bits) or atom (in bytes) where
+                the problem was found, or ``None`` if the data is valid.
+        length: the number of uncompressed bits encoded before ``offset``,
+                or in the whole bitmap if it is valid.
+        words: the number of WAH words or BBC atoms read.
+        fills: the number of fill words, or atoms with gap bytes.
+        literals: the number of literal words, or literal and offset bytes.
+        fill_bits: the number of uncompressed bits in fills or gaps.
+        literal_bits: the number of uncompressed bits in literals.
+    '''
+
+    __slots__ = ()
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None
+
+
+def _last_word(bs, length: int, word_size: int) -> int:
+    if isinstance(bs, Bits):
+        return bs[length - word_size:length].uint
+
+    first = (length - word_size) // bits_per_byte
+    last = -(-length // bits_per_byte)
+    chunk = int.from_bytes(bs[first:last], 'big')
+    return chunk >> (last * bits_per_byte - length) & all_bits(word_size)
+
+
+def check_wah(bs, final_length, word_size, length=None) -> Report:
+    '''
+    Check the structure of WAH-compressed bits: that they are a whole number
+    of words, that every fill has a nonzero length, and that ``final_length``
+    agrees with the final word, whose padding must be clear.
+
+    Args:
+        bs: the compressed bits, as a ``BitArray`` or a bytes-like object.
+        final_length: the number of bits used in the final word of ``bs``.
+        word_size: the word size used.
+        length: the number of compressed bits in ``bs``, if it is bytes-like
+                (see ``wah.iter_words()``).
+
+    Raises:
+        ValueError: if ``word_size`` is less than 2.
+    '''
+
+    if word_size <= 1:
+        raise ValueError('word_size must be at least 2')
+
+    if isinstance(bs, Bits):
+        length = len(bs)
+    elif length is None:
+        length = len(bs) * bits_per_byte
+
+    counts = [0, 0, 0, 0, 0]    # words, fills, literals, fill and literal bits
+
+    def report(error, offset):
+        uncompressed = counts[3] + counts[4]
+        return Report(error, offset, uncompressed, *counts)
+
+    if length == 0:
+        return report('no words', 0)
+    elif not 1 <= final_length <= word_size:
+        return report(f'final length {final_length} is not between 1 and '
+                      f'{word_size}', length - word_size)
+
+    whole = length - length % word_size
+
+    if isinstance(bs, Bits):
+        words = wah.iter_words(bs[:whole], final_length, word_size)
+    else:
+        words = wah.iter_words(bs, final_length, word_size, whole)
+
+    def add(is_run, size, sign=1):
+        counts[0] += sign
+        counts[1 if is_run else 2] += sign
+        counts[3 if is_run else 4] += sign * size
+
+    for i, (is_run, _, size) in enumerate(words):
+        if is_run and size == 0:
+            return report('fill of no sections', i * word_size)
+
+        add(is_run, size)
+
+    if whole != length:
+        return report(f'{length - whole} bits after the last whole word',
+                      whole)
+
+    last = _last_word(bs, length, word_size)
+    error = None
+
+    if last >> (word_size - 1):
+        if final_length != word_size:
+            error = 'final word is a fill but the final length is ' \
+                f'{final_length}'
+    elif last & all_bits(word_size - final_length):
+        error = 'padding of the final word is not clear'
+
+    if error is not None:
+        # leave the final word out of the counts
+        add(is_run, size, -1)
+        return report(error, length - word_size)
+
+    return report(None, None)
+
+
+def check_bbc(bs) -> Report:
+    '''
+    Check the structure of BBC-compressed data: that it is a whole number of
+    bytes, that each header agrees with its tail bytes, that gap lengths use
+    the shortest encoding, that offset bytes have a valid position, that
+    literal counts do not run past the end, and that every atom encodes at
+    least one byte.
+
+    Args:
+        bs: the compressed bits, as a ``BitArray`` or a bytes-like object.
+    '''
+
+    counts = [0, 0, 0, 0, 0]    # atoms, fills, literals, gap and literal bits
+
+    def report(error, offset):
+        uncompressed = counts[3] + counts[4]
+        return Report(error, offset, uncompressed, *counts)
+
+    if isinstance(bs, Bits):
+        if len(bs) % bits_per_byte != 0:
+            return report(f'{len(bs) % bits_per_byte} bits after the last '
+                          'whole byte', len(bs) // bits_per_byte)
+
+        data = bs.bytes
+    else:
+        data = bs
+
+    if len(data) == 0:
+        return report('no atoms', 0)
+
+    pos = 0
+    one_byte_max = all_bits(bits_per_byte - 1)
+
+    while pos < len(data):
+        start = pos
+        header = data[pos]
+        pos += 1
+
+        gaps = header >> (bits_per_byte - bbc.header_gap_bits)
+        is_dirty = header >> 4 & 1
+        special = header & 0b1111
+
+        if gaps == bbc.header_gap_max:
+            if pos >= len(data):
+                return report('missing gap length byte', start)
+
+            gaps = data[pos]
+            pos += 1
+
+            if gaps >> (bits_per_byte - 1):
+                if pos >= len(data):
+                    return report('missing second gap length byte', start)
+
+                gaps = (gaps & one_byte_max) << bits_per_byte | data[pos]
+                pos += 1
+
+                if gaps <= one_byte_max:
+                    return report(f'gap length {gaps} uses two bytes',
+                                  start)
+            elif gaps < bbc.header_gap_max:
+                return report(f'gap length {gaps} is not in the header',
+                              start)
+
+        if is_dirty:
+            if special >= bits_per_byte:
+                return report(f'offset bit position {special} is out of '
+                              'range', start)
+
+            body = 1
+        else:
+            if pos + special > len(data):
+                return report(f'{special} literals run past the end', start)
+
+            body = special
+            pos += special
+
+        if gaps == 0 and body == 0:
+            return report('atom encodes no bytes', start)
+
+        counts[0] += 1
+        counts[1] += gaps > 0
+        counts[2] += body
+        counts[3] += gaps * bits_per_byte
+        counts[4] += body * bits_per_byte
+
+    return report(None, None)
+
+
+def check_file(data: bytes) -> Report:
+    '''
+    Check data in the format of ``lib.fileformat`` without copying the
+    compressed bits. Offsets are from the start of the compressed bits.
+
+    Raises:
+        ValueError: if the header is not valid.
+    '''
+
+    algorithm, body, length, word_size, final_length = fileformat.parse(data)
+
+    if algorithm == 'WAH':
+        if word_size <= 1:
+            raise ValueError('Invalid data format')
+
+        return check_wah(body, final_length, word_size, length)
+    elif length % bits_per_byte != 0:
+        raise ValueError('Invalid data format')
+    else:
+        return check_bbc(body)
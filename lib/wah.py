@@ -10,7 +10,21 @@ padding the right with zeroes.
 
 import logging
 
-from bitstring import BitArray
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import heappop, heappush
+
+from bitstring import BitArray, Bits
+
+import lib.core as core
+
+from lib.util import all_bits, pack_words, to_bytes
+
+
+bits_per_byte = 8
+
+# array type codes for the word sizes taken by ``compress_native()``
+native_typecodes = {32: 'I', 64: 'Q'}
 
 
 def run_length(bs: BitArray, word_size: int) -> int:
@@ -107,7 +121,7 @@ def encode_literal(bs: BitArray, word_size: int):
     return bs[section_size:], encoded_literal
 
 
-def compress(bs, word_size):
+def compress(bs, word_size, native=True):
     '''
     Compress the given bits with WAH compression using the specified word
     size.
@@ -115,6 +129,10 @@ def compress(bs, word_size):
     Args:
         bs: the bits to compress.
         word_size: the word size used in the algorithm.
+        native: whether to use the byte-level encoder of ``lib.core``,
+                which gives the same result much faster. Otherwise, the bits
+                are encoded a word at a time with ``encode_run()`` and
+                ``encode_literal()``.
 
     Returns:
         a tuple ``(compressed, length)``, where ``compressed`` is the
@@ -127,6 +145,10 @@ def compress(bs, word_size):
         raise ValueError('bs must have a length greater than 0')
     elif word_size <= 1:
         raise ValueError('word_size must be at least 2')
+    elif native:
+        compressed, length, final_length = core.wah_compress(
+            bs.tobytes(), len(bs), word_size)
+        return BitArray(bytes=compressed, length=length), final_length
 
     logging.info('Compressing %d bits', len(bs))
     logging.info('Word size: %d', word_size)
@@ -156,7 +178,7 @@ def compress(bs, word_size):
     return result, final_length
 
 
-def decompress(bs, final_length, word_size):
+def decompress(bs, final_length, word_size, native=True):
     '''
     Decompress the given WAH-compressed bits with the specified word size.
     This is the inverse of ``WAH.compress()``.
@@ -165,6 +187,7 @@ def decompress(bs, final_length, word_size):
         bs: the bits to decompress.
         word_size: the word size used.
         final_length: the number of bits used in the final word of ``bs``.
+        native: whether to use the byte-level decoder of ``lib.core``.
     '''
 
     if len(bs) == 0:
@@ -174,6 +197,10 @@ def decompress(bs, final_length, word_size):
     elif not 1 <= final_length <= word_size:
         raise ValueError('final_length must be between 1 and word_size, '
                          'inclusive')
+    elif native:
+        data, length = core.wah_decompress(bs.tobytes(), len(bs),
+                                           final_length, word_size)
+        return BitArray(bytes=data, length=length)
 
     result = BitArray()
 
@@ -203,3 +230,933 @@ def decompress(bs, final_length, word_size):
             result += lit
 
     return result
+
+
+def _check_native(word_size):
+    if word_size not in native_typecodes:
+        raise ValueError('word_size must be one of '
+                         f'{sorted(native_typecodes)}')
+
+
+def _words_to_bits(words, word_size) -> BitArray:
+    return BitArray(bytes=core.words_to_bytes(words, word_size))
+
+
+def compress_native(bs, word_size):
+    '''
+    Compress the given bits with WAH compression, for a word size of 32 or
+    64, using the byte-level encoder of ``lib.core``. The result is the same
+    as that of ``compress()``.
+
+    Args:
+        bs: the bits to compress.
+        word_size: 32 or 64.
+
+    Returns:
+        a tuple ``(compressed, length)`` in the same format as the result of
+        ``compress()``.
+
+    Raises:
+        ValueError: if ``bs`` is empty or ``word_size`` is not supported.
+    '''
+
+    _check_native(word_size)
+    words, _, final_lengths = core.encode_words([(bs.tobytes(), len(bs))],
+                                                word_size)
+
+    return _words_to_bits(words, word_size), final_lengths[0]
+
+
+def _decode(words, offsets, final_lengths, word_size):
+    data, bit_offsets = core.decode_words(words, offsets, final_lengths,
+                                          word_size)
+    return BitArray(bytes=data, length=bit_offsets[-1]), bit_offsets
+
+
+def decompress_native(bs, final_length, word_size):
+    '''
+    Decompress the given WAH-compressed bits, for a word size of 32 or 64,
+    using the byte-level decoder of ``lib.core``. The result is the same as
+    that of ``decompress()``.
+
+    Args:
+        bs: the bits to decompress.
+        final_length: the number of bits used in the final word of ``bs``.
+        word_size: 32 or 64.
+
+    Raises:
+        ValueError: if ``word_size`` is not supported or ``bs`` is not a
+                    whole number of words.
+    '''
+
+    _check_native(word_size)
+
+    if len(bs) == 0 or len(bs) % word_size != 0:
+        raise ValueError('Invalid data format')
+
+    words = core.bytes_to_words(bs.tobytes(), len(bs) // word_size,
+                                word_size)
+
+    return _decode(words, [0, len(words)], [final_length], word_size)[0]
+
+
+def compress_many(bitmaps, word_size):
+    '''
+    Compress many bitmaps in one pass, packing the results back to back.
+    Every bitmap is encoded into one shared ``array`` of words, without the
+    per-call checks and ``BitArray`` concatenation of calling
+    ``compress()`` on each one.
+
+    Args:
+        bitmaps: an iterable of bitmaps of any lengths, in any form taken by
+                 ``util.to_bytes()``, such as the rows of a 2-D NumPy array
+                 of bits.
+        word_size: the word size used in the algorithm.
+
+    Returns:
+        a tuple ``(compressed, offsets, final_lengths)``. ``offsets`` is an
+        ``array`` of one more offset than there are bitmaps, and
+        ``compressed[offsets[i]:offsets[i + 1]]`` and ``final_lengths[i]``
+        are the result of ``compress()`` on bitmap ``i``.
+
+    Raises:
+        ValueError: if ``bitmaps`` or any bitmap is empty, or
+                    ``word_size`` is less than 2.
+    '''
+
+    if word_size <= 1:
+        raise ValueError('word_size must be at least 2')
+
+    words, offsets, final_lengths = core.encode_words(
+        (to_bytes(bs) for bs in bitmaps), word_size)
+
+    if not final_lengths:
+        raise ValueError('bitmaps must not be empty')
+
+    for i in range(len(offsets)):
+        offsets[i] *= word_size
+
+    return (BitArray(bytes=core.words_to_bytes(words, word_size),
+                     length=offsets[-1]), offsets, final_lengths)
+
+
+def decompress_many(bs, offsets, final_lengths, word_size):
+    '''
+    Decompress bitmaps packed by ``compress_many()``. For word sizes of 32
+    and 64, every bitmap is decoded into one shared buffer in one pass.
+
+    Args:
+        bs: the packed compressed bits.
+        offsets: the offset of each bitmap in ``bs``, followed by the end of
+                 the last one.
+        final_lengths: the number of bits used in the final word of each
+                       bitmap.
+        word_size: the word size used.
+
+    Returns:
+        a tuple ``(bits, offsets)`` of the decompressed bitmaps back to back
+        and their offsets in ``bits``, in the same form as ``offsets``.
+
+    Raises:
+        ValueError: if there are no bitmaps, the offsets and final lengths
+                    do not match, or a bitmap is not a whole number of
+                    words.
+    '''
+
+    if word_size <= 1:
+        raise ValueError('word_size must be at least 2')
+    elif len(final_lengths) == 0 or len(offsets) != len(final_lengths) + 1:
+        raise ValueError('there must be one more offset than final length')
+    elif offsets[0] != 0 or offsets[-1] != len(bs) or any(
+            end <= start or (end - start) % word_size != 0
+            for start, end in zip(offsets, offsets[1:])):
+        raise ValueError('Invalid data format')
+    elif not all(1 <= length <= word_size for length in final_lengths):
+        raise ValueError('final_length must be between 1 and word_size, '
+                         'inclusive')
+
+    if word_size in native_typecodes:
+        words = core.bytes_to_words(bs.tobytes(), len(bs) // word_size,
+                                    word_size)
+        word_offsets = [offset // word_size for offset in offsets]
+        return _decode(words, word_offsets, final_lengths, word_size)
+
+    results = [decompress(bs[start:end], length, word_size)
+               for start, end, length in zip(offsets, offsets[1:],
+                                             final_lengths)]
+    bit_offsets = array('Q', [0])
+
+    for bits in results:
+        bit_offsets.append(bit_offsets[-1] + len(bits))
+
+    return BitArray().join(results), bit_offsets
+
+
+def iter_words(bs, final_length, word_size, length=None):
+    '''
+    Iterate over the words of WAH-compressed bits without expanding runs.
+
+    Args:
+        bs: the compressed bits, as a ``BitArray`` or a bytes-like object
+            such as a ``memoryview``. Bytes-like objects are read a word at a
+            time without being copied.
+        final_length: the number of bits used in the final word of ``bs``.
+        word_size: the word size used.
+        length: the number of compressed bits in ``bs``, if it is bytes-like
+                and padded to a whole number of bytes (default: every bit of
+                ``bs``).
+
+    Returns:
+        a generator of tuples ``(is_run, value, length)``, where ``length``
+        is the number of bits encoded by the word. For runs, ``value`` is
+        the bit that is repeated; for literals, ``value`` is an integer
+        holding the literal bits.
+
+    Raises:
+        ValueError: if ``bs`` is not a whole number of words.
+    '''
+
+    if isinstance(bs, Bits):
+        words = (word.uint for word in bs.cut(word_size))
+        length = len(bs)
+    else:
+        length = len(bs) * bits_per_byte if length is None else length
+        words = _read_words(bs, length, word_size)
+
+    if length % word_size != 0:
+        raise ValueError('Invalid data format')
+
+    section_size = word_size - 1
+    word_count = length // word_size
+    count_bits = all_bits(word_size - 2)
+
+    for i, word in enumerate(words):
+        if word >> section_size:
+            yield True, bool(word >> (word_size - 2) & 1), \
+                (word & count_bits) * section_size
+        elif i == word_count - 1:
+            yield False, word >> (word_size - final_length) \
+                & all_bits(final_length - 1), final_length - 1
+        else:
+            yield False, word, section_size
+
+
+def _read_words(data, length: int, word_size: int):
+    '''
+    Returns:
+        a generator of the first ``length // word_size`` words of the
+        bytes-like ``data``, as integers.
+    '''
+
+    for start in range(0, length - word_size + 1, word_size):
+        stop = start + word_size
+        first, last = start // bits_per_byte, -(-stop // bits_per_byte)
+        chunk = int.from_bytes(data[first:last], 'big')
+        yield chunk >> (last * bits_per_byte - stop) & all_bits(word_size)
+
+
+def count(bs, final_length, word_size, length=None) -> int:
+    '''
+    Count the set bits in WAH-compressed bits without decompressing them.
+
+    Args:
+        bs: the compressed bits, as a ``BitArray`` or a bytes-like object.
+        final_length: the number of bits used in the final word of ``bs``.
+        word_size: the word size used.
+        length: the number of compressed bits in ``bs``, if it is bytes-like
+                (see ``iter_words()``).
+
+    Returns:
+        the number of set bits.
+    '''
+
+    total = 0
+
+    for is_run, value, size in iter_words(bs, final_length, word_size,
+                                          length):
+        if is_run:
+            total += size if value else 0
+        else:
+            total += bin(value).count('1')
+
+    return total
+
+
+def slice(bs, final_length, word_size, start, stop):
+    '''
+    Extract the bits in the range ``[start, stop)`` from WAH-compressed bits
+    without decompressing them. Runs before ``start`` are skipped and runs
+    overlapping the range are cut without being expanded.
+
+    Args:
+        bs: the compressed bits.
+        final_length: the number of bits used in the final word of ``bs``.
+        word_size: the word size used.
+        start: the index of the first bit to extract.
+        stop: the index after the last bit to extract.
+
+    Returns:
+        a tuple ``(compressed, length)`` in the same format as the result of
+        ``compress()``, holding the extracted bits.
+
+    Raises:
+        ValueError: if the range is empty or out of bounds.
+    '''
+
+    if not 0 <= start < stop:
+        raise ValueError('start must be non-negative and less than stop')
+
+    result = Bitmap(word_size)
+    pos = 0
+
+    for is_run, value, length in iter_words(bs, final_length, word_size):
+        end = pos + length
+
+        if start < end:
+            lo, hi = max(start, pos) - pos, min(stop, end) - pos
+
+            if is_run:
+                result.append_run(value, hi - lo)
+            else:
+                bits = value >> (length - hi) & all_bits(hi - lo)
+                result._append_bits(bits, hi - lo)
+
+        pos = end
+
+        if pos >= stop:
+            return result.compressed()
+
+    raise ValueError('stop must not exceed the length of the bitmap')
+
+
+def concat(bitmaps, word_size):
+    '''
+    Concatenate WAH-compressed bitmaps without decompressing them. Only the
+    words around each seam are re-encoded, so that runs on either side are
+    merged as ``compress()`` would; the remaining words are copied as they
+    are. If a bitmap ends with a partial literal, the words of the next
+    bitmap no longer line up with sections and are all re-encoded.
+
+    Args:
+        bitmaps: an iterable of tuples ``(compressed, length)`` in the same
+                 format as the result of ``compress()``.
+        word_size: the word size used.
+
+    Returns:
+        a tuple ``(compressed, length)`` holding the concatenation of the
+        bitmaps.
+
+    Raises:
+        ValueError: if ``bitmaps`` is empty.
+    '''
+
+    result = BitArray()
+    final_length = word_size
+
+    for bs, length in bitmaps:
+        if len(bs) % word_size != 0:
+            raise ValueError('Invalid data format')
+
+        if len(result) == 0:
+            result = BitArray(bs)
+            final_length = length
+            continue
+
+        # take the trailing run and partial literal of ``result`` off so
+        # they can be merged with the start of ``bs``
+        tail = Bitmap(word_size)
+        popped = []
+
+        if not result[-word_size] and final_length < word_size:
+            popped.append(result[-word_size:])
+            del result[-word_size:]
+
+        if len(result) > 0 and result[-word_size]:
+            popped.append(result[-word_size:])
+            del result[-word_size:]
+
+        for word in reversed(popped):
+            if word[0]:
+                tail._push_word(word.uint)
+            else:
+                tail._append_bits(word[1:final_length].uint, final_length - 1)
+
+        copy_from = len(bs)
+
+        for i, token in enumerate(iter_words(bs, length, word_size)):
+            is_run, value, bit_count = token
+
+            if tail._lit_len == 0:
+                # a word can only merge with a preceding run of its type
+                last = tail._words[-1] if tail._words else 0
+
+                if not is_run or last >> (word_size - 2) != 0b10 | value:
+                    copy_from = i * word_size
+                    break
+
+            if is_run:
+                tail.append_run(value, bit_count)
+            else:
+                tail._append_bits(value, bit_count)
+
+        if len(tail) > 0:
+            seam, final_length = tail.compressed()
+            result += seam
+
+        if copy_from < len(bs):
+            result += bs[copy_from:]
+            final_length = length
+
+    if len(result) == 0:
+        raise ValueError('bitmaps must contain at least one bitmap')
+
+    return result, final_length
+
+
+def _merge(bitmaps, word_size, is_union):
+    '''
+    Combine WAH-compressed bitmaps with a bitwise OR or AND by walking all
+    of them at once. A heap holds the index of the bit where each bitmap's
+    current word ends, so the bits up to the nearest end are handled in one
+    step whether they are a run or a literal.
+
+    Args:
+        bitmaps: an iterable of tuples ``(compressed, length)`` in the same
+                 format as the result of ``compress()``.
+        word_size: the word size used.
+        is_union: ``True`` to OR the bitmaps, ``False`` to AND them.
+
+    Returns:
+        a tuple ``(compressed, length)`` holding the combined bitmap.
+
+    Raises:
+        ValueError: if ``bitmaps`` is empty or the bitmaps have different
+                    lengths.
+    '''
+
+    streams = [iter_words(bs, length, word_size) for bs, length in bitmaps]
+
+    if not streams:
+        raise ValueError('bitmaps must contain at least one bitmap')
+
+    # a run of ``dominant`` decides the result regardless of other bitmaps
+    dominant = is_union
+    result = Bitmap(word_size)
+    runs = [0, 0]       # number of bitmaps in a run of each bit
+    literals = {}       # current literal of each bitmap that is in one
+    current = [None] * len(streams)
+    heap = []
+    pos = 0
+
+    def advance(i):
+        word = next(streams[i], None)
+        current[i] = word
+
+        if word is None:
+            return
+
+        is_run, value, length = word
+
+        if is_run:
+            runs[value] += 1
+        else:
+            literals[i] = value
+
+        heappush(heap, (pos + length, i))
+
+    for i in range(len(streams)):
+        advance(i)
+
+    while heap:
+        end = heap[0][0]
+
+        if runs[dominant] > 0:
+            result.append_run(dominant, end - pos)
+        elif literals:
+            value = all_bits(end - pos) if not is_union else 0
+
+            for literal in literals.values():
+                value = value | literal if is_union else value & literal
+
+            result._append_bits(value, end - pos)
+        else:
+            result.append_run(not dominant, end - pos)
+
+        pos = end
+
+        finished = False
+
+        while heap and heap[0][0] == end:
+            _, i = heappop(heap)
+            is_run, value, _ = current[i]
+
+            if is_run:
+                runs[value] -= 1
+            else:
+                del literals[i]
+
+            advance(i)
+            finished = finished or current[i] is None
+
+        if finished and heap:
+            raise ValueError('bitmaps must have the same length')
+
+    return result.compressed()
+
+
+def union_many(bitmaps, word_size):
+    '''
+    Compute the bitwise OR of any number of WAH-compressed bitmaps without
+    decompressing them.
+
+    Args:
+        bitmaps: an iterable of tuples ``(compressed, length)`` in the same
+                 format as the result of ``compress()``.
+        word_size: the word size used.
+
+    Returns:
+        a tuple ``(compressed, length)`` holding the OR of the bitmaps.
+
+    Raises:
+        ValueError: if ``bitmaps`` is empty or the bitmaps have different
+                    lengths.
+    '''
+
+    return _merge(bitmaps, word_size, True)
+
+
+def intersect_many(bitmaps, word_size):
+    '''
+    Compute the bitwise AND of any number of WAH-compressed bitmaps without
+    decompressing them.
+
+    Args:
+        bitmaps: an iterable of tuples ``(compressed, length)`` in the same
+                 format as the result of ``compress()``.
+        word_size: the word size used.
+
+    Returns:
+        a tuple ``(compressed, length)`` holding the AND of the bitmaps.
+
+    Raises:
+        ValueError: if ``bitmaps`` is empty or the bitmaps have different
+                    lengths.
+    '''
+
+    return _merge(bitmaps, word_size, False)
+
+
+def invert(bs, final_length, word_size):
+    '''
+    Compute the bitwise NOT of a WAH-compressed bitmap without decompressing
+    it. Each word is flipped in place: fills keep their length and flip
+    their bit, and literals flip their bits, so the result has the same
+    number of words.
+
+    Args:
+        bs: the compressed bits.
+        final_length: the number of bits used in the final word of ``bs``.
+        word_size: the word size used.
+
+    Returns:
+        a tuple ``(compressed, length)`` holding the NOT of the bitmap.
+
+    Raises:
+        ValueError: if ``bs`` is empty or not a whole number of words.
+    '''
+
+    if len(bs) == 0 or len(bs) % word_size != 0:
+        raise ValueError('Invalid data format')
+
+    section_size = word_size - 1
+    fill_bit = 1 << (word_size - 2)
+    word_count = len(bs) // word_size
+    words = []
+
+    for i, word in enumerate(bs.cut(word_size)):
+        word = word.uint
+
+        if word >> section_size:
+            words.append(word ^ fill_bit)
+        elif i == word_count - 1:
+            # leave the padding after a partial final literal clear
+            words.append(word ^ all_bits(final_length - 1)
+                         << (word_size - final_length))
+        else:
+            words.append(word ^ all_bits(section_size))
+
+    return pack_words(words, word_size), final_length
+
+
+def from_positions(positions, length, word_size):
+    '''
+    Compress the bitmap with only the given positions set, without building
+    its uncompressed bits. The sections between positions are encoded as
+    fills arithmetically, so the time and memory used depend on the number
+    of positions rather than on ``length``.
+
+    Args:
+        positions: the sorted positions of the set bits, as any iterable of
+                   integers, such as a list, an ``array`` or a NumPy array.
+        length: the number of bits in the bitmap.
+        word_size: the word size used in the algorithm.
+
+    Returns:
+        a tuple ``(compressed, length)`` identical to the result of
+        ``compress()`` on the uncompressed bitmap.
+
+    Raises:
+        ValueError: if ``length`` is not positive, ``word_size`` is less
+                    than 2, or the positions are not sorted or fall outside
+                    the bitmap.
+    '''
+
+    if length <= 0:
+        raise ValueError('length must be greater than 0')
+
+    bitmap = Bitmap(word_size)
+    section_size = word_size - 1
+    current = 0     # index of the section holding ``section``
+    section = 0     # bits of the current section
+    last = -1
+
+    for position in positions:
+        position = int(position)
+
+        if position < last or position >= length:
+            raise ValueError('positions must be sorted and less than length')
+
+        last = position
+        index, offset = divmod(position, section_size)
+
+        if index != current:
+            bitmap._push_section(section)
+
+            if index > current + 1:
+                bitmap._push_run(False, index - current - 1)
+
+            current, section = index, 0
+
+        section |= 1 << (section_size - 1 - offset)
+
+    whole = length // section_size
+    tail_len = length % section_size
+
+    if current < whole:
+        bitmap._push_section(section)
+
+        if whole > current + 1:
+            bitmap._push_run(False, whole - current - 1)
+
+        section = 0
+
+    if tail_len > 0:
+        bitmap._append_bits(section >> (section_size - tail_len), tail_len)
+
+    return bitmap.compressed()
+
+
+class Bitmap:
+    '''
+    A WAH bitmap that supports appending bits and updating single bits in
+    place. Appended bits are encoded as soon as they fill a section, so only
+    the trailing partial section is kept uncompressed. The result of
+    ``Bitmap.compressed()`` is identical to calling ``compress()`` on every
+    bit appended so far.
+    '''
+
+    def __init__(self, word_size: int):
+        '''
+        Args:
+            word_size: the word size used in the algorithm.
+
+        Raises:
+            ValueError: if ``word_size`` is less than 2.
+        '''
+
+        if word_size <= 1:
+            raise ValueError('word_size must be at least 2')
+
+        self.word_size = word_size
+        self._section_size = word_size - 1
+        self._max_run = 2**(word_size - 2) - 1
+
+        self._words = []        # encoded words, as integers
+        self._starts = []       # index of the first bit encoded by each word
+        self._closed_bits = 0   # number of bits encoded by ``_words``
+        self._lit = 0           # bits of the trailing partial section
+        self._lit_len = 0       # number of bits in ``_lit``
+        self.version = 0        # incremented whenever the bits change
+
+    def __len__(self):
+        return self._closed_bits + self._lit_len
+
+    def _push_literal(self, section: int):
+        '''
+        Encode a full section as a literal word.
+        '''
+
+        self._words.append(section)
+        self._starts.append(self._closed_bits)
+        self._closed_bits += self._section_size
+
+    def _push_run(self, bit: bool, sections: int):
+        '''
+        Encode ``sections`` full sections of ``bit``, extending the last word
+        if it is a run of the same type that has not reached its maximum
+        length.
+        '''
+
+        if self._max_run == 0:
+            # the word size is too small to encode runs
+            for _ in range(sections):
+                self._push_literal(int(bit))
+            return
+
+        run_header = (0b10 | bit) << (self.word_size - 2)
+
+        if self._words and self._words[-1] >> (self.word_size - 2) == \
+                run_header >> (self.word_size - 2):
+            runs = self._words[-1] & self._max_run
+            extra = min(sections, self._max_run - runs)
+
+            self._words[-1] += extra
+            self._closed_bits += extra * self._section_size
+            sections -= extra
+
+        while sections > 0:
+            runs = min(sections, self._max_run)
+
+            self._words.append(run_header | runs)
+            self._starts.append(self._closed_bits)
+            self._closed_bits += runs * self._section_size
+            sections -= runs
+
+    def _push_section(self, section: int):
+        '''
+        Encode a full section, given as an integer.
+        '''
+
+        if section == 0:
+            self._push_run(False, 1)
+        elif section == all_bits(self._section_size):
+            self._push_run(True, 1)
+        else:
+            self._push_literal(section)
+
+    def _append_bits(self, value: int, length: int):
+        '''
+        Append the ``length`` lowest bits of ``value``, most significant
+        bit first.
+        '''
+
+        while length > 0:
+            take = min(length, self._section_size - self._lit_len)
+            length -= take
+
+            self._lit = (self._lit << take) | (value >> length)
+            self._lit_len += take
+            value &= all_bits(length)
+
+            if self._lit_len == self._section_size:
+                section = self._lit
+                self._lit, self._lit_len = 0, 0
+                self._push_section(section)
+
+    def append(self, bit):
+        '''
+        Append a single bit to the bitmap.
+        '''
+
+        self.version += 1
+        self._append_bits(int(bool(bit)), 1)
+
+    def extend(self, bits):
+        '''
+        Append a sequence of bits to the bitmap.
+
+        Args:
+            bits: a ``BitArray`` or any value accepted by its constructor.
+        '''
+
+        if not isinstance(bits, BitArray):
+            bits = BitArray(bits)
+
+        self.version += 1
+
+        # complete the partial section before encoding whole sections
+        head = min(len(bits), (self._section_size - self._lit_len)
+                   % self._section_size)
+
+        if head > 0:
+            self._append_bits(bits[:head].uint, head)
+
+        tail_len = (len(bits) - head) % self._section_size
+
+        for section in bits[head:len(bits) - tail_len].cut(self._section_size):
+            self._push_section(section.uint)
+
+        if tail_len > 0:
+            self._append_bits(bits[len(bits) - tail_len:].uint, tail_len)
+
+    def append_run(self, bit, length: int):
+        '''
+        Append ``length`` copies of ``bit``. Whole sections of the run are
+        encoded arithmetically rather than bit by bit.
+        '''
+
+        self.version += 1
+        bit = bool(bit)
+        head = min(length, (self._section_size - self._lit_len)
+                   % self._section_size)
+
+        if head > 0:
+            self._append_bits(all_bits(head) if bit else 0, head)
+            length -= head
+
+        if length >= self._section_size:
+            self._push_run(bit, length // self._section_size)
+            length %= self._section_size
+
+        if length > 0:
+            self._append_bits(all_bits(length) if bit else 0, length)
+
+    def __getitem__(self, i: int) -> bool:
+        if not 0 <= i < len(self):
+            raise IndexError('bit index out of range')
+
+        if i >= self._closed_bits:
+            shift = self._lit_len - 1 - (i - self._closed_bits)
+            return bool(self._lit >> shift & 1)
+
+        j = bisect_right(self._starts, i) - 1
+        word = self._words[j]
+
+        if word >> (self.word_size - 1):
+            return bool(word >> (self.word_size - 2) & 1)
+        else:
+            shift = self._section_size - 1 - (i - self._starts[j])
+            return bool(word >> shift & 1)
+
+    def _push_word(self, word: int, flip: int = -1):
+        '''
+        Encode the sections of an existing word, optionally flipping one of
+        its bits.
+
+        Args:
+            word: the word to encode.
+            flip: the index of the bit to flip within the bits encoded by
+                  ``word``, or -1 to leave the bits unchanged.
+        '''
+
+        if not word >> (self.word_size - 1):
+            if flip >= 0:
+                word ^= 1 << (self._section_size - 1 - flip)
+
+            self._push_section(word)
+            return
+
+        bit = bool(word >> (self.word_size - 2) & 1)
+        runs = word & self._max_run
+
+        if flip < 0:
+            self._push_run(bit, runs)
+            return
+
+        # split the run into a run, a literal with the flipped bit, and
+        # another run
+        before = flip // self._section_size
+        section = all_bits(self._section_size) if bit else 0
+        section ^= 1 << (self._section_size - 1 - flip % self._section_size)
+
+        self._push_run(bit, before)
+        self._push_section(section)
+        self._push_run(bit, runs - before - 1)
+
+    def _update(self, i: int, bit: bool):
+        '''
+        Change the bit at index ``i`` to ``bit``. Only the words from the one
+        before the changed bit up to the point where the new encoding lines
+        up with the old one again are re-encoded.
+        '''
+
+        if self[i] == bit:
+            return
+
+        self.version += 1
+
+        if i >= self._closed_bits:
+            shift = self._lit_len - 1 - (i - self._closed_bits)
+            self._lit ^= 1 << shift
+            return
+
+        # the word before the changed one may be a run that can absorb the
+        # changed section, so re-encoding starts there
+        j = bisect_right(self._starts, i) - 1
+        lo = max(j - 1, 0)
+        start = self._starts[lo]
+        scratch = Bitmap(self.word_size)
+
+        for k in range(lo, len(self._words)):
+            flip = i - self._starts[k] if k == j else -1
+            scratch._push_word(self._words[k], flip)
+
+            if k <= j:
+                continue
+
+            # encoding is the same as before once a new word starts where
+            # an old one did
+            offset = self._starts[k] - start
+            n = bisect_left(scratch._starts, offset)
+
+            if n < len(scratch._starts) and scratch._starts[n] == offset:
+                self._words[lo:k] = scratch._words[:n]
+                self._starts[lo:k] = [start + s for s in scratch._starts[:n]]
+                return
+
+        self._words[lo:] = scratch._words
+        self._starts[lo:] = [start + s for s in scratch._starts]
+
+    def set_bit(self, i: int):
+        '''
+        Set the bit at index ``i``.
+
+        Raises:
+            IndexError: if ``i`` is out of range.
+        '''
+
+        self._update(i, True)
+
+    def clear_bit(self, i: int):
+        '''
+        Clear the bit at index ``i``.
+
+        Raises:
+            IndexError: if ``i`` is out of range.
+        '''
+
+        self._update(i, False)
+
+    def compressed(self):
+        '''
+        Returns:
+            a tuple ``(compressed, length)`` in the same format as the result
+            of ``compress()``.
+
+        Raises:
+            ValueError: if the bitmap is empty.
+        '''
+
+        if len(self) == 0:
+            raise ValueError('bitmap must have a length greater than 0')
+
+        words = self._words
+        final_length = self.word_size
+
+        if self._lit_len > 0:
+            padding = self._section_size - self._lit_len
+            words = words + [self._lit << padding]
+            final_length = self._lit_len + 1
+
+        return pack_words(words, self.word_size), final_length
+
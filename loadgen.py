@@ -0,0 +1,152 @@
+'''
+Load generator for the compression service in ``lib.service``. Many clients
+send requests as fast as they can for a fixed time, and the throughput and
+latency percentiles are reported. Run ``python loadgen.py --help`` for
+program usage.
+'''
+
+import random
+import threading
+import time
+
+from argparse import ArgumentParser
+
+from lib.client import Client
+
+
+def rand_data(rng, size):
+    '''
+    Random bytes made of runs of clear and set bytes with the occasional
+    random byte, so that they compress.
+    '''
+
+    data = bytearray()
+
+    while len(data) < size:
+        choice = rng.random()
+
+        if choice < 0.1:
+            data.append(rng.getrandbits(8))
+        else:
+            data += (b'\x00' if choice < 0.7 else b'\xff') * rng.randint(1, 64)
+
+    return bytes(data[:size])
+
+
+def percentile(values, fraction):
+    '''
+    Returns:
+        the value below which ``fraction`` of the sorted ``values`` fall.
+    '''
+
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def worker(path, op, algorithm, word_size, size, duration, barrier, seed,
+           latencies):
+    '''
+    Send requests over one connection for ``duration`` seconds, appending
+    the latency of each to ``latencies``. The inputs are prepared before
+    waiting on ``barrier``, so that every client starts at once.
+    '''
+
+    rng = random.Random(seed)
+    inputs = [rand_data(rng, size) for _ in range(4)]
+
+    with Client(path) as client:
+        compressed = [client.compress(data, algorithm, word_size)
+                      for data in inputs]
+
+        barrier.wait()
+        deadline = time.perf_counter() + duration
+
+        while time.perf_counter() < deadline:
+            i = rng.randrange(len(inputs))
+            start = time.perf_counter()
+
+            if op == 'compress':
+                client.compress(inputs[i], algorithm, word_size)
+            elif op == 'decompress':
+                client.decompress(compressed[i])
+            elif op == 'count':
+                client.count(compressed[i])
+            elif op == 'union':
+                client.union([compressed[i], compressed[i - 1]])
+            else:
+                client.intersect([compressed[i], compressed[i - 1]])
+
+            latencies.append(time.perf_counter() - start)
+
+
+def _process_args():
+    '''
+    Process the command line arguments using the ``argparse`` library.
+
+    Returns:
+        The environment given by ``ArgumentParser.parse_args()``.
+    '''
+
+    parser = ArgumentParser(description='Generate load on the compression '
+                            'service.')
+
+    parser.add_argument('--socket', type=str, dest='socket',
+                        default='/tmp/wbc.sock',
+                        help='Path of the socket (default: /tmp/wbc.sock)')
+    parser.add_argument('--op', type=str, default='compress',
+                        choices=['compress', 'decompress', 'count', 'union',
+                                 'intersect'],
+                        help='Operation to request (default: compress)')
+    parser.add_argument('--algorithm', type=str, default='WAH',
+                        choices=['WAH', 'BBC'],
+                        help='Algorithm to compress with (default: WAH)')
+    parser.add_argument('--word-size', type=int, dest='word_size', default=32,
+                        help='The word size for WAH (default: 32)')
+    parser.add_argument('--size', type=int, default=4096,
+                        help='Size in bytes of each uncompressed input '
+                        '(default: 4096)')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='Number of concurrent clients (default: 16)')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='Seconds to generate load for (default: 10)')
+
+    return parser.parse_args()
+
+
+def main():
+    '''
+    Generate load and print the results.
+    '''
+
+    args = _process_args()
+    latencies = []
+    barrier = threading.Barrier(args.concurrency + 1)
+    threads = [threading.Thread(target=worker, args=(
+        args.socket, args.op, args.algorithm, args.word_size, args.size,
+        args.duration, barrier, seed, latencies))
+        for seed in range(args.concurrency)]
+
+    for thread in threads:
+        thread.start()
+
+    barrier.wait()
+    start = time.perf_counter()
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    if not latencies:
+        print('No requests completed')
+        return
+
+    print(f'{len(latencies)} {args.op} requests in {elapsed:.1f}s '
+          f'({len(latencies) / elapsed:.0f} requests/s)')
+    print(f'p50 {percentile(latencies, 0.5) * 1000:.2f} ms, '
+          f'p99 {percentile(latencies, 0.99) * 1000:.2f} ms, '
+          f'max {latencies[-1] * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+'''
+Runs the compression service in ``lib.service``. Run ``python serve.py
+--help`` for program usage, and see ``lib.client`` for talking to it.
+'''
+
+import asyncio
+import logging
+
+from argparse import ArgumentParser
+
+from lib.service import Server
+
+
+def _process_args():
+    '''
+    Process the command line arguments using the ``argparse`` library.
+
+    Returns:
+        The environment given by ``ArgumentParser.parse_args()``.
+    '''
+
+    parser = ArgumentParser(description='Serve compression requests over a '
+                            'Unix socket.')
+
+    parser.add_argument('--socket', type=str, dest='socket',
+                        default='/tmp/wbc.sock',
+                        help='Path of the socket (default: /tmp/wbc.sock)')
+    parser.add_argument('--jobs', type=int, dest='jobs', default=None,
+                        help='Number of worker processes (default: one per '
+                        'core)')
+    parser.add_argument('--queue-size', type=int, dest='queue_size',
+                        default=1024, help='Number of requests that may wait '
+                        'for a worker before clients are slowed down '
+                        '(default: 1024)')
+    parser.add_argument('--batch-size', type=int, dest='batch_size',
+                        default=64, help='Largest number of requests sent to '
+                        'a worker at once (default: 64)')
+    parser.add_argument('--max-message-size', type=int,
+                        dest='max_message_size', default=1 << 26,
+                        help='Largest request accepted, in bytes (default: '
+                        '64 MiB)')
+    parser.add_argument('--max-response-size', type=int,
+                        dest='max_response_size', default=1 << 26,
+                        help='Largest decompressed response, in bytes '
+                        '(default: 64 MiB)')
+    parser.add_argument('--log-level', type=str, dest='log_level',
+                        default='INFO', help='Log level (default: INFO; see '
+                        'logging.setLevel())')
+
+    return parser.parse_args()
+
+
+def main():
+    '''
+    Run the compression service until interrupted.
+    '''
+
+    args = _process_args()
+    logging.basicConfig(level=args.log_level)
+
+    server = Server(args.socket, args.jobs, args.queue_size, args.batch_size,
+                    args.max_message_size, args.max_response_size)
+
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
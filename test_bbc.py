@@ -2,11 +2,17 @@
 Unit tests for BBC implementation.
 '''
 
+import functools
 import itertools as it
 import unittest as ut
 
 from bitstring import BitArray
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 import lib.bbc as bbc
 
 from lib.util import all_bits
@@ -281,6 +287,258 @@ class TestBBC(ut.TestCase):
         expected = BitArray(bin='111000001000000111111110')
         self.assertEqual(bbc.compress(bs), expected)
 
+    def test_bitmap_append(self):
+        '''
+        Test that ``bbc.Bitmap`` matches ``bbc.compress()`` when built with
+        each of its append methods.
+        '''
+
+        inputs = ['00000000', '01000000', '00000000' * 9 + '00000100',
+                  '00000000' * 200 + '01000000' + '11000000',
+                  '00100000' * 20 + '00000000' * 3 + '11111111' * 31,
+                  '00000000' * (gap_max + 2) + '10000000' + '00000000']
+
+        for s in inputs:
+            expected = bbc.compress(BitArray(bin=s))
+
+            bitmap = bbc.Bitmap()
+            for bit in s:
+                bitmap.append(bit == '1')
+            self.assertEqual(bitmap.compressed(), expected)
+
+            bitmap = bbc.Bitmap()
+            for i in range(0, len(s), 13):
+                bitmap.extend(BitArray(bin=s[i:i + 13]))
+            self.assertEqual(bitmap.compressed(), expected)
+
+            bitmap = bbc.Bitmap()
+            for run in it.groupby(s):
+                bitmap.append_run(run[0] == '1', len(list(run[1])))
+            self.assertEqual(bitmap.compressed(), expected)
+
+        bitmap = bbc.Bitmap()
+        bitmap.extend('0b101')
+
+        with self.assertRaises(ValueError):
+            bitmap.compressed()
+
+    def test_decompress(self):
+        '''
+        Test ``bbc.decompress()`` on gaps of every encoded length, and that
+        ``bbc.compress()`` rejects partial bytes.
+        '''
+
+        for gaps in 1, 6, 7, 100, 127, 128, 1000, gap_max, gap_max + 1:
+            for tail in '', '00010000', '0011001111111111':
+                bs = BitArray(bin='00000000' * gaps + tail)
+                self.assertEqual(bbc.decompress(bbc.compress(bs)), bs)
+
+        # the input must be whole bytes, on either path
+        for native in True, False:
+            with self.assertRaises(ValueError):
+                bbc.compress(BitArray(bin='000000001'), native)
+
+    def test_bitmap_update(self):
+        '''
+        Test ``bbc.Bitmap.set_bit()`` and ``bbc.Bitmap.clear_bit()`` against
+        compressing the updated bits from scratch.
+        '''
+
+        inputs = ['00000000' * 300 + '00010000' + '00000000',
+                  '00100000' * 20 + '11111111' * 16,
+                  '00000000' * 8 + '00000100' + '11000000']
+
+        for s in inputs:
+            bits = list(s)
+            bitmap = bbc.Bitmap()
+            bitmap.extend(BitArray(bin=s))
+
+            updates = it.chain(range(0, len(s), 11),
+                               range(len(s) - 30, len(s)))
+
+            for i in updates:
+                bit = bits[i] == '0'
+                bits[i] = '1' if bit else '0'
+
+                if bit:
+                    bitmap.set_bit(i)
+                else:
+                    bitmap.clear_bit(i)
+
+                expected = bbc.compress(BitArray(bin=''.join(bits)))
+                self.assertEqual(bitmap.compressed(), expected)
+                self.assertEqual(bitmap[i], bit)
+
+        with self.assertRaises(IndexError):
+            bbc.Bitmap().clear_bit(0)
+
+    def test_slice(self):
+        '''
+        Test ``bbc.slice()`` against compressing the sliced bits.
+        '''
+
+        bs = BitArray(bin='00000000' * 200 + '00010000' + '00000000'
+                      + '11011111' * 20 + '00000000' * 9 + '00000001')
+        compressed = bbc.compress(bs)
+
+        for start in 0, 3, 8, 1600, 1605, 1608, 1616, 1700, len(bs) - 8:
+            for stop in start + 8, start + 64, start + 1000, len(bs):
+                if stop > len(bs) or (stop - start) % bits_per_byte != 0:
+                    continue
+
+                self.assertEqual(bbc.slice(compressed, start, stop),
+                                 bbc.compress(bs[start:stop]))
+
+        with self.assertRaises(ValueError):
+            bbc.slice(compressed, 0, len(bs) + 8)
+
+        with self.assertRaises(ValueError):
+            bbc.slice(compressed, 0, 3)
+
+    def test_concat(self):
+        '''
+        Test ``bbc.concat()`` against compressing the concatenated bits.
+        '''
+
+        parts = ['00000000' * 100, '00000000' * 3 + '00001000',
+                 '00000100' + '00000000', '11011000' * 14,
+                 '00000000' * 6 + '10000000' + '11111111', '01000000']
+
+        for count in range(1, 4):
+            for group in it.permutations(parts, count):
+                compressed = [bbc.compress(BitArray(bin=s)) for s in group]
+                expected = bbc.compress(BitArray(bin=''.join(group)))
+                self.assertEqual(bbc.concat(compressed), expected)
+
+        # gaps that overflow a single atom at the seam
+        gaps = BitArray(bin='00000000' * (gap_max - 1))
+        compressed = [bbc.compress(gaps)] * 3
+        self.assertEqual(bbc.concat(compressed), bbc.compress(gaps * 3))
+
+        with self.assertRaises(ValueError):
+            bbc.concat([])
+
+    def test_merge_many(self):
+        '''
+        Test ``bbc.union_many()`` and ``bbc.intersect_many()`` against
+        combining the decompressed bits.
+        '''
+
+        bitmaps = ['00000000' * 40, '11111111' * 40,
+                   '00000000' * 10 + '00100000' * 30,
+                   '00000000' * 20 + '10110000' * 5 + '00000000' * 15,
+                   '01000000' + '00000000' * 38 + '00000001',
+                   '11001100' * 20 + '00000000' * 20]
+
+        for count in 1, 2, 3, len(bitmaps):
+            for group in it.combinations(bitmaps, count):
+                bits = [BitArray(bin=s) for s in group]
+                compressed = [bbc.compress(bs) for bs in bits]
+
+                union = functools.reduce(lambda a, b: a | b, bits)
+                intersection = functools.reduce(lambda a, b: a & b, bits)
+
+                self.assertEqual(bbc.union_many(compressed),
+                                 bbc.compress(union))
+                self.assertEqual(bbc.intersect_many(compressed),
+                                 bbc.compress(intersection))
+
+        with self.assertRaises(ValueError):
+            bbc.union_many([])
+
+        with self.assertRaises(ValueError):
+            bbc.intersect_many([bbc.compress(BitArray(bin='00000001')),
+                                bbc.compress(BitArray(bin='00000001' * 2))])
+
+    def test_count(self):
+        '''
+        Test ``bbc.count()`` against counting the decompressed bits.
+        '''
+
+        for s in '00000000', '00000000' * 200 + '00100000' + '11111111' * 20, \
+                '10110011' * 3 + '00000000' * 8 + '00000001':
+            bs = BitArray(bin=s)
+            self.assertEqual(bbc.count(bbc.compress(bs)), bs.count(1))
+
+    def test_invert(self):
+        '''
+        Test that ``bbc.invert()`` gives the compressed complement.
+        '''
+
+        for s in '00000000', '11111111' * 30, '00000000' * 200 + '00100000', \
+                '10110011' * 3 + '00000000' * 8 + '11110111' + '11111111':
+            bs = BitArray(bin=s)
+            self.assertEqual(bbc.invert(bbc.compress(bs)), bbc.compress(~bs))
+
+    def test_from_positions(self):
+        '''
+        Test that ``bbc.from_positions()`` gives the same result as
+        compressing the uncompressed bitmap.
+        '''
+
+        cases = [([], 8), ([0], 8), ([3, 4, 5], 16), ([7, 8], 16),
+                 ([2, 900, 1200 * 8 - 1], 1200 * 8),
+                 (list(range(16, 200)) + [300, 301], 400)]
+
+        for positions, length in cases:
+            bs = BitArray(length)
+            bs.set(1, positions)
+            self.assertEqual(bbc.from_positions(iter(positions), length),
+                             bbc.compress(bs))
+
+        for positions, length in ([2, 1], 8), ([8], 8), ([], 12):
+            with self.assertRaises(ValueError):
+                bbc.from_positions(positions, length)
+
+    def test_many(self):
+        '''
+        Test that ``bbc.compress_many()`` packs the same results as
+        ``bbc.compress()``, and that ``bbc.decompress_many()`` reverses it.
+        '''
+
+        strings = ['00000000', '00000000' * 200 + '00100000' + '11111111' * 20,
+                   '10110011' * 3 + '00000000' * 8 + '00000001',
+                   '00000000' * 140 + '11111111' * 17 + '00000100' * 2,
+                   '00001000' + '00000000' + '00000010']
+        bitmaps = [BitArray(bin=s) for s in strings]
+        compressed, offsets = bbc.compress_many(bitmaps)
+
+        for i, bs in enumerate(bitmaps):
+            self.assertEqual(compressed[offsets[i]:offsets[i + 1]],
+                             bbc.compress(bs))
+
+        bits, bit_offsets = bbc.decompress_many(compressed, offsets)
+        self.assertEqual(bits, BitArray(bin=''.join(strings)))
+        self.assertEqual(list(bit_offsets),
+                         list(it.accumulate(map(len, strings), initial=0)))
+
+        with self.assertRaises(ValueError):
+            bbc.compress_many([])
+
+        with self.assertRaises(ValueError):
+            bbc.compress_many([BitArray(bin='0101')])
+
+        with self.assertRaises(ValueError):
+            bbc.decompress_many(compressed, [0, 8])
+
+    @ut.skipIf(np is None, 'NumPy is not installed')
+    def test_many_numpy(self):
+        '''
+        Test ``bbc.compress_many()`` on the rows of a NumPy bit matrix.
+        '''
+
+        rows = np.random.default_rng(1).random((20, 800)) < 0.02
+        rows[:, :400] = False
+        compressed, offsets = bbc.compress_many(rows)
+
+        for i, row in enumerate(rows):
+            bs = BitArray(bin=''.join('1' if bit else '0' for bit in row))
+            self.assertEqual(compressed[offsets[i]:offsets[i + 1]],
+                             bbc.compress(bs))
+
+        with self.assertRaises(ValueError):
+            bbc.compress_many(rows[:, :12])
+
 
 if __name__ == '__main__':
     ut.main()
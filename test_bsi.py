@@ -0,0 +1,86 @@
+'''
+Unit tests for the bit-sliced index.
+'''
+
+import itertools as it
+import random
+import unittest as ut
+
+from lib.bsi import BitSlicedIndex
+
+
+##############
+# unit tests #
+##############
+
+class TestBSI(ut.TestCase):
+    def test_compare(self):
+        '''
+        Test each comparison against filtering the values directly, with
+        nulls, negative values and constants outside the range of values.
+        '''
+
+        rng = random.Random(7)
+        values = [None if rng.random() < 0.1 else rng.randrange(-20, 300)
+                  for _ in range(203)]
+        constants = [-100, -20, -1, 0, 5, 128, 299, 300, 1000]
+
+        for algorithm in 'WAH', 'BBC':
+            bsi = BitSlicedIndex.build(values, algorithm, 8)
+            self.assertEqual(len(bsi), len(values))
+
+            def expected(predicate):
+                return [row for row, v in enumerate(values)
+                        if v is not None and predicate(v)]
+
+            for c in constants:
+                self.assertEqual(bsi.rows(bsi.equal(c)),
+                                 expected(lambda v: v == c))
+                self.assertEqual(bsi.rows(bsi.less(c)),
+                                 expected(lambda v: v < c))
+                self.assertEqual(bsi.rows(bsi.less_equal(c)),
+                                 expected(lambda v: v <= c))
+                self.assertEqual(bsi.rows(bsi.greater(c)),
+                                 expected(lambda v: v > c))
+                self.assertEqual(bsi.rows(bsi.greater_equal(c)),
+                                 expected(lambda v: v >= c))
+
+            for low, high in it.combinations(constants, 2):
+                self.assertEqual(bsi.rows(bsi.between(low, high)),
+                                 expected(lambda v: low <= v <= high))
+
+    def test_aggregate(self):
+        '''
+        Test counts and sums, over every row and over comparison results.
+        '''
+
+        values = [3, None, -4, 10, 10, 0, None, 7, 1]
+
+        for algorithm in 'WAH', 'BBC':
+            bsi = BitSlicedIndex.build(values, algorithm, 8)
+
+            self.assertEqual(bsi.count(), 7)
+            self.assertEqual(bsi.sum(), 27)
+            self.assertEqual(bsi.count(bsi.greater(0)), 5)
+            self.assertEqual(bsi.sum(bsi.between(0, 7)), 11)
+            self.assertEqual(bsi.sum(bsi.equal(10)), 20)
+            self.assertEqual(bsi.sum(bsi.less(-4)), 0)
+
+            bsi = BitSlicedIndex.build([None, None], algorithm, 8)
+            self.assertEqual((bsi.count(), bsi.sum()), (0, 0))
+            self.assertEqual(bsi.rows(bsi.less_equal(0)), [])
+
+    def test_invalid(self):
+        '''
+        Test building an index from invalid arguments.
+        '''
+
+        with self.assertRaises(ValueError):
+            BitSlicedIndex.build([])
+
+        with self.assertRaises(ValueError):
+            BitSlicedIndex.build([1], 'ZIP')
+
+
+if __name__ == '__main__':
+    ut.main()
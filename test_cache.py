@@ -0,0 +1,172 @@
+'''
+Unit tests for the cache of decompressed bitmaps and operation results.
+'''
+
+import gc
+import threading
+import unittest as ut
+
+from unittest import mock
+
+from bitstring import BitArray, Bits
+
+import lib.wah as wah
+import lib.bbc as bbc
+
+from lib.cache import Cache
+
+
+##############
+# unit tests #
+##############
+
+class TestCache(ut.TestCase):
+    def test_decompress(self):
+        '''
+        Test that decompressed data is cached by content and returned as
+        immutable ``Bits``.
+        '''
+
+        cache = Cache(10000)
+        bs = BitArray(700) + BitArray(bin='1011') + ~BitArray(300)
+        compressed, final_length = wah.compress(bs, 8)
+
+        first = cache.decompress(compressed, 'WAH', 8, final_length)
+        second = cache.decompress(BitArray(compressed), 'WAH', 8,
+                                  final_length)
+
+        self.assertEqual(first, bs)
+        self.assertIs(first, second)
+        self.assertNotIsInstance(first, BitArray)
+        self.assertEqual(cache.stats()[:4], (1, 1, 0, 1))
+
+        # the same bits with a different format are a different key
+        cache.decompress(compressed, 'WAH', 8, final_length - 1)
+        self.assertEqual(cache.stats().misses, 2)
+
+    def test_operations(self):
+        '''
+        Test caching ``union_many()`` and ``intersect_many()``.
+        '''
+
+        cache = Cache(10000)
+        bs = BitArray(bytes=b'\x00' * 20 + b'\x81\x02' + b'\xff' * 10)
+        ones = ~BitArray(len(bs))
+
+        operands = [bbc.compress(bs), bbc.compress(ones)]
+        union = cache.union_many(operands, 'BBC')
+        self.assertEqual(union, operands[1])
+        self.assertIs(cache.union_many(operands, 'BBC'), union)
+        self.assertEqual(cache.intersect_many(operands, 'BBC'), operands[0])
+
+        operands = [wah.compress(bs, 16), wah.compress(ones, 16)]
+        self.assertEqual(cache.intersect_many(operands, 'WAH', 16),
+                         operands[0])
+        self.assertEqual(cache.stats()[:2], (1, 3))
+
+    def test_bitmap(self):
+        '''
+        Test that values cached for a ``Bitmap`` are dropped when it changes
+        or is freed.
+        '''
+
+        cache = Cache(10000)
+
+        for bitmap_class, args in (wah.Bitmap, (5,)), (bbc.Bitmap, ()):
+            bitmap = bitmap_class(*args)
+            bitmap.extend(BitArray(64))
+            before = cache.decompress_bitmap(bitmap)
+
+            # a hit does not compress the bitmap again
+            with mock.patch.object(bitmap, 'compressed',
+                                   side_effect=AssertionError):
+                self.assertIs(cache.decompress_bitmap(bitmap), before)
+
+            bitmap.set_bit(3)
+            after = cache.decompress_bitmap(bitmap)
+            self.assertEqual(after, BitArray(bin='0001') + BitArray(60))
+            self.assertEqual(before, BitArray(64))
+            self.assertEqual(len(cache), 1)
+
+            del bitmap
+            gc.collect()
+            self.assertEqual(len(cache), 0)
+
+    def test_bitmap_keys(self):
+        '''
+        Test that a change to a ``Bitmap`` only drops the values whose keys
+        contain it, and that evicted keys are not remembered.
+        '''
+
+        cache = Cache(10)
+        bitmaps = [bbc.Bitmap() for _ in range(3)]
+        a, b, c = [cache.bitmap_key(bitmap) for bitmap in bitmaps]
+
+        cache.put(('union', (a, b)), 'ab', 1)
+        cache.put(('union', (b, c)), 'bc', 1)
+        cache.put(('decompress', c), 'c', 1)
+
+        bitmaps[0].extend(BitArray(8))
+        cache.bitmap_key(bitmaps[0])
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get(('union', (b, c))), 'bc')
+        self.assertEqual(cache._keys, {b[1]: {('union', (b, c))},
+                                       c[1]: {('union', (b, c)),
+                                              ('decompress', c)}})
+
+        # filling the cache with other values evicts the rest
+        for i in range(10):
+            cache.put(i, i, 1)
+
+        self.assertEqual(len(cache), 10)
+        self.assertEqual(cache._keys, {})
+
+    def test_eviction(self):
+        '''
+        Test that the least recently used values are evicted to keep the
+        cache within its budget, including under concurrent use.
+        '''
+
+        cache = Cache(300)
+        data = [bbc.compress(BitArray(uint=i + 1, length=800))
+                for i in range(8)]
+
+        for compressed in data[:3]:
+            cache.decompress(compressed, 'BBC')
+
+        cache.decompress(data[0], 'BBC')
+        cache.decompress(data[3], 'BBC')
+
+        # the second value was the least recently used
+        self.assertEqual(cache.stats()[1:], (4, 1, 3, 300))
+        cache.decompress(data[1], 'BBC')
+        self.assertEqual(cache.stats().misses, 5)
+
+        cache.put('big', Bits(8000))
+        self.assertIsNone(cache.get('big'))
+
+        errors = []
+
+        def run(offset):
+            for i in range(100):
+                k = (i * offset) % len(data)
+
+                if cache.decompress(data[k], 'BBC').uint != k + 1:
+                    errors.append(k)
+
+        threads = [threading.Thread(target=run, args=(offset,))
+                   for offset in (1, 3, 5, 7)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(cache.stats().size, 300)
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,166 @@
+'''
+Unit tests for the command-line interface.
+'''
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest as ut
+
+from bitstring import BitArray
+
+import compress
+import lib.wah as wah
+import lib.bbc as bbc
+
+from lib.diskcache import DiskCache
+
+
+##############
+# unit tests #
+##############
+
+class TestCompress(ut.TestCase):
+    def test_encode(self):
+        '''
+        Test that ``compress.decode()`` inverts ``compress.encode()``.
+        '''
+
+        data = b'\x00' * 100 + b'Hello, world!' + b'\xff' * 50
+
+        for algorithm, word_size in ('WAH', 5), ('WAH', 32), ('BBC', 8):
+            encoded = compress.encode(data, algorithm, word_size)
+            self.assertEqual(compress.decode(encoded), data)
+
+    def test_imports(self):
+        '''
+        Test that compressing standard input does not load ``bitstring``, and
+        gives the same output as the ``BitArray`` codecs.
+        '''
+
+        data = b'\x00' * 100 + b'Hello, world!' + b'\xff' * 50
+        script = 'import sys, compress; compress.main(); ' \
+            'sys.stderr.write(str("bitstring" in sys.modules))'
+
+        bs = BitArray(bytes=data)
+
+        for flag, expected in ('--wah', wah.compress(bs, 32)[0]), \
+                ('--bbc', bbc.compress(bs)):
+            result = subprocess.run(
+                [sys.executable, '-c', script, flag, '--word-size', '32'],
+                input=data, capture_output=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(compress.__file__)))
+
+            self.assertEqual(result.stdout, expected.bytes)
+            self.assertEqual(result.stderr, b'False')
+
+    def test_run_batch(self):
+        '''
+        Test compressing and decompressing a batch of files.
+        '''
+
+        contents = [b'\x00' * 1000 + b'\x01', b'abc', bytes(range(256)), b'']
+
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, f'in{i}') for i in range(len(contents))]
+
+            for path, data in zip(paths, contents):
+                with open(path, 'wb') as f:
+                    f.write(data)
+
+            for algorithm in 'WAH', 'BBC':
+                out_dir = os.path.join(tmp, algorithm)
+                in_bytes, _, _, errors = compress.run_batch(
+                    paths, algorithm, 8, jobs=2)
+
+                # empty inputs cannot be compressed
+                self.assertEqual(errors[0][0], paths[-1])
+                self.assertEqual(len(errors), 1)
+                self.assertEqual(in_bytes, sum(map(len, contents)))
+
+                outputs = [compress.output_path(path, None, algorithm, False)
+                           for path in paths[:-1]]
+                _, out_bytes, _, errors = compress.run_batch(
+                    outputs, None, 8, True, out_dir, 2)
+
+                self.assertEqual(errors, [])
+                self.assertEqual(out_bytes, in_bytes)
+
+                for i, data in enumerate(contents[:-1]):
+                    with open(os.path.join(out_dir, f'in{i}'), 'rb') as f:
+                        self.assertEqual(f.read(), data)
+
+    def test_cache(self):
+        '''
+        Test that cached outputs are reused and match uncached ones.
+        '''
+
+        data = b'\x00' * 100 + b'cached' + b'\xff' * 50
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DiskCache(os.path.join(tmp, 'cache'), 2**20)
+
+            for algorithm, word_size in ('WAH', 5), ('WAH', 32), ('BBC', 8):
+                expected = compress.encode(data, algorithm, word_size)
+
+                for _ in range(2):
+                    self.assertEqual(compress.encode_cached(
+                        data, algorithm, word_size, cache), expected)
+
+            # BBC ignores the word size, so it shares one entry
+            compress.encode_cached(data, 'BBC', 32, cache)
+            self.assertEqual(len(cache._entries()), 3)
+
+            path = os.path.join(tmp, 'in')
+
+            with open(path, 'wb') as f:
+                f.write(data)
+
+            cache_dir = os.path.join(tmp, 'batch-cache')
+
+            for _ in range(2):
+                _, out_bytes, _, errors = compress.run_batch(
+                    [path], 'WAH', 8, jobs=1, cache_dir=cache_dir)
+                self.assertEqual(errors, [])
+
+                with open(path + '.wah', 'rb') as f:
+                    self.assertEqual(f.read(), compress.encode(data, 'WAH', 8))
+
+            # trimming to zero bytes evicts everything
+            compress.run_batch([path], 'WAH', 8, jobs=1, cache_dir=cache_dir,
+                               cache_bytes=0)
+            self.assertEqual(DiskCache(cache_dir, 0).size(), 0)
+
+    def test_run_check(self):
+        '''
+        Test checking a batch of compressed files, some of them corrupt.
+        '''
+
+        data = b'\x00' * 100 + b'checked' + b'\xff' * 50
+        files = {
+            'good.wah': compress.encode(data, 'WAH', 32),
+            'good.bbc': compress.encode(data, 'BBC', 8),
+            'truncated.bbc': compress.encode(data, 'BBC', 8)[:-3],
+            'header.wah': b'WBC',
+        }
+
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+
+            for name, contents in files.items():
+                paths.append(os.path.join(tmp, name))
+
+                with open(paths[-1], 'wb') as f:
+                    f.write(contents)
+
+            in_bytes, _, errors = compress.run_check(paths, jobs=2)
+
+        self.assertEqual(sorted(os.path.basename(path)
+                                for path, _ in errors),
+                         ['header.wah', 'truncated.bbc'])
+        self.assertEqual(in_bytes, sum(map(len, files.values())) - 3)
+
+
+if __name__ == '__main__':
+    ut.main()
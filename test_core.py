@@ -0,0 +1,86 @@
+'''
+Unit tests for the byte-level codecs.
+'''
+
+import itertools as it
+import unittest as ut
+
+from bitstring import BitArray
+
+import lib.core as core
+import lib.wah as wah
+import lib.bbc as bbc
+
+from lib.util import pack_words
+
+
+##############
+# unit tests #
+##############
+
+class TestCore(ut.TestCase):
+    def test_words(self):
+        '''
+        Test packing words into bytes and reading them back.
+        '''
+
+        for word_size in 3, 8, 13, 32, 64:
+            words = [0, 1, 5, 2**(word_size - 1), 2**word_size - 1]
+            data = core.words_to_bytes(words, word_size)
+
+            self.assertEqual(data, pack_words(words, word_size).tobytes())
+            self.assertEqual(list(core.bytes_to_words(data, len(words),
+                                                      word_size)), words)
+
+    def test_wah(self):
+        '''
+        Test that the WAH codec gives the same results as ``wah.compress()``
+        and ``wah.decompress()``.
+        '''
+
+        strings = ['0', '1', '0110', '1'*31, '0'*63 + '1', '1'*62*3,
+                   '0'*31*8*5 + '1'*31*3 + '01'*100, '0110100'*20 + '1'*9]
+
+        for s, word_size in it.product(strings, (2, 5, 8, 13, 32, 64)):
+            bs = BitArray(bin=s)
+            compressed, length, final_length = core.wah_compress(
+                bs.tobytes(), len(bs), word_size)
+
+            self.assertEqual((BitArray(bytes=compressed, length=length),
+                              final_length),
+                             wah.compress(bs, word_size, native=False))
+            self.assertEqual(core.wah_decompress(compressed, length,
+                                                 final_length, word_size),
+                             (bs.tobytes(), len(bs)))
+
+        with self.assertRaises(ValueError):
+            core.wah_compress(b'', 0, 32)
+
+        with self.assertRaises(ValueError):
+            core.wah_decompress(b'\x80\x00', 12, 8, 8)
+
+    def test_bbc(self):
+        '''
+        Test that the BBC codec gives the same results as ``bbc.compress()``
+        and ``bbc.decompress()``.
+        '''
+
+        for data in b'\x00', b'\x00' * 200 + b'\x20' + b'\xff' * 20, \
+                b'\xb3' * 3 + b'\x00' * 8 + b'\x01', b'\x08\x00\x02', \
+                b'\x00' * 40000 + b'\x10\x10' + b'\x00' * 130:
+            compressed = core.bbc_compress(memoryview(data))
+
+            self.assertEqual(compressed,
+                             bbc.compress(BitArray(bytes=data),
+                                          native=False).bytes)
+            self.assertEqual(core.bbc_decompress(compressed), data)
+
+        with self.assertRaises(ValueError):
+            core.bbc_compress(b'')
+
+        with self.assertRaises(ValueError):
+            core.bbc_decompress(b'\xe2\x0a\xb0')
+
+
+if __name__ == '__main__':
+    ut.main()
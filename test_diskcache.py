@@ -0,0 +1,102 @@
+'''
+Unit tests for the on-disk cache.
+'''
+
+import os
+import tempfile
+import time
+import unittest as ut
+
+from unittest import mock
+
+from lib.diskcache import DiskCache, make_key
+
+
+##############
+# unit tests #
+##############
+
+class TestDiskCache(ut.TestCase):
+    def test_make_key(self):
+        '''
+        Test that keys depend on both the data and the parameters.
+        '''
+
+        keys = {make_key(b'abc', 'WAH', 8), make_key(b'abc', 'WAH', 9),
+                make_key(b'abd', 'WAH', 8), make_key(b'abc', 'BBC', 8)}
+
+        self.assertEqual(len(keys), 4)
+        self.assertEqual(make_key(b'abc', 'WAH', 8),
+                         make_key(bytearray(b'abc'), 'WAH', 8))
+
+    def test_get_put(self):
+        '''
+        Test storing values, and evicting the least recently used ones.
+        '''
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DiskCache(os.path.join(tmp, 'cache'), 250)
+            keys = [make_key(bytes([i])) for i in range(3)]
+
+            self.assertIsNone(cache.get(keys[0]))
+
+            for i, key in enumerate(keys):
+                cache.put(key, bytes([i]) * 100)
+                path = cache._path(key)
+                os.utime(path, (i, i))
+
+            self.assertEqual(cache.get(keys[1]), b'\x01' * 100)
+            self.assertEqual(cache.size(), 300)
+
+            # the first value is the least recently used, since getting the
+            # second one updated its time
+            self.assertEqual(cache.evict(), 1)
+            self.assertIsNone(cache.get(keys[0]))
+            self.assertEqual(cache.get(keys[2]), b'\x02' * 100)
+
+            # no temporary files are left behind
+            for root, _, names in os.walk(cache.path):
+                for name in names:
+                    self.assertFalse(name.startswith('.tmp-'))
+
+    def test_evict(self):
+        '''
+        Test that eviction only walks the cache when its size record is over
+        budget, and removes stale temporary files when it does.
+        '''
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DiskCache(os.path.join(tmp, 'cache'), 250)
+
+            for i in range(2):
+                cache.put(make_key(bytes([i])), bytes([i]) * 100)
+
+            self.assertEqual(cache.recorded_size(), 200)
+
+            with mock.patch.object(cache, '_entries',
+                                   side_effect=AssertionError):
+                self.assertEqual(cache.evict(), 0)
+
+            # temporary files left by a process that died in ``put()``
+            subdir = os.path.dirname(cache._path(make_key(b'\x00')))
+            stale, fresh = [os.path.join(subdir, '.tmp-' + name)
+                            for name in ('stale', 'fresh')]
+
+            for path in stale, fresh:
+                with open(path, 'wb') as f:
+                    f.write(b'\x00' * 1000)
+
+            old = time.time() - 2 * 3600
+            os.utime(stale, (old, old))
+
+            # overwriting a value counts it again, which forces a walk
+            cache.put(make_key(b'\x00'), b'\x00' * 100)
+            self.assertEqual(cache.recorded_size(), 300)
+            self.assertEqual(cache.evict(), 0)
+            self.assertEqual(cache.recorded_size(), 200)
+            self.assertFalse(os.path.exists(stale))
+            self.assertTrue(os.path.exists(fresh))
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,91 @@
+'''
+Unit tests for EWAH implementation.
+'''
+
+import unittest as ut
+
+from bitstring import BitArray
+
+import lib.ewah as ewah
+
+
+##############
+# unit tests #
+##############
+
+class TestEWAH(ut.TestCase):
+    def test_compress(self):
+        '''
+        Test the word layout with a word size of 8, which has 4 run length
+        bits and 3 literal count bits.
+        '''
+
+        self.assertEqual((ewah.run_bits(8), ewah.literal_bits(8)), (4, 3))
+
+        def compress(s):
+            compressed, final_length = ewah.compress(BitArray(bin=s), 8)
+            return compressed.bin, final_length
+
+        # a clear run followed by two literals
+        self.assertEqual(compress('0'*16 + '00010000' + '10000001'),
+                         ('0' + '0010' + '010' + '00010000' + '10000001', 8))
+
+        # a set run, then a partial final chunk padded with zeroes
+        self.assertEqual(compress('1'*8 + '101'),
+                         ('1' + '0001' + '001' + '10100000', 3))
+
+        # a partial final chunk of clear bits joins the run
+        self.assertEqual(compress('0'*12), ('0' + '0010' + '000', 4))
+
+        # runs longer than the run length field are split
+        self.assertEqual(compress('1'*8*16),
+                         ('1' + '1111' + '000' + '1' + '0001' + '000', 8))
+
+    def test_roundtrip(self):
+        '''
+        Test ``ewah.decompress()``, ``ewah.count()`` and
+        ``ewah.iter_markers()`` on a variety of bitmaps.
+        '''
+
+        cases = [
+            BitArray(bin='1'),
+            BitArray(bytes=b'\x00' * 40 + b'Hello, world!' + b'\xff' * 40),
+            BitArray(bin='0'*1000 + '1'*37 + '01'*100),
+        ]
+
+        for bs in cases:
+            for ws in 3, 8, 13, 32, 64:
+                compressed, final_length = ewah.compress(bs, ws)
+                self.assertEqual(
+                    ewah.decompress(compressed, final_length, ws), bs)
+                self.assertEqual(ewah.count(compressed, final_length, ws),
+                                 bs.count(1))
+
+                markers = list(ewah.iter_markers(compressed, ws))
+                self.assertEqual(
+                    len(markers) + sum(m[3] for m in markers),
+                    len(compressed) // ws)
+
+        with self.assertRaises(ValueError):
+            ewah.compress(BitArray(bin='01'), 2)
+
+    def test_intersect(self):
+        '''
+        Test ``ewah.intersect()`` against intersecting the uncompressed bits.
+        '''
+
+        a = BitArray(bin='0'*500 + '1'*300 + '0110'*50 + '1'*100)
+        b = BitArray(bin='01'*200 + '1'*500 + '0'*200)
+
+        for x, y in (a, b), (b, a), (a, a), (a, ~a):
+            for ws in 3, 8, 32:
+                result = ewah.intersect(ewah.compress(x, ws),
+                                        ewah.compress(y, ws), ws)
+                self.assertEqual(result, ewah.compress(x & y, ws))
+
+        with self.assertRaises(ValueError):
+            ewah.intersect(ewah.compress(a, 8), ewah.compress(a[:-8], 8), 8)
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,67 @@
+'''
+Unit tests for the compressed file format.
+'''
+
+import unittest as ut
+
+from bitstring import BitArray
+
+import lib.fileformat as fileformat
+
+
+##############
+# unit tests #
+##############
+
+class TestFileFormat(ut.TestCase):
+    def test_roundtrip(self):
+        '''
+        Test that ``fileformat.loads()`` inverts ``fileformat.dumps()`` for
+        bit lengths that are and are not whole numbers of bytes.
+        '''
+
+        for length in 1, 7, 8, 9, 13, 64, 1000:
+            bs = BitArray(uint=length, length=length + 12)
+
+            data = fileformat.dumps(bs, 'WAH', 13, 5)
+            self.assertEqual(fileformat.loads(data), ('WAH', bs, 13, 5))
+
+            data = fileformat.dumps(bs, 'BBC')
+            self.assertEqual(fileformat.loads(data), ('BBC', bs, 0, 0))
+
+    def test_parse(self):
+        '''
+        Test writing padded bytes and reading them back without
+        ``bitstring``.
+        '''
+
+        data = fileformat.dumps(b'\xab\xc0', 'WAH', 5, 3, 10)
+        self.assertEqual(data, fileformat.dumps(BitArray(bin='1010101111'),
+                                                'WAH', 5, 3))
+
+        algorithm, compressed, length, word_size, final_length = \
+            fileformat.parse(data)
+        self.assertEqual((algorithm, bytes(compressed), length, word_size,
+                          final_length), ('WAH', b'\xab\xc0', 10, 5, 3))
+
+        with self.assertRaises(ValueError):
+            fileformat.parse(data[:-2])
+
+    def test_invalid(self):
+        '''
+        Test that invalid headers are rejected.
+        '''
+
+        data = fileformat.dumps(BitArray(bin='0101'), 'BBC')
+
+        with self.assertRaises(ValueError):
+            fileformat.dumps(BitArray(bin='0101'), 'LZW')
+
+        for bad in b'', data[:5], b'XYZ' + data[3:], \
+                data[:3] + b'\x63' + data[4:], data[:4] + b'Q' + data[5:]:
+            with self.assertRaises(ValueError):
+                fileformat.loads(bad)
+
+
+if __name__ == '__main__':
+    ut.main()
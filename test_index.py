@@ -0,0 +1,122 @@
+'''
+Unit tests for the bitmap index and its row orders.
+'''
+
+import itertools as it
+import os
+import random
+import tempfile
+import unittest as ut
+
+import lib.index as index
+
+from lib.index import BitmapIndex
+
+
+##############
+# unit tests #
+##############
+
+class TestIndex(ut.TestCase):
+    def test_orders(self):
+        '''
+        Test the row permutations computed by each order.
+        '''
+
+        rows = [(1, 'b'), (0, 'b'), (1, 'a'), (0, 'a')]
+        self.assertEqual(index.lexicographic_order(rows), [3, 1, 2, 0])
+
+        # the bitmaps are 0, 1, a and b, so the rows' codes are 0101, 1001,
+        # 0110 and 1010, with Gray code ranks 6, 14, 4 and 12
+        self.assertEqual(index.gray_order(rows), [2, 0, 3, 1])
+
+        rows = [(0, 0), (0, 1), (1, 1), (1, 0)]
+        self.assertEqual(index.gray_order(rows), [3, 2, 0, 1])
+        self.assertEqual([index._gray_rank(g) for g in (0, 1, 3, 2, 6)],
+                         [0, 1, 2, 3, 4])
+
+    def test_query(self):
+        '''
+        Test that queries return the original row ids in every order and
+        with both codecs, and that sorting the rows shrinks the index.
+        '''
+
+        rng = random.Random(0)
+        rows = [(rng.randrange(3), rng.choice('abcd'), rng.randrange(30))
+                for _ in range(2000)]
+        conditions = [
+            {'x': 1},
+            {'x': 2, 'y': ['a', 'c']},
+            {'y': 'd', 'z': {3, 4, 5}},
+            {'x': 7},
+            {},
+        ]
+
+        for algorithm in 'WAH', 'BBC':
+            sizes = {}
+
+            for order in [None] + index.orders:
+                ix = BitmapIndex.build(rows, ['x', 'y', 'z'], order,
+                                       algorithm)
+                sizes[order] = ix.size()
+
+                for c in conditions:
+                    expected = [i for i, row in enumerate(rows)
+                                if all(row['xyz'.index(column)] in
+                                       (v if isinstance(v, (list, set))
+                                        else [v])
+                                       for column, v in c.items())]
+                    self.assertEqual(ix.query(c), expected)
+
+            for order in index.orders:
+                self.assertLess(sizes[order], sizes[None] / 2)
+
+    def test_padding(self):
+        '''
+        Test indexes over a number of rows that is not a whole number of
+        bytes, which BBC bitmaps are padded to.
+        '''
+
+        rows = [(i % 3,) for i in range(10)]
+
+        for algorithm, order in it.product(('WAH', 'BBC'),
+                                           [None] + index.orders):
+            ix = BitmapIndex.build(rows, None, order, algorithm)
+
+            self.assertEqual(ix.query({0: 1}), [1, 4, 7])
+            self.assertEqual(ix.query({0: [0, 2]}), [0, 2, 3, 5, 6, 8, 9])
+            self.assertEqual(ix.query({}), list(range(10)))
+
+    def test_save(self):
+        '''
+        Test that a saved index is read back with its permutation.
+        '''
+
+        rows = [(i % 3, str(i % 5)) for i in range(500)]
+        ix = BitmapIndex.build(rows, ['n', 's'], 'gray', 'WAH', 64)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'rows.index')
+            ix.save(path)
+            loaded = BitmapIndex.load(path)
+
+        self.assertEqual(loaded.columns, ['n', 's'])
+        self.assertEqual(list(loaded.permutation), list(ix.permutation))
+        self.assertEqual(loaded.bitmaps, ix.bitmaps)
+        self.assertEqual((loaded.algorithm, loaded.word_size), ('WAH', 64))
+        self.assertEqual(loaded.query({'n': 1, 's': '4'}),
+                         list(range(4, 500, 15)))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            BitmapIndex.build([])
+
+        with self.assertRaises(ValueError):
+            BitmapIndex.build([(1,)], order='random')
+
+        with self.assertRaises(ValueError):
+            BitmapIndex.build([(1, 2), (1,)])
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,94 @@
+'''
+Unit tests for PLWAH implementation.
+'''
+
+import unittest as ut
+
+from bitstring import BitArray
+
+import lib.wah as wah
+import lib.plwah as plwah
+
+
+####################################
+# string wrapper for PLWAH compress #
+####################################
+
+def compress(s, ws):
+    compressed, final_length = plwah.compress(BitArray(bin=s), ws)
+    return compressed.bin, final_length
+
+
+##############
+# unit tests #
+##############
+
+class TestPLWAH(ut.TestCase):
+    def test_compress(self):
+        '''
+        Test the word layout with a word size of 8, which has 3 position
+        bits and 3 run length bits.
+        '''
+
+        self.assertEqual(plwah.position_bits(8), 3)
+
+        # a run without a folded literal
+        self.assertEqual(compress('0'*14, 8), ('10000010', 8))
+
+        # a single set bit after a run is folded into the fill
+        self.assertEqual(compress('0'*14 + '0010000', 8), ('10011010', 8))
+        self.assertEqual(compress('1'*7 + '1111110', 8), ('11111001', 8))
+
+        # literals with more than one differing bit are not folded
+        self.assertEqual(compress('0'*7 + '0010001', 8),
+                         ('10000001' + '00010001', 8))
+
+        # a trailing partial literal is never folded
+        self.assertEqual(compress('0'*7 + '001', 8),
+                         ('10000001' + '00010000', 4))
+
+        # runs longer than the run length field are split, and only the
+        # last part holds the folded literal
+        self.assertEqual(compress('0'*7*9 + '1000000', 8),
+                         ('10000111' + '10001010', 8))
+
+    def test_roundtrip(self):
+        '''
+        Test that ``plwah.decompress()`` and ``plwah.count()`` agree with the
+        compressed bits, and that sparse bitmaps are smaller than with WAH.
+        '''
+
+        sparse = BitArray(20000)
+
+        for i in range(0, 20000, 997):
+            sparse.set(True, i)
+
+        dense = BitArray(bytes=b'\x00' * 20 + b'Hello' + b'\xff' * 20)
+
+        for bs in sparse, ~sparse, dense, BitArray(bin='1'):
+            for ws in 6, 8, 17, 32, 64:
+                compressed, final_length = plwah.compress(bs, ws)
+                self.assertEqual(
+                    plwah.decompress(compressed, final_length, ws), bs)
+                self.assertEqual(plwah.count(compressed, final_length, ws),
+                                 bs.count(1))
+
+        for ws in 32, 64:
+            self.assertLess(len(plwah.compress(sparse, ws)[0]),
+                            0.6 * len(wah.compress(sparse, ws)[0]))
+
+    def test_invalid(self):
+        '''
+        Test that word sizes without room for a run length are rejected.
+        '''
+
+        for ws in 2, 5:
+            with self.assertRaises(ValueError):
+                plwah.compress(BitArray(bin='0101'), ws)
+
+        with self.assertRaises(ValueError):
+            plwah.decompress(BitArray(bin='0101'), 4, 8)
+
+
+if __name__ == '__main__':
+    ut.main()
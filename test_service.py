@@ -0,0 +1,201 @@
+'''
+Unit tests for the compression service and its client.
+'''
+
+import asyncio
+import contextlib
+import os
+import signal
+import socket
+import struct
+import tempfile
+import threading
+import unittest as ut
+
+from bitstring import BitArray
+
+import lib.bbc as bbc
+import lib.fileformat as fileformat
+import lib.service as service
+import lib.wah as wah
+
+from lib.client import Client
+
+
+##############
+# unit tests #
+##############
+
+class TestService(ut.TestCase):
+    def test_handle(self):
+        '''
+        Test handling requests without a server.
+        '''
+
+        data = b'\x00' * 100 + b'\x0f'
+        header, body = service.handle({'op': 'compress', 'algorithm': 'WAH',
+                                       'word_size': 8}, data)
+        self.assertTrue(header['ok'])
+
+        _, compressed, _, final_length = fileformat.loads(body)
+        self.assertEqual(wah.count(compressed, final_length, 8), 4)
+
+        header, _ = service.handle({'op': 'bogus'}, b'')
+        self.assertFalse(header['ok'])
+
+        header, _ = service.handle({'op': 'count', 'sizes': [5]}, b'x')
+        self.assertFalse(header['ok'])
+
+    def test_bad_request(self):
+        '''
+        Test that a malformed request in a batch fails on its own.
+        '''
+
+        good = {'op': 'compress', 'algorithm': 'BBC'}, b'\x01' * 8
+        bad = [({'op': 'compress', 'algorithm': 'WAH', 'word_size': 'x'},
+                b'\x01'),
+               ({'op': 'count', 'sizes': 5}, b'\x01'),
+               ({'op': 'count', 'sizes': ['1']}, b'\x01'),
+               (['op', 'count'], b'\x01')]
+
+        for request in bad:
+            responses = service.handle_batch([good, request, good])
+            self.assertEqual([header['ok'] for header, _ in responses],
+                             [True, False, True])
+            self.assertEqual(responses[0], responses[2])
+
+    def test_response_limit(self):
+        '''
+        Test that requests that decompress to more than the limit fail
+        without being decompressed.
+        '''
+
+        # a single WAH fill word of 31 * (2**30 - 1) bits
+        huge = fileformat.dumps(BitArray(bytes=b'\xbf\xff\xff\xff'), 'WAH',
+                                32, 32)
+        small = fileformat.dumps(bbc.compress(BitArray(800)), 'BBC')
+
+        for data, size in (huge, 4160749565), (small, 100):
+            header, _ = service.handle({'op': 'decompress'}, data, 99)
+            self.assertFalse(header['ok'])
+            self.assertIn(f'{size} bytes', header['error'])
+
+        header, _ = service.handle({'op': 'count'}, huge, 99)
+        self.assertTrue(header['ok'])
+
+        header, body = service.handle({'op': 'decompress'}, small, 100)
+        self.assertEqual(body, bytes(100))
+
+    def test_client(self):
+        '''
+        Test requests sent to a running server from many clients.
+        '''
+
+        with self._serve(jobs=2, queue_size=4, batch_size=3,
+                         max_message_size=4096) as (_, path):
+            self._check_clients(path)
+
+    def test_worker_death(self):
+        '''
+        Test that the server replaces its process pool when a worker dies.
+        '''
+
+        data = b'\x00' * 100 + b'\x0f'
+
+        with self._serve(jobs=1) as (server, path), Client(path) as client:
+            compressed = client.compress(data, 'BBC')
+            executor = server._executor
+
+            for process in list(executor._processes.values()):
+                os.kill(process.pid, signal.SIGKILL)
+
+            # requests fail until the dead worker is noticed
+            for _ in range(10):
+                try:
+                    self.assertEqual(client.decompress(compressed), data)
+                    break
+                except ValueError as e:
+                    self.assertIn('Worker process died', str(e))
+            else:
+                self.fail('The process pool was not replaced')
+
+            self.assertIsNot(server._executor, executor)
+
+    @contextlib.contextmanager
+    def _serve(self, **kwargs):
+        '''
+        Run a server in another thread.
+
+        Yields:
+            a tuple ``(server, path)`` of the server and its socket's path.
+        '''
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'wbc.sock')
+            server = service.Server(path, **kwargs)
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(server.start())
+            thread = threading.Thread(target=loop.run_forever)
+            thread.start()
+
+            try:
+                yield server, path
+            finally:
+                asyncio.run_coroutine_threadsafe(server.close(), loop) \
+                    .result()
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join()
+                loop.close()
+
+    def _check_clients(self, path):
+        errors = []
+
+        def run(seed):
+            data = bytes([seed]) * 50 + b'\xff' * seed + b'\x81'
+
+            try:
+                with Client(path) as client:
+                    for algorithm in 'WAH', 'BBC':
+                        compressed = client.compress(data, algorithm, 7)
+                        ones = client.compress(b'\xff' * len(data), algorithm,
+                                               7)
+
+                        assert client.decompress(compressed) == data
+                        assert client.count(compressed) == \
+                            sum(bin(b).count('1') for b in data)
+                        assert client.union([compressed, ones]) == ones
+                        assert client.intersect([compressed, ones]) == \
+                            compressed
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(seed,))
+                   for seed in range(12)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+        with Client(path) as client:
+            with self.assertRaises(ValueError):
+                client.decompress(b'not compressed')
+
+        # a frame over the limit is refused without reading its payload
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            sock.sendall(struct.pack(service.length_format, 4097))
+            reply = sock.makefile('rb').read()
+
+        size, = struct.unpack_from(service.length_format, reply)
+        self.assertEqual(len(reply), service.length_size + size)
+        header, _ = service.unpack_message(reply[service.length_size:])
+        self.assertFalse(header['ok'])
+        self.assertIn('4097', header['error'])
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,99 @@
+'''
+Unit tests for handing bitmaps to other processes through shared memory.
+'''
+
+import pickle
+import unittest as ut
+
+from concurrent.futures import ProcessPoolExecutor
+
+from bitstring import BitArray
+
+import lib.wah as wah
+import lib.bbc as bbc
+import lib.sharedmem as sharedmem
+
+
+##############
+# unit tests #
+##############
+
+class TestSharedMem(ut.TestCase):
+    def test_publish(self):
+        '''
+        Test reading bitmaps of each format back from shared memory, in this
+        process and in workers.
+        '''
+
+        bs = BitArray(bytes=b'\x00' * 50 + b'Hello, world!' + b'\xff' * 20) \
+            + BitArray(bin='101')
+        bbc_bs = bs[:-3]
+
+        with sharedmem.Publisher() as publisher, \
+                ProcessPoolExecutor(2) as executor:
+            descriptors = [
+                publisher.publish(wah.compress(bs, 32), 'WAH', 32),
+                publisher.publish(bbc.compress(bbc_bs), 'BBC'),
+                publisher.publish(bs),
+            ] + publisher.publish_many([wah.compress(bs, 5),
+                                        wah.compress(~bs, 5)], 'WAH', 5)
+            expected = [bs, bbc_bs, bs, bs, ~bs]
+
+            self.assertEqual(len(publisher), 4)
+            self.assertLess(len(pickle.dumps(descriptors[2])), 100)
+
+            for descriptor, bits in zip(descriptors, expected):
+                self.assertEqual(sharedmem.decompress(descriptor), bits)
+                self.assertEqual(sharedmem.count(descriptor), bits.count(1))
+
+                data, length = sharedmem.decompress_bytes(descriptor)
+                self.assertEqual(length, len(bits))
+                self.assertEqual(data, (bits + [0] * (-length % 8)).bytes)
+
+            self.assertEqual(sharedmem.load(descriptors[0]),
+                             wah.compress(bs, 32))
+            self.assertEqual(list(sharedmem.iter_words(descriptors[3])),
+                             list(wah.iter_words(*wah.compress(bs, 5), 5)))
+
+            self.assertEqual(list(executor.map(sharedmem.count, descriptors)),
+                             [bits.count(1) for bits in expected])
+            self.assertEqual(
+                list(executor.map(sharedmem.decompress, descriptors)),
+                expected)
+
+    def test_references(self):
+        '''
+        Test that segments are unlinked once their last reference is
+        released.
+        '''
+
+        with sharedmem.Publisher() as publisher:
+            a, b = publisher.publish_many([BitArray(bin='1'),
+                                           BitArray(bin='01')])
+            publisher.acquire(a)
+            self.assertEqual(publisher.references(b), 2)
+
+            publisher.release(b)
+            self.assertEqual(sharedmem.count(a), 1)
+
+            publisher.release(a)
+            self.assertEqual(publisher.references(a), 0)
+            self.assertEqual(len(publisher), 0)
+
+            with self.assertRaises(FileNotFoundError):
+                sharedmem.count(a)
+
+            with self.assertRaises(KeyError):
+                publisher.release(a)
+
+            c = publisher.publish(BitArray(bin='0'))
+
+        # closing the publisher unlinks every segment
+        self.assertEqual(publisher.references(c), 0)
+
+        with self.assertRaises(FileNotFoundError):
+            sharedmem.count(c)
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,111 @@
+'''
+Unit tests for the on-disk bitmap store.
+'''
+
+import os
+import tempfile
+import unittest as ut
+
+from bitstring import BitArray
+
+import lib.wah as wah
+import lib.bbc as bbc
+
+from lib.store import Store, StoreWriter
+
+
+##############
+# unit tests #
+##############
+
+class TestStore(ut.TestCase):
+    def test_roundtrip(self):
+        '''
+        Test reading back bitmaps of both codecs from a store.
+        '''
+
+        bitmaps = {
+            'sparse': BitArray(1000) + BitArray(bin='1') + BitArray(23),
+            'dense': BitArray(bytes=b'Hello, world!'),
+            'ones': ~BitArray(64),
+        }
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bitmaps.store')
+            expected = {}
+
+            with StoreWriter(path) as writer:
+                for name, bs in bitmaps.items():
+                    for ws in 5, 32:
+                        compressed, final_length = wah.compress(bs, ws)
+                        writer.add(f'{name}/wah{ws}', compressed, 'WAH', ws,
+                                   final_length)
+                        expected[f'{name}/wah{ws}'] = \
+                            ('WAH', compressed, ws, final_length)
+
+                    writer.add(f'{name}/bbc', bbc.compress(bs), 'BBC')
+                    expected[f'{name}/bbc'] = ('BBC', bbc.compress(bs), 0, 0)
+
+                with self.assertRaises(ValueError):
+                    writer.add('ones/bbc', bbc.compress(bs), 'BBC')
+
+            with Store(path) as store:
+                self.assertEqual(set(store), set(expected))
+
+                for key, value in expected.items():
+                    self.assertEqual(store.load(key), value)
+
+                    bs = bitmaps[key.split('/')[0]]
+                    self.assertEqual(store.count(key), bs.count(1))
+
+                    with store.view(key) as view:
+                        self.assertEqual(len(view),
+                                         -(-store.entries[key].length // 8))
+
+    def test_invalid(self):
+        '''
+        Test that files that are not stores are rejected, and that an
+        aborted writer leaves nothing behind.
+        '''
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bitmaps.store')
+
+            with open(path, 'wb') as f:
+                f.write(b'WBC' + bytes(20))
+
+            with self.assertRaises(ValueError):
+                Store(path)
+
+            with self.assertRaises(ValueError):
+                with StoreWriter(path) as writer:
+                    writer.add('a', BitArray(bin='0101'), 'LZW')
+
+            with self.assertRaises(KeyError):
+                with StoreWriter(path) as writer:
+                    raise KeyError('aborted')
+
+            self.assertEqual(os.listdir(tmp), ['bitmaps.store'])
+
+            # fields that do not fit in the directory are rejected by add()
+            with StoreWriter(path) as writer:
+                bs = BitArray(bin='0101')
+
+                for args in ('a' * 2**16, bs, 'BBC'), ('a', bs, 'WAH', 256), \
+                        ('a', bs, 'WAH', 8, -1):
+                    with self.assertRaises(ValueError):
+                        writer.add(*args)
+
+            # a failed close() removes the temporary file
+            os.unlink(path)
+            os.mkdir(path)
+
+            with self.assertRaises(OSError):
+                with StoreWriter(path) as writer:
+                    writer.add('a', bs, 'BBC')
+
+            self.assertEqual(os.listdir(tmp), ['bitmaps.store'])
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,111 @@
+'''
+Unit tests for the structural checks of compressed data.
+'''
+
+import unittest as ut
+
+from bitstring import BitArray
+
+import lib.fileformat as fileformat
+import lib.wah as wah
+import lib.bbc as bbc
+
+from lib.validate import check_wah, check_bbc, check_file
+
+
+##############
+# unit tests #
+##############
+
+class TestValidate(ut.TestCase):
+    def test_wah(self):
+        '''
+        Test the composition reported for valid WAH data, and the offsets of
+        problems in corrupt data.
+        '''
+
+        # the set run needs two fills, since each holds at most 63 sections
+        bs = BitArray(bin='0'*7*3 + '1'*7*100 + '0110100' + '1011')
+        compressed, final_length = wah.compress(bs, 8)
+        report = check_wah(compressed, final_length, 8)
+
+        self.assertTrue(report.valid)
+        self.assertEqual(report, (None, None, len(bs), 5, 3, 2, 7*103, 11))
+
+        data = memoryview((compressed + BitArray(3)).tobytes())
+        self.assertEqual(check_wah(data, final_length, 8, len(compressed)),
+                         report)
+
+        def check(s, final_length):
+            report = check_wah(BitArray(bin=s), final_length, 8)
+            return report.error is not None, report.offset, report.length
+
+        fill = '10000011'
+        literal = '00110100'
+
+        self.assertEqual(check(fill + literal, 8), (False, None, 28))
+        self.assertEqual(check(fill + '10000000' + literal, 8),
+                         (True, 8, 21))
+        self.assertEqual(check(fill + literal + '0101', 8), (True, 16, 28))
+        self.assertEqual(check(literal + fill, 5), (True, 8, 7))
+        self.assertEqual(check(fill + '01101001', 5), (True, 8, 21))
+        self.assertEqual(check(fill + literal, 9), (True, 8, 0))
+        self.assertEqual(check('', 8), (True, 0, 0))
+
+    def test_bbc(self):
+        '''
+        Test the composition reported for valid BBC data, and the offsets of
+        problems in corrupt data.
+        '''
+
+        def check(hex_data):
+            report = check_bbc(BitArray(hex=hex_data))
+            return report.error is not None, report.offset, report.length
+
+        # a gap of 3 bytes then an offset byte
+        self.assertEqual(check_bbc(BitArray(hex='73')),
+                         (None, None, 32, 1, 1, 1, 24, 8))
+        # a gap of 10 bytes in a tail byte, then 2 literals
+        self.assertEqual(check_bbc(BitArray(hex='e20ab0ff')),
+                         (None, None, 96, 1, 1, 2, 80, 16))
+
+        self.assertEqual(check('73e1800a00'), (True, 1, 32))
+        self.assertEqual(check('73e2'), (True, 1, 32))
+        self.assertEqual(check('e180'), (True, 0, 0))
+        self.assertEqual(check('e20ab0'), (True, 0, 0))
+        self.assertEqual(check('e205ffff'), (True, 0, 0))
+        self.assertEqual(check('7318'), (True, 1, 32))
+        self.assertEqual(check('7300'), (True, 1, 32))
+        self.assertEqual(check_bbc(BitArray(bin='011100110')).offset, 1)
+        self.assertFalse(check_bbc(b'').valid)
+
+        bs = BitArray(bytes=b'\x00' * 300 + b'Hello, world!' + b'\x02' * 9)
+        report = check_bbc(memoryview(bbc.compress(bs).bytes))
+        self.assertTrue(report.valid)
+        self.assertEqual(report.length, len(bs))
+
+    def test_file(self):
+        '''
+        Test checking data in the format of ``lib.fileformat``.
+        '''
+
+        bs = BitArray(bytes=b'\x00' * 30 + b'\xff' * 30 + b'Hello')
+        compressed, final_length = wah.compress(bs, 32)
+
+        data = fileformat.dumps(compressed, 'WAH', 32, final_length)
+        self.assertEqual(check_file(data), check_wah(compressed,
+                                                     final_length, 32))
+
+        data = fileformat.dumps(bbc.compress(bs), 'BBC')
+        self.assertEqual(check_file(data).length, len(bs))
+
+        # the third atom holds the last 5 literals
+        report = check_file(data[:-1])
+        self.assertEqual((report.valid, report.offset), (False, 33))
+
+        with self.assertRaises(ValueError):
+            check_file(b'WBC')
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -2,11 +2,19 @@
 Unit tests for WAH implementation.
 '''
 
+import functools
 import itertools as it
 import unittest as ut
 
+from array import array
+
 from bitstring import BitArray
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 import lib.wah as wah
 
 
@@ -236,6 +244,289 @@ class TestWAH(ut.TestCase):
         self.assertEqual(compress(patent_example, patent_word_size),
                          patent_modified_result)
 
+    def test_bitmap_append(self):
+        '''
+        Test that ``wah.Bitmap`` matches ``wah.compress()`` when built with
+        each of its append methods.
+        '''
+
+        inputs = ['0', '1', '0110', '0'*40, '1'*41 + '0', '10'*30,
+                  '0'*7*64 + '1', '1'*7*63 + '0'*7*65 + '101',
+                  '0'*29 + '1' + '1'*200 + '0'*3]
+
+        for ws in range(2, 17):
+            for s in inputs:
+                expected = wah.compress(str_to_bs(s), ws)
+
+                bitmap = wah.Bitmap(ws)
+                for bit in s:
+                    bitmap.append(bit == '1')
+                self.assertEqual(bitmap.compressed(), expected)
+
+                bitmap = wah.Bitmap(ws)
+                for i in range(0, len(s), 5):
+                    bitmap.extend(str_to_bs(s[i:i + 5]))
+                self.assertEqual(bitmap.compressed(), expected)
+
+                bitmap = wah.Bitmap(ws)
+                for run in it.groupby(s):
+                    bitmap.append_run(run[0] == '1', len(list(run[1])))
+                self.assertEqual(bitmap.compressed(), expected)
+
+        with self.assertRaises(ValueError):
+            wah.Bitmap(8).compressed()
+
+    def test_bitmap_update(self):
+        '''
+        Test ``wah.Bitmap.set_bit()`` and ``wah.Bitmap.clear_bit()`` against
+        compressing the updated bits from scratch.
+        '''
+
+        inputs = ['0'*7*130 + '1'*20, '1'*7*64 + '0101', '01'*100]
+
+        for ws in 2, 8, 9:
+            for s in inputs:
+                bits = list(s)
+                bitmap = wah.Bitmap(ws)
+                bitmap.extend(str_to_bs(s))
+
+                updates = it.chain(range(0, len(s), 29),
+                                   range(len(s) - 9, len(s)))
+
+                for i in updates:
+                    bit = bits[i] == '0'
+                    bits[i] = '1' if bit else '0'
+
+                    if bit:
+                        bitmap.set_bit(i)
+                    else:
+                        bitmap.clear_bit(i)
+
+                    expected = wah.compress(str_to_bs(''.join(bits)), ws)
+                    self.assertEqual(bitmap.compressed(), expected)
+                    self.assertEqual(bitmap[i], bit)
+
+        with self.assertRaises(IndexError):
+            wah.Bitmap(8).set_bit(0)
+
+    def test_slice(self):
+        '''
+        Test ``wah.slice()`` against compressing the sliced bits.
+        '''
+
+        s = '0'*7*70 + '1101' + '1'*7*3 + '01'*20 + '0'*9
+
+        for ws in 2, 8, 9, 32:
+            compressed, final_length = wah.compress(str_to_bs(s), ws)
+
+            for start in 0, 1, 6, 7, 300, 489, 500, len(s) - 1:
+                for stop in start + 1, start + 7, start + 40, len(s):
+                    if stop > len(s):
+                        continue
+
+                    expected = wah.compress(str_to_bs(s[start:stop]), ws)
+                    result = wah.slice(compressed, final_length, ws,
+                                       start, stop)
+                    self.assertEqual(result, expected)
+
+            with self.assertRaises(ValueError):
+                wah.slice(compressed, final_length, ws, 5, 5)
+
+            with self.assertRaises(ValueError):
+                wah.slice(compressed, final_length, ws, 0, len(s) + 1)
+
+    def test_concat(self):
+        '''
+        Test ``wah.concat()`` against compressing the concatenated bits.
+        '''
+
+        parts = ['0'*7*40, '0'*7*30 + '1', '1'*7*63, '1'*7*5 + '0110',
+                 '01'*14, '0'*3, '1'*7*2]
+
+        for ws in 2, 3, 8, 9:
+            for group in it.chain(it.permutations(parts, 2), [parts]):
+                compressed = [wah.compress(str_to_bs(s), ws) for s in group]
+                expected = wah.compress(str_to_bs(''.join(group)), ws)
+                self.assertEqual(wah.concat(compressed, ws), expected)
+
+        with self.assertRaises(ValueError):
+            wah.concat([], 8)
+
+    def test_merge_many(self):
+        '''
+        Test ``wah.union_many()`` and ``wah.intersect_many()`` against
+        combining the decompressed bits.
+        '''
+
+        length = 7*80 + 3
+        bitmaps = ['0'*length, '1'*length, '01'*(length // 2) + '1',
+                   '0'*7*40 + '1'*(length - 7*40),
+                   '1'*7*10 + '0'*(length - 7*20) + '1'*7*10,
+                   '001'*(length // 3) + '01']
+
+        for ws in 2, 9:
+            for count in 1, 2, len(bitmaps):
+                for group in it.combinations(bitmaps, count):
+                    bits = [str_to_bs(s) for s in group]
+                    compressed = [wah.compress(bs, ws) for bs in bits]
+
+                    union = wah.compress(functools.reduce(
+                        lambda a, b: a | b, bits), ws)
+                    intersection = wah.compress(functools.reduce(
+                        lambda a, b: a & b, bits), ws)
+
+                    self.assertEqual(wah.union_many(compressed, ws), union)
+                    self.assertEqual(wah.intersect_many(compressed, ws),
+                                     intersection)
+
+        with self.assertRaises(ValueError):
+            wah.union_many([], 8)
+
+        with self.assertRaises(ValueError):
+            wah.intersect_many([wah.compress(str_to_bs('0'*20), 8),
+                                wah.compress(str_to_bs('0'*21), 8)], 8)
+
+    def test_count(self):
+        '''
+        Test ``wah.count()`` against counting the decompressed bits.
+        '''
+
+        for s in '0', '1', '0110', '1'*7*70 + '0'*7*3 + '1011', '01'*50:
+            for ws in 2, 8, 9, 32:
+                bs = str_to_bs(s)
+                compressed, final_length = wah.compress(bs, ws)
+                self.assertEqual(wah.count(compressed, final_length, ws),
+                                 bs.count(1))
+
+    def test_iter_words_bytes(self):
+        '''
+        Test that ``wah.iter_words()`` reads bytes-like data padded to whole
+        bytes in the same way as ``BitArray``s.
+        '''
+
+        for s in '0', '0110', '1'*7*70 + '0'*7*3 + '1011', '01'*50:
+            for ws in 2, 3, 8, 9, 32:
+                compressed, final_length = wah.compress(str_to_bs(s), ws)
+                padding = BitArray(-len(compressed) % 8)
+                data = memoryview((compressed + padding).bytes)
+
+                self.assertEqual(
+                    list(wah.iter_words(data, final_length, ws,
+                                        len(compressed))),
+                    list(wah.iter_words(compressed, final_length, ws)))
+
+    def test_native(self):
+        '''
+        Test that the fast path gives the same results as the generic
+        encoder and decoder, for every word size.
+        '''
+
+        strings = ['0', '1', '0110', '1'*31, '0'*63 + '1', '1'*62*300,
+                   '0'*31*8*5 + '1'*31*3 + '01'*100, '1'*500 + '0'*17,
+                   '0110100'*200 + '1'*1000]
+
+        for s, ws in it.product(strings, (3, 8, 13, 32, 64)):
+            bs = str_to_bs(s)
+            compressed = wah.compress(bs, ws, native=False)
+
+            self.assertEqual(wah.compress(bs, ws), compressed)
+            self.assertEqual(wah.decompress(*compressed, ws), bs)
+            self.assertEqual(wah.decompress(*compressed, ws, native=False),
+                             bs)
+
+            if ws in wah.native_typecodes:
+                self.assertEqual(wah.compress_native(bs, ws), compressed)
+                self.assertEqual(wah.decompress_native(*compressed, ws), bs)
+
+        with self.assertRaises(ValueError):
+            wah.compress_native(str_to_bs('01'), 31)
+
+    def test_invert(self):
+        '''
+        Test that ``wah.invert()`` gives the compressed complement.
+        '''
+
+        strings = ['0', '1', '0110', '1'*7, '0'*7*5 + '1', '1'*7*3 + '0'*9,
+                   '0110100'*20 + '1'*100]
+
+        for s, ws in it.product(strings, (5, 8, 32)):
+            bs = str_to_bs(s)
+            self.assertEqual(wah.invert(*wah.compress(bs, ws), ws),
+                             wah.compress(~bs, ws))
+
+    def test_from_positions(self):
+        '''
+        Test that ``wah.from_positions()`` gives the same result as
+        compressing the uncompressed bitmap.
+        '''
+
+        cases = [([], 1), ([0], 1), ([3, 4, 5], 7), ([0, 69], 70),
+                 ([2, 9, 500], 1000), (list(range(14, 100)) + [150], 160),
+                 ([6] * 2 + [7, 13], 14)]
+
+        for (positions, length), ws in it.product(cases, (2, 5, 8, 32)):
+            bs = BitArray(length)
+            bs.set(1, positions)
+            self.assertEqual(
+                wah.from_positions(array('Q', positions), length, ws),
+                wah.compress(bs, ws))
+
+        for positions, length in ([2, 1], 3), ([3], 3), ([], 0):
+            with self.assertRaises(ValueError):
+                wah.from_positions(positions, length, 8)
+
+    def test_many(self):
+        '''
+        Test that ``wah.compress_many()`` packs the same results as
+        ``wah.compress()``, and that ``wah.decompress_many()`` reverses it.
+        '''
+
+        strings = ['0', '1'*31, '1'*62*3 + '0110', '0'*31*8*5 + '1'*31*3,
+                   '0110100'*20 + '1'*100, '1'*31, '0'*31]
+
+        for ws in 5, 8, 32, 64:
+            bitmaps = [str_to_bs(s) for s in strings]
+            compressed, offsets, final_lengths = wah.compress_many(bitmaps,
+                                                                   ws)
+            self.assertEqual(len(offsets), len(strings) + 1)
+
+            for i, bs in enumerate(bitmaps):
+                self.assertEqual((compressed[offsets[i]:offsets[i + 1]],
+                                  final_lengths[i]), wah.compress(bs, ws))
+
+            bits, bit_offsets = wah.decompress_many(compressed, offsets,
+                                                    final_lengths, ws)
+            self.assertEqual(bits, str_to_bs(''.join(strings)))
+            self.assertEqual(list(bit_offsets),
+                             list(it.accumulate(map(len, strings),
+                                                initial=0)))
+
+        with self.assertRaises(ValueError):
+            wah.compress_many([], 32)
+
+        with self.assertRaises(ValueError):
+            wah.compress_many([str_to_bs('1'), BitArray()], 32)
+
+        with self.assertRaises(ValueError):
+            wah.decompress_many(compressed, [0, 32], [32], 32)
+
+    @ut.skipIf(np is None, 'NumPy is not installed')
+    def test_many_numpy(self):
+        '''
+        Test ``wah.compress_many()`` on the rows of a NumPy bit matrix.
+        '''
+
+        rows = np.random.default_rng(1).random((20, 300)) < 0.05
+        rows[:, :100] = False
+
+        for ws in 5, 8, 32:
+            compressed, offsets, final_lengths = wah.compress_many(rows, ws)
+
+            for i, row in enumerate(rows):
+                bs = BitArray(bin=''.join('1' if bit else '0' for bit in row))
+                self.assertEqual((compressed[offsets[i]:offsets[i + 1]],
+                                  final_lengths[i]), wah.compress(bs, ws))
+
 
 if __name__ == '__main__':
     ut.main()